@@ -0,0 +1,230 @@
+"""
+Daily/weekly/monthly active users from HyperLogLog sketches.
+
+Exact distinct counts over login_events or page_visits get slower as the
+ranges grow. Instead, every login and tracked page view adds its user_id to
+a HyperLogLog sketch of that UTC day. With precision p a sketch is 2**p
+one-byte registers (16 KiB at the default p=14, standard error
+1.04 / sqrt(2**p), about 0.8%) whatever the number of users, and the union
+of several days is the register-wise max, so WAU/MAU for any window comes
+from merging 7 or 30 day sketches rather than rescanning events.
+
+active_users_daily holds one document per day:
+
+    {"_id": "2026-10-17", "p": 14, "registers": Binary(16384 bytes), "version": 12}
+
+ActiveUserCounter keeps the sketches of recent days in memory and flushes
+them every flush_seconds with a read-merge-write guarded by `version`, so
+several workers can update the same day. Sketches of days before yesterday
+no longer change and are cached for reports.
+"""
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+from bson import Binary
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_USERS_COLLECTION = "active_users_daily"
+DEFAULT_PRECISION = 14
+
+
+class HyperLogLog:
+    """HyperLogLog over 64-bit blake2b hashes, registers stored as a uint8 array"""
+
+    def __init__(self, p: int = DEFAULT_PRECISION, registers=None):
+        if not 4 <= p <= 18:
+            raise ValueError("precision must be between 4 and 18")
+        self.p = p
+        self.m = 1 << p
+        self.registers = np.zeros(self.m, dtype=np.uint8) if registers is None else registers
+
+    @classmethod
+    def from_bytes(cls, p: int, data: bytes) -> "HyperLogLog":
+        return cls(p, np.frombuffer(data, dtype=np.uint8).copy())
+
+    def to_bytes(self) -> bytes:
+        return self.registers.tobytes()
+
+    def add(self, item: str) -> bool:
+        """Add one item; returns True if a register changed"""
+        x = int.from_bytes(hashlib.blake2b(item.encode(), digest_size=8).digest(), "big")
+        index = x >> (64 - self.p)
+        rest = x & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """In-place union"""
+        if other.p != self.p:
+            raise ValueError("cannot merge sketches of different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    @classmethod
+    def union(cls, sketches, p: int = DEFAULT_PRECISION) -> "HyperLogLog":
+        sketches = list(sketches)
+        if not sketches:
+            return cls(p)
+        return cls(sketches[0].p, np.maximum.reduce([s.registers for s in sketches]))
+
+    def count(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / float(np.sum(np.ldexp(1.0, -self.registers.astype(np.int32))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Small range: linear counting is more accurate
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+def _day(at: datetime) -> str:
+    return at.astimezone(timezone.utc).strftime("%Y-%m-%d")
+
+
+class ActiveUserCounter:
+    """Per-day HyperLogLog sketches of active user ids, flushed to Mongo in the background"""
+
+    def __init__(self, get_collection, p: int = DEFAULT_PRECISION, flush_seconds: float = 10, cache_days: int = 400):
+        self.get_collection = get_collection
+        self.p = p
+        self.flush_seconds = flush_seconds
+        self.cache_days = cache_days
+        # day -> sketch of the ids added since the last flush
+        self._pending = {}
+        # day -> stored sketch, only for days that no longer change
+        self._cache = OrderedDict()
+        self._task = None
+        self.added = 0
+        self.register_updates = 0
+        self.flushes = 0
+        self.write_conflicts = 0
+        self.flush_errors = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                self.flush_errors += 1
+                logger.error(f"Failed to flush active user sketches: {e}")
+
+    def add(self, user_id: str, at: datetime = None):
+        """Count user_id as active on the day of `at` (default now); no I/O"""
+        if not user_id:
+            return
+        day = _day(at or datetime.now(timezone.utc))
+        sketch = self._pending.get(day)
+        if sketch is None:
+            sketch = self._pending[day] = HyperLogLog(self.p)
+        self.added += 1
+        if sketch.add(user_id):
+            self.register_updates += 1
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        days = list(pending)
+        for i, day in enumerate(days):
+            try:
+                await self._merge_into(day, pending[day])
+            except Exception:
+                # Keep the registers not written yet for the next flush
+                for unwritten in days[i:]:
+                    sketch = pending[unwritten]
+                    self._pending[unwritten] = self._pending[unwritten].merge(sketch) if unwritten in self._pending else sketch
+                raise
+        if pending:
+            self.flushes += 1
+
+    async def _merge_into(self, day: str, sketch: HyperLogLog):
+        collection = self.get_collection()
+        while True:
+            doc = await collection.find_one({"_id": day})
+            version = doc.get("version", 0) if doc else 0
+            if doc:
+                sketch = HyperLogLog.from_bytes(doc["p"], doc["registers"]).merge(sketch)
+            new = {"p": sketch.p, "registers": Binary(sketch.to_bytes()), "version": version + 1}
+            try:
+                if doc is None:
+                    await collection.insert_one({"_id": day, **new})
+                    return
+                result = await collection.replace_one({"_id": day, "version": version}, new)
+                if result.matched_count:
+                    return
+            except DuplicateKeyError:
+                pass
+            # Another worker wrote this day in between: merge again on top of its version
+            self.write_conflicts += 1
+
+    async def load(self, days: list) -> dict:
+        """{day: stored sketch} for the days that have one"""
+        sketches = {day: self._cache[day] for day in days if day in self._cache}
+        missing = [day for day in days if day not in sketches]
+        if missing:
+            settled = (datetime.now(timezone.utc).date() - timedelta(days=1)).isoformat()
+            async for doc in self.get_collection().find({"_id": {"$in": missing}}):
+                sketch = HyperLogLog.from_bytes(doc["p"], doc["registers"])
+                sketches[doc["_id"]] = sketch
+                if doc["_id"] < settled:
+                    self._cache[doc["_id"]] = sketch
+                    while len(self._cache) > self.cache_days:
+                        self._cache.popitem(last=False)
+        return sketches
+
+    async def report(self, start_day: str, end_day: str) -> dict:
+        """DAU, WAU (7 days) and MAU (30 days) for each day of [start_day, end_day], and the range's unique users"""
+        start, end = date.fromisoformat(start_day), date.fromisoformat(end_day)
+        # 29 days before start_day for the first MAU window
+        window = [(start + timedelta(days=n)).isoformat() for n in range(-29, (end - start).days + 1)]
+        sketches = await self.load(window)
+
+        def union(days):
+            return HyperLogLog.union([sketches[d] for d in days if d in sketches], self.p).count()
+
+        series = []
+        for i in range(29, len(window)):
+            dau, wau, mau = union(window[i:i + 1]), union(window[i - 6:i + 1]), union(window[i - 29:i + 1])
+            series.append({"day": window[i], "dau": dau, "wau": wau, "mau": mau,
+                           "stickiness": round(dau / mau, 4) if mau else 0.0})
+        return {
+            "start": start_day,
+            "end": end_day,
+            "unique_users": union(window[29:]),
+            "precision": self.p,
+            "standard_error": round(1.04 / (1 << self.p) ** 0.5, 4),
+            "days": series,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "precision": self.p,
+            "bytes_per_day": 1 << self.p,
+            "pending_days": len(self._pending),
+            "cached_days": len(self._cache),
+            "added": self.added,
+            "register_updates": self.register_updates,
+            "flushes": self.flushes,
+            "write_conflicts": self.write_conflicts,
+            "flush_errors": self.flush_errors,
+        }
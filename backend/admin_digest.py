@@ -0,0 +1,128 @@
+"""
+Batched admin notification digests.
+
+Registrations, logins, demo views and tracked events each used to trigger
+their own admin email. AdminDigest buffers them in memory and sends one
+summary per window (or as soon as max_events are pending), grouped by event
+type with per-IP and per-location rollups. Urgent event types bypass the
+buffer, and whatever is pending is flushed on shutdown.
+"""
+import asyncio
+import html
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Max individual events listed at the bottom of a digest
+DETAIL_LIMIT = 50
+
+
+class AdminDigest:
+    """Buffers admin notifications and flushes them as one summary email"""
+
+    def __init__(self, send, window_seconds: float = 3600, max_events: int = 200, urgent_types=()):
+        # async send(subject, html_content) - e.g. send_admin_notification
+        self.send = send
+        self.window_seconds = window_seconds
+        self.max_events = max_events
+        self.urgent_types = set(urgent_types)
+        self._pending = []
+        self._task = None
+        self.digests_sent = 0
+        self.immediate_sent = 0
+        self.events_buffered = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_seconds > 0
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.window_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush admin digest: {e}")
+
+    async def add(self, event_type: str, subject: str, html_content: str, ip: str = None, location: str = None):
+        if not self.enabled or event_type in self.urgent_types:
+            self.immediate_sent += 1
+            await self.send(subject, html_content)
+            return
+        self._pending.append({
+            "type": event_type,
+            "subject": subject,
+            "ip": ip,
+            "location": location,
+            "time": datetime.now(timezone.utc).isoformat(),
+        })
+        self.events_buffered += 1
+        if len(self._pending) >= self.max_events:
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        events, self._pending = self._pending, []
+        by_type = Counter(e["type"] for e in events)
+        by_ip = defaultdict(Counter)
+        by_location = Counter()
+        for e in events:
+            if e["ip"]:
+                by_ip[e["ip"]][e["type"]] += 1
+            if e["location"]:
+                by_location[e["location"]] += 1
+
+        summary = ", ".join(f"{count} {event_type}" for event_type, count in by_type.most_common())
+        subject = f"Activity digest: {len(events)} events ({summary})"
+        await self.send(subject, self._render(events, by_type, by_ip, by_location))
+        self.digests_sent += 1
+        logger.info(f"Admin digest sent with {len(events)} events")
+
+    @staticmethod
+    def _render(events, by_type, by_ip, by_location) -> str:
+        e = html.escape
+        rows_type = "".join(f"<tr><td>{e(t)}</td><td>{c}</td></tr>" for t, c in by_type.most_common())
+        rows_ip = "".join(
+            f"<tr><td>{e(ip)}</td><td>{sum(c.values())}</td><td>{e(', '.join(f'{t}: {n}' for t, n in c.most_common()))}</td></tr>"
+            for ip, c in sorted(by_ip.items(), key=lambda item: -sum(item[1].values()))
+        )
+        rows_location = "".join(f"<tr><td>{e(loc)}</td><td>{c}</td></tr>" for loc, c in by_location.most_common())
+        details = "".join(
+            f"<li>{e(ev['time'])} - {e(ev['subject'])}</li>" for ev in events[-DETAIL_LIMIT:]
+        )
+        return f"""
+            <h1>Activity Digest</h1>
+            <p><strong>Period:</strong> {e(events[0]['time'])} to {e(events[-1]['time'])}</p>
+            <h2>By event type</h2>
+            <table><tr><th>Type</th><th>Count</th></tr>{rows_type}</table>
+            <h2>By IP address</h2>
+            <table><tr><th>IP</th><th>Events</th><th>Breakdown</th></tr>{rows_ip}</table>
+            <h2>By location</h2>
+            <table><tr><th>Location</th><th>Events</th></tr>{rows_location}</table>
+            <h2>Latest events</h2>
+            <ul>{details}</ul>
+        """
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "window_seconds": self.window_seconds,
+            "pending": len(self._pending),
+            "events_buffered": self.events_buffered,
+            "digests_sent": self.digests_sent,
+            "immediate_sent": self.immediate_sent,
+        }
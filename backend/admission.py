@@ -0,0 +1,136 @@
+"""
+Admission control for CPU-heavy password endpoints.
+
+AdmissionController bounds how many bcrypt jobs may run at once and how many
+may wait for a slot; anything beyond that is rejected immediately so callers
+can answer 503 with Retry-After instead of piling up work. FailureWindow
+keeps per-key sliding-window failure counts in memory (per IP, per email) so
+abusive clients are turned away before any bcrypt work is done.
+"""
+import asyncio
+import math
+import time
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+# Upper bounds (ms) of the wait-time histogram buckets; the last bucket is +inf
+WAIT_BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Concurrency semaphore with a short bounded wait queue and fast rejection"""
+
+    def __init__(self, max_concurrency: int, max_queue: int, max_wait: float = 2.0, retry_after: int = 2):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait
+        self.retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.wait_histogram = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    @asynccontextmanager
+    async def slot(self):
+        started = time.perf_counter()
+        if not self._semaphore.locked():
+            # Free slot: acquire() returns without suspending
+            await self._semaphore.acquire()
+        elif self.waiting >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise AdmissionRejected("queue full", self.retry_after)
+        else:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.max_wait)
+            except asyncio.TimeoutError:
+                self.rejected_timeout += 1
+                raise AdmissionRejected("wait timeout", self.retry_after)
+            finally:
+                self.waiting -= 1
+
+        waited_ms = (time.perf_counter() - started) * 1000
+        self.wait_histogram[bisect_left(WAIT_BUCKETS_MS, waited_ms)] += 1
+        self.admitted += 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        labels = [f"le_{b}ms" for b in WAIT_BUCKETS_MS] + ["gt_%dms" % WAIT_BUCKETS_MS[-1]]
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "wait_ms_histogram": dict(zip(labels, self.wait_histogram)),
+        }
+
+
+class FailureWindow:
+    """Sliding-window failure counter per key, bounded to max_keys most recent keys"""
+
+    def __init__(self, limit: int, window: float, max_keys: int = 10000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._events = OrderedDict()
+        self.blocked = 0
+
+    def _prune(self, key, now: float):
+        events = self._events.get(key)
+        if events is None:
+            return None
+        while events and events[0] <= now - self.window:
+            events.popleft()
+        if not events:
+            del self._events[key]
+            return None
+        return events
+
+    def retry_after(self, key) -> int:
+        """Seconds until key may try again, 0 if it is under the limit"""
+        now = time.monotonic()
+        events = self._prune(key, now)
+        if events is None or len(events) < self.limit:
+            return 0
+        self.blocked += 1
+        return max(1, math.ceil(events[-self.limit] + self.window - now))
+
+    def record(self, key):
+        now = time.monotonic()
+        events = self._prune(key, now)
+        if events is None:
+            events = self._events[key] = deque()
+        events.append(now)
+        self._events.move_to_end(key)
+        while len(self._events) > self.max_keys:
+            self._events.popitem(last=False)
+
+    def reset(self, key):
+        self._events.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "window_seconds": self.window,
+            "tracked_keys": len(self._events),
+            "blocked": self.blocked,
+        }
@@ -0,0 +1,216 @@
+"""
+Bulk email campaigns (announcements, re-verification reminders).
+
+CampaignJob streams recipients from db.access in _id order with a minimal
+projection and sends them in batches using Brevo's multi-version send (one
+API call carries up to `batch_size` messageVersions). It throttles to a
+target number of recipients per second and checkpoints progress in
+db.campaigns after every batch, so an interrupted campaign resumes where it
+stopped instead of emailing anyone twice.
+
+The checkpoint only moves past a batch once Brevo accepted or rejected it.
+A transient failure (open circuit, network error, 429/5xx) retries the same
+batch with backoff; after max_transient_retries in a row the job pauses on
+that batch and resumes from it. Recipients of a batch Brevo rejected get one
+document each in campaign_failures, keyed by campaign, so the campaign
+document stays small however many fail.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+
+from pymongo import ReplaceOne
+
+logger = logging.getLogger(__name__)
+
+FAILURES_COLLECTION = "campaign_failures"
+
+AUDIENCES = {
+    # Old users have no is_verified field and count as verified (same rule as login)
+    "verified": {"is_verified": {"$ne": False}},
+    "unverified": {"is_verified": False},
+}
+
+
+class CampaignJob:
+    """Streams one campaign's recipients and sends them in throttled multi-version batches"""
+
+    def __init__(self, db, dispatcher, campaign: dict, version_builder=None,
+                 batch_size: int = 100, target_per_sec: float = 20,
+                 retry_backoff: float = 5, retry_backoff_max: float = 60, max_transient_retries: int = 8):
+        self.db = db
+        self.dispatcher = dispatcher
+        self.campaign = campaign
+        # version_builder(recipient) -> extra messageVersion fields (e.g. a personal htmlContent)
+        self.version_builder = version_builder
+        self.batch_size = batch_size
+        self.target_per_sec = target_per_sec
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.max_transient_retries = max_transient_retries
+        self._task = None
+        self.status = campaign.get("status", "pending")
+        self.sent = campaign.get("sent", 0)
+        self.failed = campaign.get("failed", 0)
+        self.total = campaign.get("total")
+        self.started_at = None
+        self.processed_this_run = 0
+        self.transient_failures = 0
+        self.last_error = campaign.get("last_error")
+
+    @staticmethod
+    async def create(db, subject: str, html_content: str, audience: str, sender: dict, created_by: str) -> dict:
+        campaign = {
+            "_id": str(uuid.uuid4()),
+            "subject": subject,
+            "html_content": html_content,
+            "audience": audience,
+            "sender": sender,
+            "created_by": created_by,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "status": "pending",
+            "last_id": None,
+            "sent": 0,
+            "failed": 0,
+            "total": await db.access.count_documents(AUDIENCES[audience]),
+        }
+        await db.campaigns.insert_one(campaign)
+        return campaign
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def cancel(self):
+        if self.running:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def _payload(self, recipients: list) -> dict:
+        versions = []
+        for recipient in recipients:
+            version = {"to": [{"email": recipient["email"]}]}
+            if self.version_builder:
+                version.update(self.version_builder(recipient))
+            versions.append(version)
+        return {
+            "sender": self.campaign["sender"],
+            "subject": self.campaign["subject"],
+            "htmlContent": self.campaign["html_content"],
+            "messageVersions": versions,
+        }
+
+    async def run(self):
+        campaign_id = self.campaign["_id"]
+        last_id = self.campaign.get("last_id")
+        query = dict(AUDIENCES[self.campaign["audience"]])
+        self.status = "running"
+        self.started_at = time.monotonic()
+        self.processed_this_run = 0
+        self.transient_failures = 0
+        await self._checkpoint(last_id)
+
+        try:
+            while True:
+                if last_id is not None:
+                    query["_id"] = {"$gt": last_id}
+                recipients = await self.db.access.find(
+                    query, {"_id": 1, "email": 1}
+                ).sort("_id", 1).limit(self.batch_size).to_list(length=self.batch_size)
+                if not recipients:
+                    break
+
+                ok, transient = await self.dispatcher.deliver(
+                    self._payload(recipients), f"campaign {campaign_id} batch of {len(recipients)}"
+                )
+                if not ok and transient:
+                    # Brevo unavailable: the same batch again later, the checkpoint stays put
+                    self.transient_failures += 1
+                    if self.transient_failures > self.max_transient_retries:
+                        self.status = "paused"
+                        self.last_error = f"Brevo unavailable after {self.max_transient_retries} retries"
+                        logger.error(f"Campaign {campaign_id} paused: {self.last_error}")
+                        await self._checkpoint(last_id)
+                        return
+                    delay = min(self.retry_backoff_max, self.retry_backoff * 2 ** (self.transient_failures - 1))
+                    await asyncio.sleep(max(delay, self.dispatcher.retry_after()))
+                    # Don't let the throttle make up for the time spent waiting
+                    self.started_at = time.monotonic()
+                    self.processed_this_run = 0
+                    continue
+                self.transient_failures = 0
+                self.last_error = None
+                if ok:
+                    self.sent += len(recipients)
+                else:
+                    self.failed += len(recipients)
+                    await self._record_failures(recipients)
+                last_id = recipients[-1]["_id"]
+                self.processed_this_run += len(recipients)
+                await self._checkpoint(last_id)
+
+                expected = self.processed_this_run / self.target_per_sec
+                elapsed = time.monotonic() - self.started_at
+                if expected > elapsed:
+                    await asyncio.sleep(expected - elapsed)
+        except asyncio.CancelledError:
+            self.status = "paused"
+            await self._checkpoint(last_id)
+            raise
+        except Exception as e:
+            self.status = "failed"
+            self.last_error = str(e)
+            logger.error(f"Campaign {campaign_id} stopped: {e}")
+            await self._checkpoint(last_id)
+            return
+
+        self.status = "done"
+        await self._checkpoint(last_id)
+        logger.info(f"Campaign {campaign_id} finished: {self.sent} sent, {self.failed} failed")
+
+    async def _record_failures(self, recipients: list):
+        # One document per recipient; the _id makes a retried batch overwrite its own entries
+        now = datetime.now(timezone.utc).isoformat()
+        await self.db[FAILURES_COLLECTION].bulk_write([
+            ReplaceOne(
+                {"_id": f"{self.campaign['_id']}:{r['_id']}"},
+                {"campaign_id": self.campaign["_id"], "recipient_id": r["_id"], "email": r["email"], "failed_at": now},
+                upsert=True
+            )
+            for r in recipients
+        ], ordered=False)
+
+    async def _checkpoint(self, last_id):
+        self.campaign["last_id"] = last_id
+        await self.db.campaigns.update_one(
+            {"_id": self.campaign["_id"]},
+            {"$set": {
+                "last_id": last_id,
+                "status": self.status,
+                "sent": self.sent,
+                "failed": self.failed,
+                "last_error": self.last_error,
+                "updated_at": datetime.now(timezone.utc).isoformat()
+            }}
+        )
+
+    def progress(self) -> dict:
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0
+        return {
+            "campaign_id": self.campaign["_id"],
+            "subject": self.campaign["subject"],
+            "audience": self.campaign["audience"],
+            "status": self.status,
+            "sent": self.sent,
+            "failed": self.failed,
+            "total": self.total,
+            "last_error": self.last_error,
+            "recipients_per_sec": round(self.processed_this_run / elapsed, 1) if elapsed else 0.0,
+        }
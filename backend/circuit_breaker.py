@@ -0,0 +1,150 @@
+"""
+Circuit breakers for outbound integrations (Brevo, ip-api).
+
+A CircuitBreaker watches a rolling time window of call outcomes. Once enough
+calls have been seen and the error rate or the slow-call rate crosses its
+threshold it opens: calls are short-circuited without touching the network
+for `open_seconds`. It then goes half-open and lets a few probe calls
+through; if they all succeed it closes again, any failure re-opens it.
+
+Breakers are paired with a per-integration AdmissionController (see
+admission.py) acting as a bulkhead, so a dependency that hangs can only tie
+up its own bounded pool of concurrent calls.
+"""
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker over rolling error and latency windows"""
+
+    def __init__(
+        self,
+        name: str,
+        window_seconds: float = 30.0,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        slow_call_seconds: float = 2.0,
+        slow_call_rate: float = 0.8,
+        open_seconds: float = 30.0,
+        half_open_calls: int = 1,
+    ):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = max(1, min_calls)
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = max(1, half_open_calls)
+        self.state = CLOSED
+        self._opened_at = 0.0
+        # (timestamp, failed, slow) per finished call
+        self._outcomes = deque()
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self.short_circuited = 0
+        self.times_opened = 0
+        self.successes = 0
+        self.failures = 0
+        self.slow_calls = 0
+
+    def _prune(self, now: float):
+        while self._outcomes and self._outcomes[0][0] <= now - self.window_seconds:
+            self._outcomes.popleft()
+
+    def _transition(self, state: str, now: float):
+        if state == self.state:
+            return
+        logger.warning(f"Circuit breaker {self.name}: {self.state} -> {state}")
+        self.state = state
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        if state == OPEN:
+            self._opened_at = now
+            self.times_opened += 1
+        elif state == CLOSED:
+            self._outcomes.clear()
+
+    def retry_after(self) -> float:
+        """Seconds until an open breaker lets a probe through, 0 otherwise"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    def allow(self) -> bool:
+        """Reserve the right to make one call. Every True must be followed by record() or release()."""
+        now = time.monotonic()
+        if self.state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN, now)
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and self._probes_in_flight < self.half_open_calls:
+            self._probes_in_flight += 1
+            return True
+        self.short_circuited += 1
+        return False
+
+    def release(self):
+        """Give back a reservation whose call never reached the dependency (e.g. bulkhead full)"""
+        if self.state == HALF_OPEN and self._probes_in_flight:
+            self._probes_in_flight -= 1
+
+    def record(self, success: bool, elapsed: float):
+        now = time.monotonic()
+        slow = elapsed >= self.slow_call_seconds
+        if success:
+            self.successes += 1
+        else:
+            self.failures += 1
+        if slow:
+            self.slow_calls += 1
+
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            if not success or slow:
+                self._transition(OPEN, now)
+            else:
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_calls:
+                    self._transition(CLOSED, now)
+            return
+        if self.state == OPEN:
+            # A call admitted before the breaker opened; it has no say any more
+            return
+
+        self._outcomes.append((now, not success, slow))
+        self._prune(now)
+        calls = len(self._outcomes)
+        if calls < self.min_calls:
+            return
+        failed = sum(1 for _, f, _ in self._outcomes if f)
+        slow_count = sum(1 for _, _, s in self._outcomes if s)
+        if failed / calls >= self.failure_rate or slow_count / calls >= self.slow_call_rate:
+            self._transition(OPEN, now)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        self._prune(now)
+        calls = len(self._outcomes)
+        failed = sum(1 for _, f, _ in self._outcomes if f)
+        slow_count = sum(1 for _, _, s in self._outcomes if s)
+        return {
+            "state": self.state,
+            "window_calls": calls,
+            "window_failure_rate": round(failed / calls, 3) if calls else 0.0,
+            "window_slow_rate": round(slow_count / calls, 3) if calls else 0.0,
+            "short_circuited": self.short_circuited,
+            "times_opened": self.times_opened,
+            "retry_after_seconds": round(self.retry_after(), 1),
+            "successes": self.successes,
+            "failures": self.failures,
+            "slow_calls": self.slow_calls,
+        }
@@ -0,0 +1,161 @@
+"""
+Weekly cohort retention: of the users who registered in week W
+(access.created_at), how many logged in again in weeks W+1 ... W+n.
+
+cohort_retention holds one small counter document per registration week
+(keyed by its Monday):
+
+    {"_id": "2026-10-12", "size": 41, "weeks": {"1": 17, "2": 12, ...}}
+
+Each user carries a cohort_weeks bitmask (bit k: logged in during week
+W+k, up to COHORT_MAX_WEEKS) and a cohort_counted flag. mark_cohort_weeks()
+sets bits with an atomic $bit and returns the bits that were not set
+before, so every (user, week) and every signup is counted exactly once,
+whether it comes from a login, a registration or the backfill. A login only
+costs a write the first time in a week; the admin matrix reads one document
+per cohort.
+
+CohortBackfillJob builds the counters from access and login_events for
+users known before the counters existed, one batch of users at a time.
+Logins already moved to the archive (retention.py) aren't seen by it.
+"""
+import asyncio
+import logging
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta, timezone
+
+from bson import Int64
+from pymongo import ReturnDocument, UpdateOne
+
+from maintenance import BatchJob
+
+logger = logging.getLogger(__name__)
+
+COHORT_COLLECTION = "cohort_retention"
+# Bits 1..52 of an int64 bitmask
+COHORT_MAX_WEEKS = 52
+
+
+def _date_of(at) -> date:
+    at = datetime.fromisoformat(at) if isinstance(at, str) else at
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    return at.astimezone(timezone.utc).date()
+
+
+def week_start(at) -> str:
+    """Monday (YYYY-MM-DD, UTC) of the week containing `at` (datetime or ISO string)"""
+    day = _date_of(at)
+    return (day - timedelta(days=day.weekday())).isoformat()
+
+
+def week_offset(created_at, at) -> int:
+    """Weeks between the registration week and the week of `at`"""
+    return (date.fromisoformat(week_start(at)) - date.fromisoformat(week_start(created_at))).days // 7
+
+
+def cohort_increments(created_at, new_bits: int, signup: bool):
+    """(cohort _id, $inc fields) for the bits and signup newly recorded for one user"""
+    increments = {"size": 1} if signup else {}
+    for k in range(1, COHORT_MAX_WEEKS + 1):
+        if new_bits >> k & 1:
+            increments[f"weeks.{k}"] = 1
+    return week_start(created_at), increments
+
+
+async def mark_cohort_weeks(db, query: dict, mask: int, count_signup: bool = True):
+    """
+    OR mask into the cohort_weeks of the user matching query (and flag the
+    signup as counted). Returns (created_at, newly set bits, signup newly
+    counted), or None if there is no such user.
+    """
+    update = {"$bit": {"cohort_weeks": {"or": Int64(mask)}}}
+    if count_signup:
+        update["$set"] = {"cohort_counted": True}
+    before = await db.access.find_one_and_update(
+        query, update,
+        projection={"_id": 0, "created_at": 1, "cohort_weeks": 1, "cohort_counted": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if before is None:
+        return None
+    new_bits = mask & ~int(before.get("cohort_weeks") or 0)
+    return before.get("created_at"), new_bits, count_signup and not before.get("cohort_counted")
+
+
+async def cohort_matrix(db, cohorts: int = 12, today: date = None) -> dict:
+    """Retention triangle of the last `cohorts` registration weeks"""
+    today = today or datetime.now(timezone.utc).date()
+    current = today - timedelta(days=today.weekday())
+    first = (current - timedelta(weeks=cohorts - 1)).isoformat()
+    docs = {doc["_id"]: doc async for doc in db[COHORT_COLLECTION].find({"_id": {"$gte": first}})}
+
+    rows = []
+    for n in range(cohorts):
+        cohort = (current - timedelta(weeks=cohorts - 1 - n)).isoformat()
+        doc = docs.get(cohort, {})
+        size = doc.get("size", 0)
+        weeks = doc.get("weeks", {})
+        # Weeks W+1 .. current week: the triangle shrinks by one per newer cohort
+        elapsed = min(cohorts - 1 - n, COHORT_MAX_WEEKS)
+        returned = [weeks.get(str(k), 0) for k in range(1, elapsed + 1)]
+        rows.append({
+            "cohort": cohort,
+            "size": size,
+            "returned": returned,
+            "retention": [round(r / size, 4) if size else 0.0 for r in returned],
+        })
+    return {"week_starts_on": "monday", "cohorts": rows}
+
+
+class CohortBackfillJob(BatchJob):
+    """Counts signups and weekly returns of existing users from login_events"""
+
+    name = "cohort_retention_backfill"
+    collection = "access"
+    projection = {"user_id": 1, "created_at": 1}
+    counters = ("users", "signups_counted", "weeks_counted", "logins_scanned")
+
+    async def query(self) -> dict:
+        return {"created_at": {"$exists": True}}
+
+    async def _login_days(self, user_ids: list) -> dict:
+        """{user_id: set of YYYY-MM-DD login days}, grouped in Mongo so a batch stays small"""
+        days = defaultdict(set)
+        pipeline = [
+            {"$match": {"user_id": {"$in": user_ids}}},
+            {"$group": {"_id": {"user_id": "$user_id", "day": {"$substrCP": ["$timestamp", 0, 10]}}, "logins": {"$sum": 1}}},
+        ]
+        async for row in self.db.login_events.aggregate(pipeline):
+            days[row["_id"]["user_id"]].add(row["_id"]["day"])
+            self.counts["logins_scanned"] += row["logins"]
+        return days
+
+    async def process(self, batch: list):
+        users = [u for u in batch if u.get("user_id") and u.get("created_at")]
+        login_days = await self._login_days([u["user_id"] for u in users])
+
+        async def mark(user):
+            mask = 0
+            for day in login_days.get(user["user_id"], ()):
+                try:
+                    k = week_offset(user["created_at"], day)
+                except ValueError:
+                    continue
+                if 1 <= k <= COHORT_MAX_WEEKS:
+                    mask |= 1 << k
+            return await mark_cohort_weeks(self.db, {"_id": user["_id"]}, mask)
+
+        increments = defaultdict(Counter)
+        for marked in await asyncio.gather(*[mark(u) for u in users]):
+            if marked is None:
+                continue
+            created_at, new_bits, signup = marked
+            cohort, inc = cohort_increments(created_at, new_bits, signup)
+            increments[cohort].update(inc)
+            self.counts["signups_counted"] += int(signup)
+            self.counts["weeks_counted"] += bin(new_bits).count("1")
+        ops = [UpdateOne({"_id": cohort}, {"$inc": dict(inc)}, upsert=True) for cohort, inc in increments.items() if inc]
+        if ops:
+            await self.db[COHORT_COLLECTION].bulk_write(ops, ordered=False)
+        self.counts["users"] += len(users)
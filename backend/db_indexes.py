@@ -0,0 +1,115 @@
+"""
+Declarative MongoDB index registry.
+
+INDEXES lists every index the API relies on; ensure_indexes() creates them
+at startup (create_indexes is a no-op for indexes that already exist) and
+returns the ones actually in place, so callers can tell when a unique index
+they rely on is missing.
+HOT_QUERIES lists the filters used on request paths so check_query_plans()
+can explain() each one and report any that still fall back to a COLLSCAN.
+"""
+import logging
+import os
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    "access": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "login_events": [
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING)], name="user_id_timestamp"),
+    ],
+    "page_visits": [
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING)], name="user_id_timestamp"),
+        # Sessionization reads whole sessions in time order
+        IndexModel([("session_id", ASCENDING), ("timestamp", ASCENDING)], name="session_id_timestamp"),
+    ],
+    "page_sessions": [
+        # Session stats select summaries by start day
+        IndexModel([("day", ASCENDING)], name="day"),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+    ],
+    "page_visit_buckets": [
+        # Admin analytics select buckets by day range
+        IndexModel([("day", ASCENDING)], name="day"),
+    ],
+    "campaign_failures": [
+        # Failed recipients are listed per campaign
+        IndexModel([("campaign_id", ASCENDING)], name="campaign_id"),
+    ],
+    "email_outbox": [
+        # Claim order of OutboxWorker.claim()
+        IndexModel([("status", ASCENDING), ("priority", DESCENDING), ("created_at", ASCENDING)], name="claim_order"),
+        # Sent jobs are only kept OUTBOX_SENT_TTL_DAYS (changing it later needs a collMod on the index)
+        IndexModel(
+            [("sent_at", ASCENDING)], name="sent_ttl",
+            expireAfterSeconds=int(float(os.environ.get('OUTBOX_SENT_TTL_DAYS', 7)) * 86400),
+            partialFilterExpression={"status": "sent"}
+        ),
+    ],
+}
+
+# (collection, example filter) for the queries on request paths
+HOT_QUERIES = [
+    ("access", {"email": "probe@example.com"}),
+    ("access", {"user_id": "probe"}),
+    ("login_events", {"user_id": "probe"}),
+    ("page_visits", {"user_id": "probe"}),
+    ("page_visits", {"session_id": "probe"}),
+]
+
+
+async def ensure_indexes(db) -> dict:
+    """Create every registered index; returns {collection: [index names]}"""
+    created = {}
+    for collection, models in INDEXES.items():
+        created[collection] = []
+        # One call per index, so one that can't be built doesn't take the others down with it
+        for model in models:
+            try:
+                created[collection] += await db[collection].create_indexes([model])
+            except OperationFailure as e:
+                # Typically existing duplicates blocking a unique index: keep serving, but make it loud
+                logger.error(f"Failed to create index {model.document['name']} on {collection}: {e}")
+    logger.info(f"Indexes ensured: {created}")
+    return created
+
+
+def _plan_stages(plan: dict):
+    """Yield every stage name in an explain() plan tree"""
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        yield plan["stage"]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+async def check_query_plans(db) -> list:
+    """explain() each hot query and flag the ones whose winning plan is a collection scan"""
+    report = []
+    for collection, query in HOT_QUERIES:
+        try:
+            explain = await db.command({"explain": {"find": collection, "filter": query}, "verbosity": "queryPlanner"})
+        except OperationFailure as e:
+            report.append({"collection": collection, "filter": list(query), "error": str(e)})
+            continue
+        stages = list(_plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {})))
+        collscan = "COLLSCAN" in stages
+        if collscan:
+            logger.warning(f"Hot query on {collection} {list(query)} is doing a collection scan")
+        report.append({
+            "collection": collection,
+            "filter": list(query),
+            "stages": stages,
+            "collscan": collscan,
+        })
+    return report
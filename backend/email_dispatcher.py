@@ -0,0 +1,230 @@
+"""
+Async transactional email dispatcher for Brevo.
+
+Emails used to be sent with a blocking requests.post (no timeout, fresh
+connection each time) from BackgroundTasks, tying up Starlette's shared
+threadpool whenever Brevo was slow. EmailDispatcher keeps one keep-alive
+httpx client, an in-memory send queue drained by a fixed number of worker
+tasks, per-request timeouts and retries with jittered exponential backoff
+on transport errors, 429 and 5xx. Every POST (including direct send() calls
+from the outbox and campaigns) goes through a circuit breaker and a bounded
+concurrency bulkhead, so a Brevo outage fails fast instead of holding
+connections for the full timeout.
+"""
+import asyncio
+import logging
+import random
+import time
+
+import httpx
+
+from admission import AdmissionController, AdmissionRejected
+from circuit_breaker import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+BREVO_API_URL = "https://api.brevo.com/v3/smtp/email"
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class EmailDispatcher:
+    """Queue + worker pool sending Brevo payloads over a shared HTTP client"""
+
+    def __init__(
+        self,
+        api_key: str,
+        api_url: str = BREVO_API_URL,
+        workers: int = 4,
+        queue_size: int = 1000,
+        timeout: float = 10.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 10.0,
+        max_concurrency: int = None,
+        breaker: CircuitBreaker = None,
+    ):
+        self.api_key = api_key
+        self.api_url = api_url
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker("brevo", slow_call_seconds=timeout / 2)
+        self.bulkhead = AdmissionController(
+            max_concurrency=max_concurrency or workers,
+            max_queue=4 * (max_concurrency or workers),
+            max_wait=timeout
+        )
+        self._queue = None
+        self._client = None
+        self._tasks = []
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.dropped = 0
+        self.short_circuited = 0
+        self.bulkhead_rejected = 0
+        self.total_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.api_key)
+
+    async def open(self):
+        """Create the shared HTTP client (enough for send(); start() also runs the queue)"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.bulkhead.max_concurrency,
+                    max_keepalive_connections=self.bulkhead.max_concurrency
+                ),
+                headers={"accept": "application/json", "api-key": self.api_key, "content-type": "application/json"}
+            )
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def start(self):
+        if self._tasks:
+            return
+        await self.open()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Give queued emails up to drain_timeout seconds to go out, then stop the workers"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Email queue not drained on shutdown, {self._queue.qsize()} email(s) dropped")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.close()
+
+    def enqueue(self, payload: dict, description: str = "", fallback: str = "") -> bool:
+        """Queue an email without waiting. `fallback` is logged if it finally fails."""
+        if self._queue is None:
+            logger.error(f"Email dispatcher not started, dropping email: {description}")
+            self.dropped += 1
+            return False
+        try:
+            self._queue.put_nowait((payload, description, fallback))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.error(f"Email queue full, dropping email: {description}")
+            if fallback:
+                logger.error(fallback)
+            return False
+
+    async def _worker(self):
+        while True:
+            payload, description, fallback = await self._queue.get()
+            try:
+                await self.send(payload, description, fallback)
+            except Exception as e:
+                logger.error(f"Unexpected error sending email {description}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": uniform over [0, base * 2^attempt], capped
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def send(self, payload: dict, description: str = "", fallback: str = "") -> bool:
+        ok, _ = await self.deliver(payload, description, fallback)
+        return ok
+
+    async def deliver(self, payload: dict, description: str = "", fallback: str = ""):
+        """
+        send() that also tells why it failed: returns (ok, transient). transient
+        is True when trying again later may succeed (open circuit, network
+        error, bulkhead full, retryable status), False for a rejected payload.
+        """
+        started = time.perf_counter()
+        error = None
+        transient = True
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.retries += 1
+                await asyncio.sleep(self._backoff(attempt))
+            if not self.breaker.allow():
+                self.short_circuited += 1
+                error = f"circuit open, retry in {self.breaker.retry_after():.0f}s"
+                break
+            response, error = await self._post(payload)
+            if response is None:
+                continue
+            if response.status_code in (200, 201, 202):
+                self._record_latency(started)
+                self.sent += 1
+                logger.info(f"Email sent via Brevo: {description}")
+                return True, False
+            error = f"{response.status_code} - {response.text}"
+            if response.status_code not in RETRYABLE_STATUS:
+                transient = False
+                break
+
+        self._record_latency(started)
+        self.failed += 1
+        logger.error(f"Brevo API Error for {description}: {error}")
+        if fallback:
+            logger.error(fallback)
+        return False, transient
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker lets calls through again (0 when closed)"""
+        return self.breaker.retry_after()
+
+    async def _post(self, payload: dict):
+        """One POST admitted by the breaker. Returns (response, None) or (None, error)."""
+        try:
+            async with self.bulkhead.slot():
+                started = time.monotonic()
+                healthy = False
+                try:
+                    response = await self._client.post(self.api_url, json=payload)
+                    healthy = response.status_code not in RETRYABLE_STATUS
+                    return response, None
+                except httpx.HTTPError as e:
+                    return None, f"{type(e).__name__}: {e}"
+                finally:
+                    self.breaker.record(healthy, time.monotonic() - started)
+        except AdmissionRejected as e:
+            self.breaker.release()
+            self.bulkhead_rejected += 1
+            return None, f"bulkhead {e.reason}"
+
+    def _record_latency(self, started: float):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.total_latency_ms += elapsed_ms
+        self.max_latency_ms = max(self.max_latency_ms, elapsed_ms)
+
+    def stats(self) -> dict:
+        finished = self.sent + self.failed
+        return {
+            "enabled": self.enabled,
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_size": self.queue_size,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "dropped": self.dropped,
+            "short_circuited": self.short_circuited,
+            "bulkhead_rejected": self.bulkhead_rejected,
+            "avg_latency_ms": round(self.total_latency_ms / finished, 2) if finished else 0.0,
+            "max_latency_ms": round(self.max_latency_ms, 2),
+            "bulkhead": self.bulkhead.stats(),
+            "breaker": self.breaker.stats(),
+        }
@@ -0,0 +1,148 @@
+"""
+Coalescing of anonymous tracking events (/api/track-demo, /api/track-event).
+
+Each request used to start its own background task doing a geolocation
+lookup and an admin notification, so a visitor clicking ten times meant ten
+lookups and ten emails. EventCoalescer keeps one pending record per
+(ip, event_type) and only counts the repeats; every `window_seconds` (or as
+soon as max_keys records are pending) each record is handed once to
+`handle`, which the server uses for one lookup, one notification and one
+$inc of the daily counters. Flushes run in the background, at most
+max_concurrency handle() calls at a time so they stay within the
+geolocation bulkhead. Pending records are flushed on shutdown.
+
+The counters live in anonymous_events_daily, one document per day and
+event type:
+
+    {"_id": "2026-10-17:demo_view", "count": 14, "visitors": 3, "details": {"fr": 9, "en": 5}}
+
+count is every request, visitors the coalesced records (distinct IPs per
+window) and details the per-value counts (e.g. demo language).
+"""
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+COUNTER_COLLECTION = "anonymous_events_daily"
+
+
+def counter_increments(record: dict):
+    """(counter _id, $inc fields) for one coalesced record"""
+    increments = {"count": record["count"], "visitors": 1}
+    for detail, n in record["details"].items():
+        increments[f"details.{detail}"] = n
+    return f"{record['first_seen'][:10]}:{record['event_type']}", increments
+
+
+async def anonymous_event_report(db, start_day: str, end_day: str) -> dict:
+    """{day: {event_type: counters}} between two YYYY-MM-DD days (inclusive)"""
+    days = {}
+    # ";" sorts right after ":", so "<end_day>;" bounds every "<end_day>:<event_type>"
+    async for doc in db[COUNTER_COLLECTION].find({"_id": {"$gte": start_day, "$lt": f"{end_day};"}}).sort("_id", 1):
+        day, event_type = doc.pop("_id").split(":", 1)
+        days.setdefault(day, {})[event_type] = doc
+    return days
+
+
+class EventCoalescer:
+    """Merges repeated (ip, event_type) events within a window into one counted record"""
+
+    def __init__(self, handle, window_seconds: float = 300, max_keys: int = 10000, max_concurrency: int = 5):
+        # async handle(record) with record = {"ip", "event_type", "count", "first_seen", "last_seen", "details"}
+        self.handle = handle
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self._limit = asyncio.Semaphore(max(1, max_concurrency))
+        self._pending = {}
+        self._task = None
+        # Flushes started by add(), so stop() can wait for them
+        self._flushes = set()
+        self.received = 0
+        self.coalesced = 0
+        self.records_flushed = 0
+        self.handle_errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_seconds > 0
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.drain()
+
+    async def drain(self):
+        """Flush what is pending and wait for the flushes already started by add()"""
+        await asyncio.gather(*self._flushes, return_exceptions=True)
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.window_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush coalesced events: {e}")
+
+    async def add(self, ip: str, event_type: str, detail: str = None) -> bool:
+        """Record one event; returns False when it was merged into a pending record"""
+        self.received += 1
+        now = datetime.now(timezone.utc).isoformat()
+        key = (ip, event_type)
+        record = self._pending.get(key)
+        if record is not None:
+            record["count"] += 1
+            record["last_seen"] = now
+            if detail:
+                record["details"][detail] += 1
+            self.coalesced += 1
+            return False
+
+        self._pending[key] = {
+            "ip": ip,
+            "event_type": event_type,
+            "count": 1,
+            "first_seen": now,
+            "last_seen": now,
+            "details": Counter([detail] if detail else []),
+        }
+        if not self.enabled or len(self._pending) >= self.max_keys:
+            # Don't make the request that crossed the threshold wait for the whole flush
+            task = asyncio.create_task(self.flush())
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+        return True
+
+    async def _handle(self, record: dict):
+        async with self._limit:
+            await self.handle(record)
+
+    async def flush(self):
+        if not self._pending:
+            return
+        records, self._pending = list(self._pending.values()), {}
+        results = await asyncio.gather(*[self._handle(record) for record in records], return_exceptions=True)
+        for record, result in zip(records, results):
+            if isinstance(result, Exception):
+                self.handle_errors += 1
+                logger.error(f"Failed to handle {record['event_type']} from {record['ip']}: {result}")
+        self.records_flushed += len(records)
+
+    def stats(self) -> dict:
+        return {
+            "window_seconds": self.window_seconds,
+            "pending": len(self._pending),
+            "received": self.received,
+            "coalesced": self.coalesced,
+            "records_flushed": self.records_flushed,
+            "handle_errors": self.handle_errors,
+        }
@@ -0,0 +1,206 @@
+"""
+Funnel rollups over PAGE_DEPTH_ORDER.
+
+funnel_daily holds one document per UTC day:
+
+    {"_id": "2026-10-17", "reached": {"0": 12, "1": 9, ...}, "views": {"0": 40, "-1": 3, ...}}
+
+reached.<k> counts users whose deepest page first got to depth k that day,
+views.<k> counts page views at depth k (-1 for pages outside the flow).
+track-page knows a user's depth before its $max update, so every raise
+becomes $inc of reached.<old+1 .. new> through an IncrementBuffer, and the
+admin report only reads one document per day of the range, whatever the
+number of users. FunnelRebuildJob recomputes the rollups from the raw
+events to verify (and optionally replace) the live counters. Once visits
+have been archived (retention.py) the raw events are only a partial
+history, so the rebuild still compares but refuses to replace anything.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from pymongo import ReplaceOne
+
+from page_depth import PAGE_DEPTH_ORDER, get_page_depth
+from retention import archived_days
+
+logger = logging.getLogger(__name__)
+
+FUNNEL_COLLECTION = "funnel_daily"
+
+
+def funnel_increments(old_depth: int, depth: int) -> dict:
+    """$inc fields for one view at `depth` by a user whose deepest depth was old_depth"""
+    increments = {f"views.{depth}": 1}
+    for reached in range(old_depth + 1, depth + 1):
+        increments[f"reached.{reached}"] = 1
+    return increments
+
+
+async def funnel_report(db, start_day: str, end_day: str) -> dict:
+    """Funnel conversion between two YYYY-MM-DD days (inclusive), from the daily rollups"""
+    reached = Counter()
+    views = Counter()
+    days = 0
+    async for doc in db[FUNNEL_COLLECTION].find({"_id": {"$gte": start_day, "$lte": end_day}}):
+        days += 1
+        reached.update({int(k): v for k, v in doc.get("reached", {}).items()})
+        views.update({int(k): v for k, v in doc.get("views", {}).items()})
+
+    entered = reached[0]
+    steps = []
+    for depth, page in enumerate(PAGE_DEPTH_ORDER):
+        previous = reached[depth - 1] if depth else entered
+        steps.append({
+            "page": page,
+            "depth": depth,
+            "users_reached": reached[depth],
+            "views": views[depth],
+            "conversion_from_previous": round(reached[depth] / previous, 4) if previous else 0.0,
+            "conversion_from_start": round(reached[depth] / entered, 4) if entered else 0.0,
+        })
+    return {
+        "start": start_day,
+        "end": end_day,
+        "days_with_data": days,
+        "steps": steps,
+        "views_outside_flow": views[-1],
+    }
+
+
+def _day_of(timestamp) -> str:
+    at = datetime.fromisoformat(timestamp) if isinstance(timestamp, str) else timestamp
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    return at.astimezone(timezone.utc).strftime("%Y-%m-%d")
+
+
+class FunnelRebuildJob:
+    """Recomputes funnel_daily from raw page visits and compares it with the live rollups"""
+
+    def __init__(self, db, source: str = "documents", apply: bool = False, batch_size: int = 1000, archive_dir=None):
+        # source: "documents" (page_visits) or "buckets" (page_visit_buckets)
+        self.db = db
+        self.source = source
+        self.apply = apply
+        self.batch_size = batch_size
+        self.archive_dir = archive_dir
+        self.applied = False
+        self.apply_refused = None
+        self._task = None
+        self.status = "idle"
+        self.events = 0
+        self.users = 0
+        self.started_at = None
+        self.finished_at = None
+        self.mismatched_days = []
+        self.days = 0
+        self.last_error = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def cancel(self):
+        if self.running:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _visits(self):
+        """(user_id, day, depth) per raw visit, grouped by user and in time order within a user"""
+        if self.source == "buckets":
+            # Bucket _ids are "<user_id>:<day>": _id order groups users and sorts their days
+            cursor = self.db.page_visit_buckets.find({}, {"user_id": 1, "day": 1, "visits": 1}).sort("_id", 1)
+            async for bucket in cursor.batch_size(self.batch_size):
+                for _, depth in sorted(bucket.get("visits", []), key=lambda pair: pair[0]):
+                    yield bucket["user_id"], bucket["day"], depth
+        else:
+            # (user_id desc, timestamp asc) walks the user_id_timestamp index backwards
+            cursor = self.db.page_visits.find(
+                {}, {"_id": 0, "user_id": 1, "page_path": 1, "timestamp": 1}
+            ).sort([("user_id", -1), ("timestamp", 1)])
+            async for visit in cursor.batch_size(self.batch_size):
+                try:
+                    day = _day_of(visit["timestamp"])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                yield visit.get("user_id"), day, get_page_depth(visit.get("page_path"))
+
+    async def run(self):
+        self.status = "running"
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.events = self.users = 0
+        self.last_error = None
+        self.applied = False
+        self.apply_refused = None
+        rollups = defaultdict(lambda: {"reached": Counter(), "views": Counter()})
+        try:
+            current_user, deepest = object(), -1
+            async for user_id, day, depth in self._visits():
+                if user_id != current_user:
+                    current_user, deepest = user_id, -1
+                    self.users += 1
+                rollup = rollups[day]
+                rollup["views"][str(depth)] += 1
+                for reached in range(deepest + 1, depth + 1):
+                    rollup["reached"][str(reached)] += 1
+                deepest = max(deepest, depth)
+                self.events += 1
+
+            self.days = len(rollups)
+            self.mismatched_days = []
+            live_days = set()
+            async for live in self.db[FUNNEL_COLLECTION].find({"_id": {"$in": list(rollups)}}):
+                live_days.add(live["_id"])
+                rebuilt = rollups[live["_id"]]
+                if dict(rebuilt["reached"]) != live.get("reached", {}) or dict(rebuilt["views"]) != live.get("views", {}):
+                    self.mismatched_days.append(live["_id"])
+            self.mismatched_days += [day for day in rollups if day not in live_days]
+            self.mismatched_days.sort()
+
+            # Archived visits up to the last rebuilt day are missing from the rebuild (and from
+            # every later user's deepest depth): replacing the live counters would lose them
+            archived = [day for day in archived_days("page_visits", self.archive_dir) if rollups and day <= max(rollups)]
+            if self.apply and archived:
+                self.apply_refused = f"page_visits archived for {len(archived)} day(s) from {archived[0]}"
+                logger.warning(f"Funnel rebuild not applied: {self.apply_refused}")
+            elif self.apply and rollups:
+                await self.db[FUNNEL_COLLECTION].bulk_write([
+                    ReplaceOne({"_id": day}, {"reached": dict(r["reached"]), "views": dict(r["views"])}, upsert=True)
+                    for day, r in rollups.items()
+                ], ordered=False)
+                self.applied = True
+        except asyncio.CancelledError:
+            self.status = "cancelled"
+            raise
+        except Exception as e:
+            self.status = "failed"
+            self.last_error = str(e)
+            logger.error(f"Funnel rebuild failed: {e}")
+            return
+        self.status = "done"
+        self.finished_at = time.monotonic()
+        logger.info(f"Funnel rebuild finished: {self.events} visits, {self.days} days, {len(self.mismatched_days)} mismatched")
+
+    def progress(self) -> dict:
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at if self.started_at else 0
+        return {
+            "status": self.status,
+            "source": self.source,
+            "applied": self.applied,
+            "apply_refused": self.apply_refused,
+            "visits": self.events,
+            "users": self.users,
+            "days": self.days,
+            "mismatched_days": self.mismatched_days,
+            "visits_per_sec": round(self.events / elapsed, 1) if elapsed else 0.0,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,191 @@
+"""
+Offline IP geolocation from a local range CSV (GeoLite-style).
+
+The CSV needs either a `network` column (CIDR) or `start_ip`/`end_ip`
+columns, plus `city`/`city_name` and `country`/`country_name`. Ranges must
+not overlap (as in the GeoLite blocks files). They are loaded into sorted
+NumPy arrays of integer range starts and looked up with binary search, so a
+lookup takes microseconds and never touches the network.
+
+IPv6 addresses don't fit in a NumPy integer, so they are split into two
+uint64 halves; ranges are sorted by (high, low) and searched on both.
+"""
+import asyncio
+import ipaddress
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from geolocation import UNKNOWN_LOCATION, LOCALHOST_LOCATION
+
+logger = logging.getLogger(__name__)
+
+_LOW_MASK = (1 << 64) - 1
+
+
+class RangeIndex:
+    """Immutable sorted range index for one address family"""
+
+    def __init__(self, starts, ends, labels):
+        # starts/ends: lists of Python ints, labels: list of int ids
+        order = sorted(range(len(starts)), key=starts.__getitem__)
+        starts = [starts[i] for i in order]
+        ends = [ends[i] for i in order]
+        self.start_hi = np.array([s >> 64 for s in starts], dtype=np.uint64)
+        self.start_lo = np.array([s & _LOW_MASK for s in starts], dtype=np.uint64)
+        self.end_hi = np.array([e >> 64 for e in ends], dtype=np.uint64)
+        self.end_lo = np.array([e & _LOW_MASK for e in ends], dtype=np.uint64)
+        self.labels = np.array([labels[i] for i in order], dtype=np.int32)
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.start_hi, self.start_lo, self.end_hi, self.end_lo, self.labels))
+
+    def find(self, value: int) -> int:
+        """Return the label id of the range containing value, or -1"""
+        hi, lo = np.uint64(value >> 64), np.uint64(value & _LOW_MASK)
+        left = int(np.searchsorted(self.start_hi, hi, side='left'))
+        right = int(np.searchsorted(self.start_hi, hi, side='right'))
+        # Last range whose start <= value: among starts sharing `hi`, compare the low half
+        idx = left + int(np.searchsorted(self.start_lo[left:right], lo, side='right')) - 1
+        if idx < 0:
+            return -1
+        end_hi, end_lo = self.end_hi[idx], self.end_lo[idx]
+        if end_hi > hi or (end_hi == hi and end_lo >= lo):
+            return int(self.labels[idx])
+        return -1
+
+
+class OfflineGeoDatabase:
+    """Loaded snapshot of the CSV: one RangeIndex per address family plus location labels"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+        city_col = next((c for c in ('city', 'city_name') if c in df.columns), None)
+        country_col = next((c for c in ('country', 'country_name', 'country_iso_code') if c in df.columns), None)
+
+        self.locations = []
+        label_ids = {}
+        families = {4: ([], [], []), 6: ([], [], [])}
+        for row in df.itertuples(index=False):
+            row = row._asdict()
+            try:
+                if 'network' in row:
+                    net = ipaddress.ip_network(row['network'].strip(), strict=False)
+                    version, start, end = net.version, int(net.network_address), int(net.broadcast_address)
+                else:
+                    start_ip = ipaddress.ip_address(row['start_ip'].strip())
+                    end_ip = ipaddress.ip_address(row['end_ip'].strip())
+                    version, start, end = start_ip.version, int(start_ip), int(end_ip)
+            except (ValueError, KeyError):
+                continue
+            city = (row.get(city_col) if city_col else '') or 'Unknown'
+            country = (row.get(country_col) if country_col else '') or 'Unknown'
+            label = f"{city}, {country}"
+            if label not in label_ids:
+                label_ids[label] = len(self.locations)
+                self.locations.append(label)
+            starts, ends, labels = families[version]
+            starts.append(start)
+            ends.append(end)
+            labels.append(label_ids[label])
+
+        self.indexes = {version: RangeIndex(*data) for version, data in families.items()}
+
+    @property
+    def nbytes(self) -> int:
+        label_bytes = sum(len(label.encode()) for label in self.locations)
+        return sum(index.nbytes for index in self.indexes.values()) + label_bytes
+
+    def lookup(self, ip_address: str) -> str:
+        try:
+            ip = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return UNKNOWN_LOCATION
+        label = self.indexes[ip.version].find(int(ip))
+        return self.locations[label] if label >= 0 else UNKNOWN_LOCATION
+
+
+class OfflineGeoResolver:
+    """Drop-in replacement for GeoResolver backed by OfflineGeoDatabase, reloaded when the file changes"""
+
+    def __init__(self, path: str = None, reload_interval: float = None):
+        self.path = path or os.environ.get('GEO_DB_PATH', '')
+        self.reload_interval = reload_interval if reload_interval is not None else float(os.environ.get('GEO_DB_RELOAD_SECONDS', 60))
+        self.database = None
+        self._watcher = None
+        self.lookups = 0
+        self.misses = 0
+        self.reloads = 0
+
+    async def start(self):
+        await self._load()
+        if self._watcher is None and self.reload_interval > 0:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def _load(self):
+        started = time.perf_counter()
+        try:
+            database = await asyncio.to_thread(OfflineGeoDatabase, self.path)
+        except Exception as e:
+            logger.error(f"Failed to load offline geolocation database {self.path}: {e}")
+            return
+        # Swap the whole snapshot at once; in-flight lookups keep using the old one
+        self.database = database
+        self.reloads += 1
+        logger.info(
+            f"Offline geolocation database loaded from {self.path}: "
+            f"{len(database.indexes[4])} IPv4 / {len(database.indexes[6])} IPv6 ranges, "
+            f"{len(database.locations)} locations, {database.nbytes / 1024 / 1024:.1f} MiB "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                continue
+            if self.database is None or mtime != self.database.mtime:
+                await self._load()
+
+    async def close(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+    def lookup(self, ip_address: str) -> str:
+        if not ip_address or ip_address == "127.0.0.1":
+            return LOCALHOST_LOCATION
+        if self.database is None:
+            return UNKNOWN_LOCATION
+        self.lookups += 1
+        location = self.database.lookup(ip_address)
+        if location == UNKNOWN_LOCATION:
+            self.misses += 1
+        return location
+
+    async def resolve(self, ip_address: str) -> str:
+        return self.lookup(ip_address)
+
+    def stats(self) -> dict:
+        database = self.database
+        return {
+            "backend": "offline",
+            "path": self.path,
+            "ipv4_ranges": len(database.indexes[4]) if database else 0,
+            "ipv6_ranges": len(database.indexes[6]) if database else 0,
+            "memory_bytes": database.nbytes if database else 0,
+            "lookups": self.lookups,
+            "misses": self.misses,
+            "reloads": self.reloads,
+        }
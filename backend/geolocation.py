@@ -0,0 +1,239 @@
+"""
+Async IP geolocation.
+
+GeoResolver replaces the old blocking requests.get to ip-api.com. It keeps a
+single pooled httpx client, caches results (LRU + TTL) by IP or /24 prefix,
+coalesces concurrent lookups for the same key and rate-limits outbound calls
+with a token bucket so we stay under the free tier's 45 requests/minute.
+Lookups go through a circuit breaker and their own concurrency bulkhead, so
+an ip-api outage answers "Unknown" at once instead of waiting on timeouts.
+"""
+import asyncio
+import ipaddress
+import logging
+import os
+import time
+from collections import OrderedDict
+
+import httpx
+
+from admission import AdmissionController, AdmissionRejected
+from circuit_breaker import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_LOCATION = "Unknown"
+LOCALHOST_LOCATION = "Localhost"
+
+
+class TokenBucket:
+    """Simple token bucket: `rate` tokens per `per` seconds, bursts up to `rate`"""
+
+    def __init__(self, rate: int, per: float):
+        self.capacity = float(rate)
+        self.tokens = float(rate)
+        self.fill_rate = rate / per
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+        self.updated = now
+
+    async def acquire(self, max_wait: float = 0.0) -> bool:
+        """Take one token, waiting up to max_wait seconds. Returns False if none came free."""
+        # Reserve the token up front (tokens may go negative: callers queue on future refills),
+        # then sleep without holding anything, so every caller's wait is bounded by max_wait
+        self._refill()
+        wait = (1 - self.tokens) / self.fill_rate if self.tokens < 1 else 0.0
+        if wait > max_wait:
+            return False
+        self.tokens -= 1
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # Give the reserved slot back to the callers behind us
+                self.tokens += 1
+                raise
+        return True
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after a per-entry TTL"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data = OrderedDict()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float):
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class GeoResolver:
+    """Cached, coalescing, rate-limited async client for ip-api.com"""
+
+    def __init__(
+        self,
+        base_url: str = None,
+        cache_size: int = None,
+        cache_ttl: float = None,
+        key_by_prefix: bool = None,
+        rate_per_minute: int = None,
+        timeout: float = 3.0,
+        max_rate_wait: float = 5.0,
+        breaker: CircuitBreaker = None,
+        bulkhead: AdmissionController = None,
+    ):
+        self.base_url = (base_url or os.environ.get('IP_API_URL', 'http://ip-api.com')).rstrip('/')
+        self.cache_ttl = cache_ttl if cache_ttl is not None else float(os.environ.get('GEO_CACHE_TTL_SECONDS', 24 * 3600))
+        self.negative_ttl = min(self.cache_ttl, 60.0)
+        self.key_by_prefix = key_by_prefix if key_by_prefix is not None else os.environ.get('GEO_CACHE_KEY', 'ip') == 'prefix'
+        self.timeout = timeout
+        self.max_rate_wait = max_rate_wait
+        self.cache = TTLCache(cache_size or int(os.environ.get('GEO_CACHE_SIZE', 10000)))
+        self.bucket = TokenBucket(rate_per_minute or int(os.environ.get('GEO_RATE_PER_MINUTE', 45)), 60.0)
+        self.breaker = breaker or CircuitBreaker("ip-api", slow_call_seconds=timeout / 2)
+        self.bulkhead = bulkhead or AdmissionController(
+            max_concurrency=int(os.environ.get('GEO_MAX_CONCURRENCY', 5)),
+            max_queue=int(os.environ.get('GEO_MAX_QUEUE', 20)),
+            max_wait=timeout
+        )
+        self._client = None
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.lookups = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.bulkhead_rejected = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=5)
+            )
+        return self._client
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def cache_key(self, ip_address: str) -> str:
+        if not self.key_by_prefix:
+            return ip_address
+        try:
+            ip = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return ip_address
+        prefix = 24 if ip.version == 4 else 48
+        return str(ipaddress.ip_network(f"{ip_address}/{prefix}", strict=False))
+
+    async def resolve(self, ip_address: str) -> str:
+        if not ip_address or ip_address == "127.0.0.1":
+            return LOCALHOST_LOCATION
+
+        key = self.cache_key(ip_address)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        task = asyncio.ensure_future(self._lookup(ip_address, key))
+        self._pending[key] = task
+        task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _lookup(self, ip_address: str, key: str) -> str:
+        # Open breaker: don't cache, the dependency may be back on the next request
+        if not self.breaker.allow():
+            return UNKNOWN_LOCATION
+        if not await self.bucket.acquire(self.max_rate_wait):
+            # Don't cache: the next request may well get a token
+            self.breaker.release()
+            self.rate_limited += 1
+            return UNKNOWN_LOCATION
+
+        location = None
+        try:
+            async with self.bulkhead.slot():
+                self.lookups += 1
+                started = time.monotonic()
+                healthy = False
+                try:
+                    response = await self._get_client().get(
+                        f"{self.base_url}/json/{ip_address}",
+                        params={"fields": "status,country,city"}
+                    )
+                    # 4xx other than 429 is about this request, not the dependency's health
+                    healthy = response.status_code < 500 and response.status_code != 429
+                    if response.status_code == 200:
+                        data = response.json()
+                        if data.get('status', 'success') == 'success':
+                            location = f"{data.get('city', 'Unknown')}, {data.get('country', 'Unknown')}"
+                except Exception as e:
+                    self.errors += 1
+                    logger.warning(f"Geolocation lookup failed for {ip_address}: {e}")
+                finally:
+                    self.breaker.record(healthy, time.monotonic() - started)
+        except AdmissionRejected:
+            self.breaker.release()
+            self.bulkhead_rejected += 1
+            return UNKNOWN_LOCATION
+
+        if location is None:
+            self.cache.set(key, UNKNOWN_LOCATION, self.negative_ttl)
+            return UNKNOWN_LOCATION
+        self.cache.set(key, location, self.cache_ttl)
+        return location
+
+    def stats(self) -> dict:
+        return {
+            "backend": "ip-api",
+            "cache_entries": len(self.cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "lookups": self.lookups,
+            "rate_limited": self.rate_limited,
+            "errors": self.errors,
+            "in_flight": len(self._pending),
+            "bulkhead_rejected": self.bulkhead_rejected,
+            "bulkhead": self.bulkhead.stats(),
+            "breaker": self.breaker.stats(),
+        }
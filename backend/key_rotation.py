@@ -0,0 +1,83 @@
+"""
+SERVER_ENCRYPTION_KEY rotation.
+
+SERVER_ENCRYPTION_KEY may hold several comma-separated Fernet keys, newest
+first. They are combined into a MultiFernet: new master keys are encrypted
+with the first key and any listed key can decrypt. KeyRotationJob then
+re-encrypts every stored `master_encryption_key` under the newest key. It
+streams db.access in _id order, checkpoints after every batch so a restarted
+job resumes where it stopped, and throttles itself to a target ops/sec
+(a maintenance.BatchJob).
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from pymongo import UpdateOne
+
+from maintenance import BatchJob
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_ID = "master_key_rotation"
+
+
+def parse_fernet_keys(raw_keys: str) -> list:
+    """Comma-separated Fernet keys (newest first) -> list of Fernet instances"""
+    return [Fernet(k.strip().encode()) for k in raw_keys.split(',') if k.strip()]
+
+
+class KeyRotationJob(BatchJob):
+    """Background re-encryption of access.master_encryption_key under the primary key"""
+
+    name = CHECKPOINT_ID
+    collection = "access"
+    projection = {"_id": 1, "master_encryption_key": 1}
+    counters = ("rotated", "failed")
+
+    def __init__(self, db, keys: list, batch_size: int = 500, target_ops_per_sec: float = 200, workers: int = 2):
+        super().__init__(db, batch_size=batch_size, target_docs_per_sec=target_ops_per_sec)
+        self.keyring = MultiFernet(keys)
+        self.primary = keys[0]
+        self.workers = workers
+        self._executor = None
+
+    def _rotate_one(self, token: str):
+        """Return the re-encrypted token, None if it is already on the primary key"""
+        try:
+            self.primary.decrypt(token.encode())
+            return None
+        except InvalidToken:
+            pass
+        return self.keyring.rotate(token.encode()).decode()
+
+    async def run(self):
+        # Fernet work runs on a small pool for the duration of the run
+        with ThreadPoolExecutor(max_workers=self.workers) as self._executor:
+            await super().run()
+
+    async def query(self) -> dict:
+        return {"master_encryption_key": {"$type": "string"}}
+
+    async def process(self, batch: list):
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *[loop.run_in_executor(self._executor, self._rotate_one, doc["master_encryption_key"]) for doc in batch],
+            return_exceptions=True
+        )
+
+        ops = []
+        for doc, result in zip(batch, results):
+            if isinstance(result, Exception):
+                self.counts["failed"] += 1
+                logger.error(f"Master key rotation failed for _id {doc['_id']}: {result}")
+            elif result is not None:
+                # Only overwrite if nobody changed the key since we read it
+                ops.append(UpdateOne(
+                    {"_id": doc["_id"], "master_encryption_key": doc["master_encryption_key"]},
+                    {"$set": {"master_encryption_key": result}}
+                ))
+        if ops:
+            write = await self.db.access.bulk_write(ops, ordered=False)
+            self.counts["rotated"] += write.modified_count
@@ -0,0 +1,152 @@
+"""
+Resumable background maintenance jobs (backfills, rebuilds, archiving).
+
+BatchJob streams one collection in _id order, hands each batch to
+process(), checkpoints the last _id and its counters in
+db.maintenance_jobs after every batch and throttles itself to a target
+docs/sec. A cancelled or crashed job resumes after its checkpoint; a
+finished one starts over when run again, unless it is `incremental`: then
+the last _id is a watermark and each run only processes newer documents.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+class BatchJob:
+    """Base class: set `name` and `collection`, implement process(batch)"""
+
+    name = None
+    collection = None
+    projection = None
+    counters = ()
+    incremental = False
+
+    def __init__(self, db, batch_size: int = 500, target_docs_per_sec: float = 1000):
+        self.db = db
+        self.batch_size = batch_size
+        self.target_docs_per_sec = target_docs_per_sec
+        self._task = None
+        self.status = "idle"
+        self.processed = 0
+        self.processed_this_run = 0
+        self.counts = dict.fromkeys(self.counters, 0)
+        self.remaining = None
+        self.started_at = None
+        self.last_error = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def cancel(self):
+        if self.running:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def query(self) -> dict:
+        """Filter of the documents to process (called once per run)"""
+        return {}
+
+    async def process(self, batch: list):
+        raise NotImplementedError
+
+    async def finish(self):
+        """Called once after the last batch of a successful run"""
+
+    async def run(self):
+        checkpoint = await self.db.maintenance_jobs.find_one({"_id": self.name}) or {}
+        resumable = self.incremental or checkpoint.get("status") != "done"
+        last_id = checkpoint.get("last_id") if resumable else None
+        if last_id is not None:
+            self.processed = checkpoint.get("processed", 0)
+            self.counts.update(checkpoint.get("counts", {}))
+            logger.info(f"Resuming {self.name} after _id {last_id}")
+        else:
+            self.processed = 0
+            self.counts = dict.fromkeys(self.counters, 0)
+
+        query = await self.query()
+        # query() may bound _id itself (e.g. an ObjectId cutoff); resuming adds a lower bound
+        id_bounds = dict(query.get("_id", {}))
+        if last_id is not None:
+            query["_id"] = {**id_bounds, "$gt": last_id}
+        self.remaining = await self.db[self.collection].count_documents(query)
+        self.status = "running"
+        self.last_error = None
+        self.started_at = time.monotonic()
+        self.processed_this_run = 0
+
+        try:
+            await self._checkpoint(last_id)
+            while True:
+                if last_id is not None:
+                    query["_id"] = {**id_bounds, "$gt": last_id}
+                batch = await self.db[self.collection].find(
+                    query, self.projection
+                ).sort("_id", 1).limit(self.batch_size).to_list(length=self.batch_size)
+                if not batch:
+                    break
+
+                await self.process(batch)
+
+                last_id = batch[-1]["_id"]
+                self.processed += len(batch)
+                self.processed_this_run += len(batch)
+                self.remaining = max(0, self.remaining - len(batch))
+                await self._checkpoint(last_id)
+
+                # Throttle to target docs/sec
+                expected = self.processed_this_run / self.target_docs_per_sec
+                elapsed = time.monotonic() - self.started_at
+                if expected > elapsed:
+                    await asyncio.sleep(expected - elapsed)
+            await self.finish()
+        except asyncio.CancelledError:
+            self.status = "paused"
+            await self._checkpoint(last_id)
+            raise
+        except Exception as e:
+            self.status = "failed"
+            self.last_error = str(e)
+            logger.error(f"{self.name} stopped: {e}")
+            await self._checkpoint(last_id)
+            return
+
+        self.status = "done"
+        await self._checkpoint(last_id)
+        logger.info(f"{self.name} finished: {self.processed} processed {self.counts}")
+
+    async def _checkpoint(self, last_id):
+        await self.db.maintenance_jobs.update_one(
+            {"_id": self.name},
+            {"$set": {
+                "last_id": last_id,
+                "status": self.status,
+                "processed": self.processed,
+                "counts": self.counts,
+                "last_error": self.last_error,
+                "updated_at": datetime.now(timezone.utc).isoformat()
+            }},
+            upsert=True
+        )
+
+    def progress(self) -> dict:
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0
+        return {
+            "job": self.name,
+            "status": self.status,
+            "processed": self.processed,
+            **self.counts,
+            "remaining": self.remaining,
+            "docs_per_sec": round(self.processed_this_run / elapsed, 1) if elapsed else 0.0,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,129 @@
+"""
+Durable Mongo-backed email outbox.
+
+With EMAIL_DELIVERY=outbox the API no longer sends email itself: it inserts a
+small job document into db.email_outbox and returns. A separate process
+(outbox_worker.py) claims jobs with find_one_and_update leases in priority /
+creation order, sends them in batches and marks them sent, retries them with
+backoff, or dead-letters them after max_attempts (at once if Brevo rejected
+the payload: retrying a 4xx can't succeed). A worker that dies while
+holding a lease simply lets it expire, and another worker picks the job up.
+Sent jobs expire through the sent_ttl index (see db_indexes.py); dead ones
+are kept for inspection.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_TRANSACTIONAL = 10  # verification / password reset
+PRIORITY_NOTIFICATION = 0    # admin notifications and digests
+
+
+async def enqueue_email(db, payload: dict, description: str = "", priority: int = PRIORITY_NOTIFICATION):
+    now = datetime.now(timezone.utc)
+    await db.email_outbox.insert_one({
+        "payload": payload,
+        "description": description,
+        "priority": priority,
+        "status": "pending",
+        "attempts": 0,
+        "created_at": now,
+        "next_attempt_at": now,
+        "lease_owner": None,
+        "lease_until": None,
+    })
+
+
+class OutboxWorker:
+    """Claims outbox jobs under a lease and sends them through an EmailDispatcher"""
+
+    def __init__(self, db, dispatcher, batch_size: int = 20, lease_seconds: float = 60,
+                 max_attempts: int = 5, poll_interval: float = 1.0, retry_base_seconds: float = 30):
+        self.db = db
+        self.dispatcher = dispatcher
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.retry_base_seconds = retry_base_seconds
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.sent = 0
+        self.retried = 0
+        self.dead = 0
+
+    async def claim(self):
+        """Atomically lease the next due job: highest priority first, then oldest"""
+        now = datetime.now(timezone.utc)
+        return await self.db.email_outbox.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                # Lease of a crashed worker expired
+                {"status": "sending", "lease_until": {"$lt": now}},
+            ]},
+            {
+                "$set": {
+                    "status": "sending",
+                    "lease_owner": self.worker_id,
+                    "lease_until": now + timedelta(seconds=self.lease_seconds),
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("priority", -1), ("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def claim_batch(self) -> list:
+        jobs = []
+        while len(jobs) < self.batch_size:
+            job = await self.claim()
+            if job is None:
+                break
+            jobs.append(job)
+        return jobs
+
+    async def process(self, job) -> bool:
+        ok, transient = await self.dispatcher.deliver(job["payload"], job.get("description", ""))
+        now = datetime.now(timezone.utc)
+        owned = {"_id": job["_id"], "lease_owner": self.worker_id}
+        if ok:
+            self.sent += 1
+            update = {"$set": {"status": "sent", "sent_at": now, "lease_until": None}}
+        elif not transient or job["attempts"] >= self.max_attempts:
+            self.dead += 1
+            reason = "rejected by the mail API" if not transient else f"after {job['attempts']} attempts"
+            logger.error(f"Outbox job {job['_id']} dead-lettered {reason}: {job.get('description')}")
+            update = {"$set": {"status": "dead", "failed_at": now, "lease_until": None}}
+        else:
+            self.retried += 1
+            delay = self.retry_base_seconds * (2 ** (job["attempts"] - 1))
+            update = {"$set": {"status": "pending", "next_attempt_at": now + timedelta(seconds=delay), "lease_until": None}}
+        await self.db.email_outbox.update_one(owned, update)
+        return ok
+
+    async def run_once(self) -> int:
+        """Claim and send one batch; returns the number of jobs processed"""
+        jobs = await self.claim_batch()
+        if jobs:
+            await asyncio.gather(*[self.process(job) for job in jobs])
+        return len(jobs)
+
+    async def run(self, stop: asyncio.Event = None):
+        logger.info(f"Outbox worker {self.worker_id} started")
+        while stop is None or not stop.is_set():
+            try:
+                processed = await self.run_once()
+            except Exception as e:
+                logger.error(f"Outbox worker error: {e}")
+                processed = 0
+            if not processed:
+                await asyncio.sleep(self.poll_interval)
+
+    def stats(self) -> dict:
+        return {"worker_id": self.worker_id, "sent": self.sent, "retried": self.retried, "dead": self.dead}
@@ -0,0 +1,63 @@
+"""
+Standalone email outbox worker.
+
+Run next to the API when EMAIL_DELIVERY=outbox:
+
+    cd backend && python outbox_worker.py
+"""
+import asyncio
+import logging
+import os
+import signal
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from email_dispatcher import EmailDispatcher, BREVO_API_URL
+from outbox import OutboxWorker
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    # Retries are owned by the outbox (attempts + backoff), so the dispatcher only tries once
+    dispatcher = EmailDispatcher(
+        api_key=os.environ.get('BREVO_API_KEY', '').strip(),
+        api_url=os.environ.get('BREVO_API_URL', BREVO_API_URL),
+        workers=int(os.environ.get('OUTBOX_BATCH_SIZE', 20)),
+        timeout=float(os.environ.get('EMAIL_TIMEOUT_SECONDS', 10)),
+        max_retries=0
+    )
+    await dispatcher.open()
+    worker = OutboxWorker(
+        db, dispatcher,
+        batch_size=int(os.environ.get('OUTBOX_BATCH_SIZE', 20)),
+        lease_seconds=float(os.environ.get('OUTBOX_LEASE_SECONDS', 60)),
+        max_attempts=int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 5))
+    )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    try:
+        await worker.run(stop)
+    finally:
+        logger.info(f"Outbox worker stopping: {worker.stats()}")
+        await dispatcher.close()
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
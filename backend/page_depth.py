@@ -0,0 +1,74 @@
+"""
+Page depth in the navigation flow, used for the "deepest page" analytics.
+
+Users store a numeric deepest_page_depth that /api/track-page raises with
+$max in the same atomic update as the visit counters, so there is no
+read-modify-write. Older documents only have the deepest_page path;
+backfill_page_depth() derives the number for them. Run it once:
+
+    cd backend && python page_depth.py
+"""
+import asyncio
+import logging
+import os
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+PAGE_DEPTH_ORDER = [
+    '/',
+    '/information',
+    '/personal-info',
+    '/retirement-overview',
+    '/income',
+    '/costs',
+    '/assets-savings',
+    '/retirement-parameters',
+    '/data-review',
+    '/capital-setup',
+    '/result'
+]
+
+PAGE_DEPTH = {page: depth for depth, page in enumerate(PAGE_DEPTH_ORDER)}
+
+
+def get_page_depth(page_path: str) -> int:
+    """Get the depth/order of a page in the navigation flow, -1 for unknown pages"""
+    return PAGE_DEPTH.get(page_path, -1)
+
+
+def deepest_page_of(user: dict):
+    """Deepest page path of a user document, preferring the numeric depth"""
+    depth = user.get("deepest_page_depth")
+    # -1 only means pages outside the flow were seen: a legacy path not backfilled yet still counts
+    if depth is None or depth < 0:
+        return user.get("deepest_page")
+    return PAGE_DEPTH_ORDER[depth] if depth < len(PAGE_DEPTH_ORDER) else None
+
+
+async def backfill_page_depth(db) -> dict:
+    """Set deepest_page_depth from the legacy deepest_page path; idempotent and safe next to live traffic"""
+    updated = {}
+    for page, depth in PAGE_DEPTH.items():
+        # $max rather than $set: never lower a depth already raised by /api/track-page
+        result = await db.access.update_many({"deepest_page": page}, {"$max": {"deepest_page_depth": depth}})
+        updated[page] = result.modified_count
+    logger.info(f"Backfilled deepest_page_depth: {sum(updated.values())} users updated {updated}")
+    return updated
+
+
+async def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    try:
+        await backfill_page_depth(client[os.environ['DB_NAME']])
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(main())
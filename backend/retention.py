@@ -0,0 +1,207 @@
+"""
+Tiered retention for append-only analytics events (page_visits, login_events).
+
+ArchiveJob streams events older than RETENTION_DAYS in _id order (the
+ObjectId carries the insert time, so the cutoff is an _id bound on the
+primary index), writes each batch as compressed files partitioned by event
+day through pandas, and only then deletes the archived documents in
+bounded delete_many batches. Files are named after the batch's first _id,
+so a batch retried after a crash overwrites its own files instead of
+duplicating rows.
+
+    <ARCHIVE_DIR>/<collection>/date=YYYY-MM-DD/part-<first _id>.parquet
+
+(ARCHIVE_DIR defaults to backend/archive.)
+
+Parquet (zstd) needs pyarrow; without it the files are JSON lines
+compressed with zstd (zstandard package) or, failing that, gzip.
+iter_archive() reads the partitions of a date range lazily for historical
+reports. Also runnable from cron:
+
+    cd backend && python retention.py
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import bson
+import pandas as pd
+from bson import ObjectId
+
+from maintenance import BatchJob
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow  # noqa: F401
+    ARCHIVE_FORMAT = "parquet"
+except ImportError:
+    try:
+        import zstandard  # noqa: F401
+        ARCHIVE_FORMAT = "jsonl.zst"
+    except ImportError:
+        ARCHIVE_FORMAT = "jsonl.gz"
+
+ARCHIVED_COLLECTIONS = ("page_visits", "login_events")
+DEFAULT_ARCHIVE_DIR = Path(__file__).parent / 'archive'
+
+
+def archive_root(archive_dir=None) -> Path:
+    return Path(archive_dir or os.environ.get('ARCHIVE_DIR') or DEFAULT_ARCHIVE_DIR)
+
+
+def _event_day(doc: dict) -> str:
+    """UTC day of an event: its ISO timestamp, else the ObjectId insert time"""
+    timestamp = doc.get("timestamp")
+    if isinstance(timestamp, str):
+        try:
+            at = datetime.fromisoformat(timestamp)
+            if at.tzinfo is None:
+                at = at.replace(tzinfo=timezone.utc)
+            return at.astimezone(timezone.utc).strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    return doc["_id"].generation_time.strftime("%Y-%m-%d")
+
+
+def write_partition(path: Path, rows: list):
+    """Write rows as one compressed file; path is given without extension"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    frame = pd.DataFrame.from_records(rows)
+    if ARCHIVE_FORMAT == "parquet":
+        target = path.with_name(path.name + ".parquet")
+        frame.to_parquet(target, compression="zstd", index=False)
+    else:
+        target = path.with_name(f"{path.name}.{ARCHIVE_FORMAT}")
+        compression = "zstd" if ARCHIVE_FORMAT == "jsonl.zst" else "gzip"
+        frame.to_json(target, orient="records", lines=True, compression=compression)
+    return target.stat().st_size
+
+
+def read_partition(path: Path, columns=None) -> pd.DataFrame:
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path, columns=columns)
+    compression = "zstd" if path.name.endswith(".zst") else "gzip"
+    frame = pd.read_json(path, orient="records", lines=True, compression=compression, dtype=False)
+    return frame[columns] if columns else frame
+
+
+def iter_archive(collection: str, start_day: str = None, end_day: str = None, columns=None, archive_dir: Path = None):
+    """
+    Lazily yield one DataFrame per archived file of `collection` whose
+    partition day is within [start_day, end_day] (YYYY-MM-DD, inclusive).
+    Partitions outside the range are never opened.
+    """
+    root = archive_root(archive_dir) / collection
+    if not root.is_dir():
+        return
+    for partition in sorted(root.glob("date=*")):
+        day = partition.name[len("date="):]
+        if (start_day and day < start_day) or (end_day and day > end_day):
+            continue
+        for part in sorted(partition.glob("part-*")):
+            yield read_partition(part, columns)
+
+
+def archived_days(collection: str, archive_dir: Path = None) -> list:
+    """Sorted partition days (YYYY-MM-DD) holding at least one archived file of `collection`"""
+    root = archive_root(archive_dir) / collection
+    if not root.is_dir():
+        return []
+    return sorted(
+        partition.name[len("date="):] for partition in root.glob("date=*")
+        if any(partition.glob("part-*"))
+    )
+
+
+def archived_daily_counts(collection: str, start_day: str, end_day: str, by: str = None, archive_dir: Path = None) -> dict:
+    """{day: rows} (or {day: {value of `by`: rows}}) over the archives, one file in memory at a time"""
+    counts = {}
+    columns = ["timestamp", by] if by else ["timestamp"]
+    for frame in iter_archive(collection, start_day, end_day, columns, archive_dir):
+        days = pd.to_datetime(frame["timestamp"], utc=True, format="ISO8601").dt.strftime("%Y-%m-%d")
+        if by:
+            for (day, value), n in frame.groupby([days, frame[by].fillna("")]).size().items():
+                counts.setdefault(day, {})
+                counts[day][value] = counts[day].get(value, 0) + int(n)
+        else:
+            for day, n in days.value_counts().items():
+                counts[day] = counts.get(day, 0) + int(n)
+    return dict(sorted(counts.items()))
+
+
+class ArchiveJob(BatchJob):
+    """Moves one collection's events older than retention_days to compressed archive files"""
+
+    counters = ("archived", "files_written", "bytes_written", "bytes_reclaimed")
+
+    def __init__(self, db, collection: str, retention_days: int = 180, archive_dir: Path = None,
+                 delete_batch_size: int = 1000, batch_size: int = 5000, target_docs_per_sec: float = 5000):
+        super().__init__(db, batch_size=batch_size, target_docs_per_sec=target_docs_per_sec)
+        self.name = f"archive_{collection}"
+        self.collection = collection
+        self.retention_days = retention_days
+        self.archive_dir = archive_root(archive_dir)
+        self.delete_batch_size = delete_batch_size
+        self.cutoff = None
+
+    async def query(self) -> dict:
+        self.cutoff = datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+        return {"_id": {"$lt": ObjectId.from_datetime(self.cutoff)}}
+
+    def _write_batch(self, batch: list):
+        partitions = {}
+        for doc in batch:
+            row = dict(doc)
+            row["_id"] = str(row["_id"])
+            partitions.setdefault(_event_day(doc), []).append(row)
+        part = f"part-{batch[0]['_id']}"
+        written = 0
+        for day, rows in partitions.items():
+            written += write_partition(self.archive_dir / self.collection / f"date={day}" / part, rows)
+        return len(partitions), written
+
+    async def process(self, batch: list):
+        # Files first: if we stop in between, the documents are still there and the batch is redone
+        files, written = await asyncio.to_thread(self._write_batch, batch)
+        ids = [doc["_id"] for doc in batch]
+        for i in range(0, len(ids), self.delete_batch_size):
+            await self.db[self.collection].delete_many({"_id": {"$in": ids[i:i + self.delete_batch_size]}})
+        self.counts["archived"] += len(batch)
+        self.counts["files_written"] += files
+        self.counts["bytes_written"] += written
+        self.counts["bytes_reclaimed"] += sum(len(bson.encode(doc)) for doc in batch)
+
+    def progress(self) -> dict:
+        return {
+            **super().progress(),
+            "collection": self.collection,
+            "format": ARCHIVE_FORMAT,
+            "cutoff": self.cutoff.isoformat() if self.cutoff else None,
+        }
+
+
+def archive_jobs(db, **kwargs) -> list:
+    return [ArchiveJob(db, collection, **kwargs) for collection in ARCHIVED_COLLECTIONS]
+
+
+async def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    try:
+        jobs = archive_jobs(client[os.environ['DB_NAME']], retention_days=int(os.environ.get('RETENTION_DAYS', 180)))
+        await asyncio.gather(*[job.start() for job in jobs])
+        for job in jobs:
+            logger.info(f"{job.collection}: {job.progress()}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(main())
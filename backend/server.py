@@ -4,22 +4,51 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import os
+import re
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
 from typing import List, Optional
 import uuid
-from datetime import datetime, timezone, timedelta
-import bcrypt
+from datetime import date, datetime, timezone, timedelta
 import jwt
 import json
 import pandas as pd
 import csv
 import traceback
-import requests
 import secrets
-from cryptography.fernet import Fernet
+from cryptography.fernet import MultiFernet
+from password_hashing import PasswordHasher
+from geolocation import GeoResolver
+from geo_offline import OfflineGeoResolver
+from token_cache import TokenCache
+from user_cache import UserCache
+from key_rotation import KeyRotationJob, parse_fernet_keys
+from admission import AdmissionController, AdmissionRejected, FailureWindow
+from db_indexes import ensure_indexes, check_query_plans
+from email_dispatcher import EmailDispatcher, BREVO_API_URL
+from admin_digest import AdminDigest
+from outbox import enqueue_email, PRIORITY_TRANSACTIONAL, PRIORITY_NOTIFICATION
+from campaigns import CampaignJob, AUDIENCES
+from page_depth import get_page_depth, deepest_page_of
+from write_behind import WriteBehindBuffer, IncrementBuffer
+from visit_buckets import (
+    VisitBucketBuffer, BucketBackfillJob, STORAGE_MODES, BUCKET_COLLECTION,
+    mark_bucketing_started, delete_user_buckets, page_analytics
+)
+from funnel import FunnelRebuildJob, FUNNEL_COLLECTION, funnel_increments, funnel_report
+from retention import ARCHIVED_COLLECTIONS, archive_jobs, archived_daily_counts
+from event_coalescer import EventCoalescer, COUNTER_COLLECTION, counter_increments, anonymous_event_report
+from active_users import ActiveUserCounter, ACTIVE_USERS_COLLECTION
+from cohorts import (
+    CohortBackfillJob, COHORT_COLLECTION, COHORT_MAX_WEEKS, cohort_increments, cohort_matrix,
+    mark_cohort_weeks, week_offset, week_start
+)
+from sessions import SESSION_COLLECTION, SessionizeJob, sessionize_periodically, session_stats
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -35,6 +64,8 @@ logger = logging.getLogger(__name__)
 mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
+# Set at startup once ensure_indexes() confirms the unique index on access.email
+unique_email_index = False
 
 # Create the main app without a prefix
 app = FastAPI()
@@ -47,15 +78,20 @@ security = HTTPBearer()
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24 * 7  # 1 week
+# Decoded claims of recently seen tokens, so chatty endpoints skip jwt.decode
+token_cache = TokenCache(max_size=int(os.environ.get('TOKEN_CACHE_SIZE', 10000)))
 
 # Admin Secret Key - Change this in production!
 ADMIN_SECRET_KEY = os.environ.get('ADMIN_SECRET_KEY', 'quit-admin-2024-secret')
 
 # Master Key Encryption - For encrypting user master keys in MongoDB
+# Comma-separated keys, newest first: encryption uses the first, decryption tries all (key rotation)
 SERVER_ENCRYPTION_KEY = os.environ.get('SERVER_ENCRYPTION_KEY', '')
 if not SERVER_ENCRYPTION_KEY:
     logger.warning("SERVER_ENCRYPTION_KEY not set! Master key encryption will fail.")
-fernet = Fernet(SERVER_ENCRYPTION_KEY.encode()) if SERVER_ENCRYPTION_KEY else None
+fernet_keys = parse_fernet_keys(SERVER_ENCRYPTION_KEY)
+fernet = MultiFernet(fernet_keys) if fernet_keys else None
+key_rotation_job = None
 
 @app.middleware("http")
 async def catch_exceptions_middleware(request: Request, call_next):
@@ -161,6 +197,10 @@ class AdminStatsResponse(BaseModel):
 class PageVisitRequest(BaseModel):
     page_path: str
     session_id: Optional[str] = None
+    client_timestamp: Optional[str] = None  # ISO 8601, when the page was shown
+
+class PageVisitBatchRequest(BaseModel):
+    visits: List[PageVisitRequest]
 
 class DemoTrackRequest(BaseModel):
     language: str
@@ -168,35 +208,45 @@ class DemoTrackRequest(BaseModel):
 class TrackEventRequest(BaseModel):
     event_type: str
 
-# Page navigation order (for determining "deepest" page)
-PAGE_DEPTH_ORDER = [
-    '/',
-    '/information',
-    '/personal-info',
-    '/retirement-overview',
-    '/income',
-    '/costs',
-    '/assets-savings',
-    '/retirement-parameters',
-    '/data-review',
-    '/capital-setup',
-    '/result'
-]
-
-def get_page_depth(page_path: str) -> int:
-    """Get the depth/order of a page in the navigation flow"""
-    try:
-        return PAGE_DEPTH_ORDER.index(page_path)
-    except ValueError:
-        return -1  # Unknown page
+# Campaign models
+class CampaignRequest(BaseModel):
+    subject: str
+    html_content: str = ""  # Optional for "unverified": a re-verification reminder is generated
+    audience: str = "verified"  # "verified" or "unverified"
 
 # Auth helpers
-def hash_password(password: str) -> str:
-    # rounds=10 is still very secure and ~4x faster than default 12 on low-CPU hosts
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=10)).decode('utf-8')
+# bcrypt runs in a dedicated process pool so logins don't block the event loop
+password_hasher = PasswordHasher()
+
+# Admission control in front of bcrypt: bounded concurrency + short queue, then fast 503
+password_admission = AdmissionController(
+    max_concurrency=int(os.environ.get('PASSWORD_MAX_CONCURRENCY', password_hasher.max_workers)),
+    max_queue=int(os.environ.get('PASSWORD_MAX_QUEUE', 16)),
+    max_wait=float(os.environ.get('PASSWORD_MAX_WAIT_SECONDS', 2))
+)
+# Failed logins per IP / per email in a sliding window, checked before any bcrypt work
+login_failures_by_ip = FailureWindow(
+    limit=int(os.environ.get('LOGIN_MAX_FAILURES_PER_IP', 20)),
+    window=float(os.environ.get('LOGIN_FAILURE_WINDOW_SECONDS', 900))
+)
+login_failures_by_email = FailureWindow(
+    limit=int(os.environ.get('LOGIN_MAX_FAILURES_PER_EMAIL', 5)),
+    window=float(os.environ.get('LOGIN_FAILURE_WINDOW_SECONDS', 900))
+)
+
+async def hash_password(password: str) -> str:
+    try:
+        async with password_admission.slot():
+            return await password_hasher.hash(password)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": str(e.retry_after)})
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+async def verify_password(password: str, hashed: str) -> bool:
+    try:
+        async with password_admission.slot():
+            return await password_hasher.verify(password, hashed)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": str(e.retry_after)})
 
 def create_verification_token(email: str) -> str:
     """Create a short-lived token for email verification"""
@@ -277,9 +327,17 @@ def create_token(email: str) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+def decode_auth_token(token: str) -> dict:
+    """Decode and verify a JWT, reusing cached claims for tokens seen before"""
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        token_cache.set(token, payload)
+    return payload
+
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
     try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        payload = decode_auth_token(credentials.credentials)
         # Ensure it's an auth token
         if payload.get('type') and payload.get('type') != 'auth':
              raise HTTPException(status_code=401, detail="Invalid token type")
@@ -290,176 +348,233 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security))
         raise HTTPException(status_code=401, detail="Invalid token")
 
 # Helper for IP Geolocation
-def get_location_from_ip(ip_address: str) -> str:
-    if not ip_address or ip_address == "127.0.0.1":
-         return "Localhost"
-    try:
-        # Using ip-api.com (Free for non-commercial, 45req/min)
-        response = requests.get(f"http://ip-api.com/json/{ip_address}?fields=country,city", timeout=3)
-        if response.status_code == 200:
-            data = response.json()
-            return f"{data.get('city', 'Unknown')}, {data.get('country', 'Unknown')}"
-    except Exception:
-        pass
-    return "Unknown"
-
-def send_verification_email(to_email: str, token: str):
-    # Brevo API Logic
+# Using ip-api.com (Free for non-commercial, 45req/min) through a cached, rate-limited async resolver,
+# or a local range CSV when GEO_BACKEND=offline (GEO_DB_PATH)
+if os.environ.get('GEO_BACKEND', 'ip-api') == 'offline':
+    geo_resolver = OfflineGeoResolver()
+else:
+    geo_resolver = GeoResolver()
+
+async def get_location_from_ip(ip_address: str) -> str:
+    return await geo_resolver.resolve(ip_address)
+
+# Transactional emails go through an async queue + worker pool (see email_dispatcher.py)
+email_dispatcher = EmailDispatcher(
     # We strip() to remove any accidental whitespace/newlines from the env var
-    api_key = os.environ.get('BREVO_API_KEY', '').strip()
+    api_key=os.environ.get('BREVO_API_KEY', '').strip(),
+    api_url=os.environ.get('BREVO_API_URL', BREVO_API_URL),
+    workers=int(os.environ.get('EMAIL_WORKERS', 4)),
+    queue_size=int(os.environ.get('EMAIL_QUEUE_SIZE', 1000)),
+    timeout=float(os.environ.get('EMAIL_TIMEOUT_SECONDS', 10)),
+    # Bulkhead shared by the queue workers and direct sends (outbox, campaigns)
+    max_concurrency=int(os.environ.get('EMAIL_MAX_CONCURRENCY', 8))
+)
+# "direct": send from this process; "outbox": persist jobs in db.email_outbox for outbox_worker.py
+EMAIL_DELIVERY = os.environ.get('EMAIL_DELIVERY', 'direct')
+
+async def deliver_email(payload: dict, description: str, fallback: str = "", priority: int = PRIORITY_NOTIFICATION):
+    if EMAIL_DELIVERY == 'outbox':
+        await enqueue_email(db, payload, description, priority)
+    else:
+        email_dispatcher.enqueue(payload, description, fallback)
+
+async def send_verification_email(to_email: str, token: str):
+    # Brevo API Logic
     frontend_url = os.environ.get('FRONTEND_URL', 'http://localhost:3000').rstrip('/')
+    verification_link = f"{frontend_url}/verify?token={token}"
     
-    if not api_key:
+    if not email_dispatcher.enabled:
         logger.warning("Brevo API Key not found, printing to console instead")
-        mock_link = f"{frontend_url}/verify?token={token}"
-        print(f"\n{'='*50}\nTo: {to_email}\nLink: {mock_link}\n{'='*50}\n")
+        print(f"\n{'='*50}\nTo: {to_email}\nLink: {verification_link}\n{'='*50}\n")
         return
 
-    try:
-        verification_link = f"{frontend_url}/verify?token={token}"
-        
-        # Brevo API Endpoint
-        # V3 endpoint for transactional emails
-        url = "https://api.brevo.com/v3/smtp/email"
-        
-        # Headers
-        headers = {
-            "accept": "application/json",
-            "api-key": api_key,
-            "content-type": "application/json"
-        }
-        
-        # Sender - must be verified in Brevo. Using SMTP_EMAIL as the sender.
-        # Fallback to no-reply if empty (though Brevo might reject unverified senders)
-        sender_email = os.environ.get('SMTP_EMAIL', 'no-reply@retirenow.com')
-        
-        payload = {
-            "sender": {"name": "Can I Quit App", "email": sender_email},
-            "to": [{"email": to_email}],
-            "subject": "Verify your Can I Quit? account",
-            "htmlContent": f"""
-                <h1>Welcome to Can I Quit?</h1>
-                <p>Please click the link below to verify your email address:</p>
-                <p><a href="{verification_link}">Verify Email</a></p>
-                <p>Or copy this link: {verification_link}</p>
-                <p>This link expires in 24 hours.</p>
-            """
-        }
-        
-        response = requests.post(url, json=payload, headers=headers)
-        
-        if response.status_code in [200, 201, 202]:
-            logger.info(f"Verification email sent to {to_email} via Brevo")
-            # Force print for visibility in Render logs
-            print(f"\n{'='*20} MANUAL VERIFICATION LINK {'='*20}", flush=True)
-            print(f"DEBUG_LINK: {verification_link}", flush=True)
-            print(f"{'='*60}\n", flush=True)
-        else:
-            logger.error(f"Brevo API Error: {response.status_code} - {response.text}")
-            # Fallback to console print
-            print(f"FAILED TO SEND EMAIL VIA BREVO: {response.text}")
-            print(f"BACKUP LINK: {verification_link}")
-
-    except Exception as e:
-        logger.error(f"Failed to send email: {e}")
-        # Don't crash registration if email fails, but log it
-        print(f"FAILED TO SEND EMAIL: {e}")
-        # Print link as backup
-        print(f"BACKUP LINK: {frontend_url}/verify?token={token}")
+    # Sender - must be verified in Brevo. Using SMTP_EMAIL as the sender.
+    # Fallback to no-reply if empty (though Brevo might reject unverified senders)
+    sender_email = os.environ.get('SMTP_EMAIL', 'no-reply@retirenow.com')
+    
+    payload = {
+        "sender": {"name": "Can I Quit App", "email": sender_email},
+        "to": [{"email": to_email}],
+        "subject": "Verify your Can I Quit? account",
+        "htmlContent": f"""
+            <h1>Welcome to Can I Quit?</h1>
+            <p>Please click the link below to verify your email address:</p>
+            <p><a href="{verification_link}">Verify Email</a></p>
+            <p>Or copy this link: {verification_link}</p>
+            <p>This link expires in 24 hours.</p>
+        """
+    }
+    
+    # Don't crash registration if email fails; the link is logged as backup
+    await deliver_email(payload, f"verification email to {to_email}", f"BACKUP LINK: {verification_link}", PRIORITY_TRANSACTIONAL)
 
-def send_password_reset_email(to_email: str, token: str):
+async def send_password_reset_email(to_email: str, token: str):
     """Send password reset email via Brevo"""
-    api_key = os.environ.get('BREVO_API_KEY', '').strip()
     frontend_url = os.environ.get('FRONTEND_URL', 'http://localhost:3000').rstrip('/')
+    reset_link = f"{frontend_url}/reset-password?token={token}"
     
-    if not api_key:
+    if not email_dispatcher.enabled:
         logger.warning("Brevo API Key not found, printing to console instead")
-        mock_link = f"{frontend_url}/reset-password?token={token}"
-        print(f"\n{'='*50}\nPassword Reset Link\nTo: {to_email}\nLink: {mock_link}\n{'='*50}\n")
+        print(f"\n{'='*50}\nPassword Reset Link\nTo: {to_email}\nLink: {reset_link}\n{'='*50}\n")
         return
 
-    try:
-        reset_link = f"{frontend_url}/reset-password?token={token}"
-        
-        url = "https://api.brevo.com/v3/smtp/email"
-        headers = {
-            "accept": "application/json",
-            "api-key": api_key,
-            "content-type": "application/json"
-        }
-        
-        sender_email = os.environ.get('SMTP_EMAIL', 'no-reply@retirenow.com')
-        
-        payload = {
-            "sender": {"name": "Can I Quit App", "email": sender_email},
-            "to": [{"email": to_email}],
-            "subject": "Reset your Can I Quit? password",
-            "htmlContent": f"""
-                <h1>Password Reset Request</h1>
-                <p>You requested to reset your password for Can I Quit?</p>
-                <p>Click the link below to reset your password:</p>
-                <p><a href="{reset_link}">Reset Password</a></p>
-                <p>Or copy this link: {reset_link}</p>
-                <p>This link expires in 1 hour.</p>
-                <p>If you didn't request this, please ignore this email.</p>
-            """
-        }
-        
-        response = requests.post(url, json=payload, headers=headers)
-        
-        if response.status_code in [200, 201, 202]:
-            logger.info(f"Password reset email sent to {to_email} via Brevo")
-            print(f"\n{'='*20} MANUAL RESET LINK {'='*20}", flush=True)
-            print(f"DEBUG_LINK: {reset_link}", flush=True)
-            print(f"{'='*60}\n", flush=True)
-        else:
-            logger.error(f"Brevo API Error: {response.status_code} - {response.text}")
-            print(f"FAILED TO SEND EMAIL VIA BREVO: {response.text}")
-            print(f"BACKUP LINK: {reset_link}")
-
-
-    except Exception as e:
-        logger.error(f"Failed to send password reset email: {e}")
-        print(f"FAILED TO SEND EMAIL: {e}")
-        print(f"BACKUP LINK: {frontend_url}/reset-password?token={token}")
+    sender_email = os.environ.get('SMTP_EMAIL', 'no-reply@retirenow.com')
+    
+    payload = {
+        "sender": {"name": "Can I Quit App", "email": sender_email},
+        "to": [{"email": to_email}],
+        "subject": "Reset your Can I Quit? password",
+        "htmlContent": f"""
+            <h1>Password Reset Request</h1>
+            <p>You requested to reset your password for Can I Quit?</p>
+            <p>Click the link below to reset your password:</p>
+            <p><a href="{reset_link}">Reset Password</a></p>
+            <p>Or copy this link: {reset_link}</p>
+            <p>This link expires in 1 hour.</p>
+            <p>If you didn't request this, please ignore this email.</p>
+        """
+    }
+    
+    await deliver_email(payload, f"password reset email to {to_email}", f"BACKUP LINK: {reset_link}", PRIORITY_TRANSACTIONAL)
 
-def send_admin_notification(subject: str, html_content: str):
+async def send_admin_notification(subject: str, html_content: str):
     """Send a notification email to the administrator via Brevo"""
-    api_key = os.environ.get('BREVO_API_KEY', '').strip()
     # Default to SMTP_EMAIL if ADMIN_EMAIL is not set
     admin_email = os.environ.get('ADMIN_EMAIL', os.environ.get('SMTP_EMAIL', '')).strip()
     
-    if not api_key or not admin_email:
+    if not email_dispatcher.enabled or not admin_email:
         logger.warning("Brevo API Key or Admin Email not found. Skipping admin notification.")
         print(f"\n{'='*50}\n[MOCK ADMIN EMAIL]\nTo: {admin_email}\nSubject: {subject}\n{'='*50}\n")
         return
 
-    try:
-        url = "https://api.brevo.com/v3/smtp/email"
-        headers = {
-            "accept": "application/json",
-            "api-key": api_key,
-            "content-type": "application/json"
-        }
-        
-        sender_email = os.environ.get('SMTP_EMAIL', 'no-reply@retirenow.com')
-        
-        payload = {
-            "sender": {"name": "Can I Quit App (System)", "email": sender_email},
-            "to": [{"email": admin_email}],
-            "subject": subject,
-            "htmlContent": html_content
-        }
-        
-        response = requests.post(url, json=payload, headers=headers)
-        
-        if response.status_code in [200, 201, 202]:
-            logger.info(f"Admin notification sent to {admin_email}: {subject}")
-        else:
-            logger.error(f"Failed to send admin notification: {response.text}")
+    sender_email = os.environ.get('SMTP_EMAIL', 'no-reply@retirenow.com')
+    
+    payload = {
+        "sender": {"name": "Can I Quit App (System)", "email": sender_email},
+        "to": [{"email": admin_email}],
+        "subject": subject,
+        "htmlContent": html_content
+    }
+    
+    await deliver_email(payload, f"admin notification to {admin_email}: {subject}")
+
+# Analytics events (page visits, logins) are written behind the request in insert_many batches
+def make_event_buffer(collection: str, buffer_class=WriteBehindBuffer) -> WriteBehindBuffer:
+    """Analytics write-behind buffer for `collection`, sized by the ANALYTICS_* settings"""
+    return buffer_class(
+        collection,
+        lambda: db[collection],
+        max_batch=int(os.environ.get('ANALYTICS_BATCH_SIZE', 100)),
+        max_age=float(os.environ.get('ANALYTICS_FLUSH_SECONDS', 1)),
+        max_buffer=int(os.environ.get('ANALYTICS_BUFFER_SIZE', 10000)),
+        overflow=os.environ.get('ANALYTICS_OVERFLOW', 'drop')
+    )
 
-    except Exception as e:
-        logger.error(f"Exception sending admin notification: {e}")
+page_visits_buffer = make_event_buffer("page_visits")
+login_events_buffer = make_event_buffer("login_events")
+
+# Page visits go to per-document page_visits, per-user-per-day buckets, or both (see visit_buckets.py)
+PAGE_VISIT_STORAGE = os.environ.get('PAGE_VISIT_STORAGE', 'both')
+if PAGE_VISIT_STORAGE not in STORAGE_MODES:
+    raise ValueError(f"PAGE_VISIT_STORAGE must be one of {STORAGE_MODES}")
+visit_bucket_buffer = make_event_buffer(BUCKET_COLLECTION, VisitBucketBuffer)
+bucket_backfill_job = None
+
+# Daily funnel counters, $inc'ed in batches whenever a visit raises a user's depth (see funnel.py)
+funnel_buffer = make_event_buffer(FUNNEL_COLLECTION, IncrementBuffer)
+funnel_rebuild_job = None
+# Archiving of analytics events older than RETENTION_DAYS (see retention.py)
+retention_jobs = []
+# Session summaries, refreshed incrementally every SESSIONIZE_INTERVAL seconds (0 disables the schedule)
+SESSIONIZE_INTERVAL = float(os.environ.get('SESSIONIZE_INTERVAL', 300))
+sessionize_job = None
+sessionize_task = None
+
+def get_sessionize_job() -> SessionizeJob:
+    global sessionize_job
+    if sessionize_job is None:
+        sessionize_job = SessionizeJob(
+            db,
+            settle_seconds=float(os.environ.get('SESSIONIZE_SETTLE_SECONDS', 120)),
+            batch_size=int(os.environ.get('SESSIONIZE_BATCH_SIZE', 2000))
+        )
+    return sessionize_job
+
+# DAU/WAU/MAU: per-day HyperLogLog sketches fed by logins and page views (see active_users.py)
+ACTIVE_USERS_MAX_DAYS = int(os.environ.get('ACTIVE_USERS_MAX_DAYS', 366))
+active_users = ActiveUserCounter(
+    lambda: db[ACTIVE_USERS_COLLECTION],
+    p=int(os.environ.get('ACTIVE_USERS_PRECISION', 14)),
+    flush_seconds=float(os.environ.get('ACTIVE_USERS_FLUSH_SECONDS', 10))
+)
+
+# Weekly cohort retention counters, $inc'ed on signup and on a user's first login of a week (see cohorts.py)
+cohort_buffer = make_event_buffer(COHORT_COLLECTION, IncrementBuffer)
+cohort_backfill_job = None
+
+async def record_cohort_login(email: str, week: int):
+    """Count the user as returned in week W+week of their cohort, once"""
+    marked = await mark_cohort_weeks(db, {"email": email}, 1 << week)
+    if marked is None:
+        return
+    created_at, new_bits, signup = marked
+    if new_bits or signup:
+        await cohort_buffer.add(cohort_increments(created_at, new_bits, signup))
+
+# Admin notifications are batched into one digest per window; urgent types are sent straight away
+admin_digest = AdminDigest(
+    send_admin_notification,
+    window_seconds=float(os.environ.get('ADMIN_DIGEST_WINDOW_SECONDS', 3600)),
+    max_events=int(os.environ.get('ADMIN_DIGEST_MAX_EVENTS', 200)),
+    urgent_types=[t.strip() for t in os.environ.get('ADMIN_DIGEST_URGENT_TYPES', '').split(',') if t.strip()]
+)
+
+async def notify_admin(event_type: str, subject: str, html_content: str, ip: str = None, location: str = None):
+    """Queue an admin notification for the next digest (or send it now if its type is urgent)"""
+    await admin_digest.add(event_type, subject, html_content, ip=ip, location=location)
+
+# Anonymous /track-demo and /track-event traffic: daily $inc counters (see event_coalescer.py)
+anonymous_event_counters = make_event_buffer(COUNTER_COLLECTION, IncrementBuffer)
+
+async def handle_anonymous_event(record: dict):
+    """One counter update, geolocation lookup and admin notification per coalesced (ip, event) record"""
+    await anonymous_event_counters.add(counter_increments(record))
+    ip, event, count = record["ip"], record["event_type"], record["count"]
+    location = await get_location_from_ip(ip)
+
+    if event == "demo_view":
+        subject = f"Demo view by {ip}"
+        title = "Demo View"
+    elif event == "create_account_link":
+        subject = f"Create account link used by {ip}"
+        title = "Create Account Link Clicked"
+    elif event == "create_account_action":
+        subject = f"Create account action used by {ip}"
+        title = "Create Account Action Triggered"
+    else:
+        subject = f"Event {event} by {ip}"
+        title = f"Event: {event}"
+    if count > 1:
+        subject += f" ({count} times)"
+
+    details = ", ".join(f"{d.upper()} x{n}" for d, n in record["details"].items())
+    admin_content = f"""
+        <h1>{title}</h1>
+        {f"<p><strong>Language:</strong> {details}</p>" if details else ""}
+        <p><strong>Time:</strong> {record["first_seen"]}{f" to {record['last_seen']} ({count} times)" if count > 1 else ""}</p>
+        <p><strong>IP Address:</strong> {ip}</p>
+        <p><strong>Location:</strong> {location}</p>
+    """
+    await notify_admin(event, subject, admin_content, ip=ip, location=location)
+
+# Repeats of the same (ip, event type) within the window become one counted record
+anonymous_events = EventCoalescer(
+    handle_anonymous_event,
+    window_seconds=float(os.environ.get('ANONYMOUS_EVENT_WINDOW_SECONDS', 300)),
+    max_keys=int(os.environ.get('ANONYMOUS_EVENT_MAX_KEYS', 10000)),
+    # Lookups beyond the geolocation bulkhead would come back "Unknown"
+    max_concurrency=int(os.environ.get('ANONYMOUS_EVENT_CONCURRENCY', os.environ.get('GEO_MAX_CONCURRENCY', 5)))
+)
 
 
 # Routes
@@ -473,15 +588,21 @@ def verify_admin_key(admin_key: str) -> bool:
     """Verify the admin secret key (legacy - for transition only)"""
     return admin_key == ADMIN_SECRET_KEY
 
+# Short-TTL cache of user documents used by the admin authorization check
+user_cache = UserCache()
+
+async def load_user_by_email(email: str):
+    return await db.access.find_one({"email": email}, {"_id": 0, "password": 0})
+
 async def get_current_user_from_token(token: str):
     """Extract and verify user from JWT token"""
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        payload = decode_auth_token(token)
         email = payload.get('email')
         if not email:
             raise HTTPException(status_code=401, detail="Invalid token")
         
-        user = await db.access.find_one({"email": email}, {"_id": 0, "password": 0})
+        user = await user_cache.get(email, load_user_by_email)
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
         
@@ -530,6 +651,8 @@ async def promote_user_to_admin(request: AdminPromoteRequest):
         {"$set": {"role": "admin"}}
     )
     
+    user_cache.invalidate(request.email)
+    token_cache.invalidate_email(request.email)
     if result.modified_count == 0:
         raise HTTPException(status_code=500, detail="Failed to promote user")
     
@@ -558,7 +681,7 @@ async def get_all_users(admin_user: dict = Depends(require_admin)):
                 login_count=user.get("login_count", 0),
                 last_login=user.get("last_login", None),
                 last_page_visited=user.get("last_page_visited", None),
-                deepest_page=user.get("deepest_page", None),
+                deepest_page=deepest_page_of(user),
                 last_ip=user.get("last_ip", None),
                 last_device_type=user.get("last_device_type", None),
                 last_location=user.get("last_location", "Unknown"),
@@ -581,12 +704,16 @@ async def delete_user(user_id: str, admin_user: dict = Depends(require_admin)):
     """Delete a user by ID (admin only)"""
     try:
         # Delete from all collections
-        result = await db.access.delete_one({"user_id": user_id})
+        deleted = await db.access.find_one_and_delete({"user_id": user_id}, projection={"email": 1})
         await db.login_events.delete_many({"user_id": user_id})
         await db.page_visits.delete_many({"user_id": user_id})
+        await delete_user_buckets(db, user_id)
+        await db[SESSION_COLLECTION].delete_many({"user_id": user_id})
         
-        if result.deleted_count == 0:
+        if deleted is None:
             raise HTTPException(status_code=404, detail="User not found")
+        user_cache.invalidate(deleted.get("email"))
+        token_cache.invalidate_email(deleted.get("email"))
             
         logger.info(f"Admin {admin_user.get('email')} deleted user {user_id}")
         return {"success": True, "message": "User deleted successfully"}
@@ -662,6 +789,325 @@ async def save_instrument_catalog(request: Request, admin_user: dict = Depends(r
         logger.error(f"Failed to overwrite instrument catalog: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to write file: {str(e)}")
 
+@api_router.get("/admin/metrics")
+async def get_admin_metrics(admin_user: dict = Depends(require_admin)):
+    """Runtime metrics of the in-process performance subsystems (admin only)"""
+    return {
+        "password_pool": password_hasher.stats(),
+        "password_admission": password_admission.stats(),
+        "login_failures": {
+            "by_ip": login_failures_by_ip.stats(),
+            "by_email": login_failures_by_email.stats()
+        },
+        "geolocation": geo_resolver.stats(),
+        "token_cache": token_cache.stats(),
+        "user_cache": user_cache.stats(),
+        "email": email_dispatcher.stats(),
+        "admin_digest": admin_digest.stats(),
+        "write_behind": {
+            "page_visits": page_visits_buffer.stats(),
+            "page_visit_buckets": visit_bucket_buffer.stats(),
+            "funnel_daily": funnel_buffer.stats(),
+            "login_events": login_events_buffer.stats(),
+            "anonymous_events_daily": anonymous_event_counters.stats(),
+            "cohort_retention": cohort_buffer.stats()
+        },
+        "anonymous_events": anonymous_events.stats(),
+        "active_users": active_users.stats()
+    }
+
+@api_router.post("/admin/key-rotation")
+async def start_key_rotation(admin_user: dict = Depends(require_admin)):
+    """Start (or resume) re-encrypting stored master keys under the newest server key (admin only)"""
+    global key_rotation_job
+    if not fernet_keys:
+        raise HTTPException(status_code=500, detail="Server encryption not configured")
+    if key_rotation_job is None:
+        key_rotation_job = KeyRotationJob(
+            db, fernet_keys,
+            batch_size=int(os.environ.get('KEY_ROTATION_BATCH_SIZE', 500)),
+            target_ops_per_sec=float(os.environ.get('KEY_ROTATION_OPS_PER_SEC', 200))
+        )
+    if key_rotation_job.running:
+        return {"success": True, "message": "Key rotation already running", **key_rotation_job.progress()}
+    key_rotation_job.start()
+    logger.info(f"Admin {admin_user.get('email')} started master key rotation")
+    return {"success": True, "message": "Key rotation started"}
+
+@api_router.get("/admin/key-rotation")
+async def get_key_rotation_status(admin_user: dict = Depends(require_admin)):
+    """Progress of the master key rotation job (admin only)"""
+    if key_rotation_job is None:
+        checkpoint = await db.maintenance_jobs.find_one({"_id": KeyRotationJob.name}, {"_id": 0, "last_id": 0})
+        return checkpoint or {"status": "idle"}
+    return key_rotation_job.progress()
+
+@api_router.post("/admin/page-visit-buckets/backfill")
+async def start_bucket_backfill(admin_user: dict = Depends(require_admin)):
+    """Start (or resume) converting page_visits into per-user-per-day buckets (admin only)"""
+    global bucket_backfill_job
+    if bucket_backfill_job is None:
+        bucket_backfill_job = BucketBackfillJob(
+            db,
+            batch_size=int(os.environ.get('BUCKET_BACKFILL_BATCH_SIZE', 1000)),
+            target_docs_per_sec=float(os.environ.get('BUCKET_BACKFILL_DOCS_PER_SEC', 2000))
+        )
+    if bucket_backfill_job.running:
+        return {"success": True, "message": "Backfill already running", **bucket_backfill_job.progress()}
+    bucket_backfill_job.start()
+    logger.info(f"Admin {admin_user.get('email')} started the page visit bucket backfill")
+    return {"success": True, "message": "Backfill started"}
+
+@api_router.get("/admin/page-visit-buckets/backfill")
+async def get_bucket_backfill_status(admin_user: dict = Depends(require_admin)):
+    """Progress of the page visit bucket backfill (admin only)"""
+    if bucket_backfill_job is None:
+        checkpoint = await db.maintenance_jobs.find_one({"_id": BucketBackfillJob.name}, {"_id": 0, "last_id": 0})
+        return checkpoint or {"status": "idle"}
+    return bucket_backfill_job.progress()
+
+@api_router.post("/admin/retention")
+async def start_retention(admin_user: dict = Depends(require_admin)):
+    """Archive page_visits and login_events older than RETENTION_DAYS to compressed files (admin only)"""
+    global retention_jobs
+    if any(job.running for job in retention_jobs):
+        return {"success": True, "message": "Archiving already running", "jobs": [job.progress() for job in retention_jobs]}
+    retention_jobs = archive_jobs(
+        db,
+        retention_days=int(os.environ.get('RETENTION_DAYS', 180)),
+        batch_size=int(os.environ.get('RETENTION_BATCH_SIZE', 5000)),
+        delete_batch_size=int(os.environ.get('RETENTION_DELETE_BATCH_SIZE', 1000)),
+        target_docs_per_sec=float(os.environ.get('RETENTION_DOCS_PER_SEC', 5000))
+    )
+    for job in retention_jobs:
+        job.start()
+    logger.info(f"Admin {admin_user.get('email')} started archiving analytics events")
+    return {"success": True, "message": "Archiving started"}
+
+@api_router.get("/admin/retention")
+async def get_retention_status(admin_user: dict = Depends(require_admin)):
+    """Progress of archiving: rows archived, bytes reclaimed, rows/sec (admin only)"""
+    if not retention_jobs:
+        checkpoints = await db.maintenance_jobs.find(
+            {"_id": {"$in": [f"archive_{c}" for c in ARCHIVED_COLLECTIONS]}}, {"last_id": 0}
+        ).to_list(length=None)
+        return {"jobs": checkpoints}
+    return {"jobs": [job.progress() for job in retention_jobs]}
+
+@api_router.get("/admin/archive/report")
+async def get_archive_report(collection: str = "page_visits", start: Optional[str] = None, end: Optional[str] = None,
+                             admin_user: dict = Depends(require_admin)):
+    """Daily event counts from the archive files (page_visits broken down by page) (admin only)"""
+    if collection not in ARCHIVED_COLLECTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown collection, expected one of {list(ARCHIVED_COLLECTIONS)}")
+    start_day, end_day = parse_day_range(start, end, default_days=365)
+    by = "page_path" if collection == "page_visits" else None
+    days = await asyncio.to_thread(archived_daily_counts, collection, start_day, end_day, by)
+    return {"collection": collection, "start": start_day, "end": end_day, "days": days}
+
+def parse_day_range(start: Optional[str], end: Optional[str], default_days: int = 30, max_days: int = None):
+    """(start, end) YYYY-MM-DD strings of an admin date range, defaulting to the last default_days days"""
+    try:
+        end_day = date.fromisoformat(end) if end else datetime.now(timezone.utc).date()
+        start_day = date.fromisoformat(start) if start else end_day - timedelta(days=default_days - 1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be YYYY-MM-DD")
+    if start_day > end_day:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    if max_days and (end_day - start_day).days + 1 > max_days:
+        raise HTTPException(status_code=400, detail=f"date range must not exceed {max_days} days")
+    return start_day.isoformat(), end_day.isoformat()
+
+@api_router.get("/admin/page-analytics")
+async def get_page_analytics(start: Optional[str] = None, end: Optional[str] = None, admin_user: dict = Depends(require_admin)):
+    """Daily page views, active users and views per page from the visit buckets (admin only)"""
+    return await page_analytics(db, *parse_day_range(start, end))
+
+@api_router.get("/admin/active-users")
+async def get_active_users(start: Optional[str] = None, end: Optional[str] = None, admin_user: dict = Depends(require_admin)):
+    """Estimated DAU, WAU and MAU per day, and unique users over the range, from HyperLogLog sketches (admin only)"""
+    # Each day of the range merges up to 30 sketches
+    return await active_users.report(*parse_day_range(start, end, max_days=ACTIVE_USERS_MAX_DAYS))
+
+@api_router.get("/admin/cohorts")
+async def get_cohorts(weeks: int = 12, admin_user: dict = Depends(require_admin)):
+    """Weekly cohort retention triangle: share of each registration week logging in again in the following weeks (admin only)"""
+    if not 1 <= weeks <= COHORT_MAX_WEEKS + 1:
+        raise HTTPException(status_code=400, detail=f"weeks must be between 1 and {COHORT_MAX_WEEKS + 1}")
+    return await cohort_matrix(db, weeks)
+
+@api_router.post("/admin/cohorts/backfill")
+async def start_cohort_backfill(admin_user: dict = Depends(require_admin)):
+    """Start (or resume) counting existing users and their past logins into the cohort counters (admin only)"""
+    global cohort_backfill_job
+    if cohort_backfill_job is None:
+        cohort_backfill_job = CohortBackfillJob(
+            db,
+            batch_size=int(os.environ.get('COHORT_BACKFILL_BATCH_SIZE', 200)),
+            target_docs_per_sec=float(os.environ.get('COHORT_BACKFILL_DOCS_PER_SEC', 500))
+        )
+    if cohort_backfill_job.running:
+        return {"success": True, "message": "Backfill already running", **cohort_backfill_job.progress()}
+    cohort_backfill_job.start()
+    logger.info(f"Admin {admin_user.get('email')} started the cohort retention backfill")
+    return {"success": True, "message": "Backfill started"}
+
+@api_router.get("/admin/cohorts/backfill")
+async def get_cohort_backfill_status(admin_user: dict = Depends(require_admin)):
+    """Progress of the cohort retention backfill (admin only)"""
+    if cohort_backfill_job is None:
+        checkpoint = await db.maintenance_jobs.find_one({"_id": CohortBackfillJob.name}, {"_id": 0, "last_id": 0})
+        return checkpoint or {"status": "idle"}
+    return cohort_backfill_job.progress()
+
+@api_router.get("/admin/anonymous-events")
+async def get_anonymous_events(start: Optional[str] = None, end: Optional[str] = None, admin_user: dict = Depends(require_admin)):
+    """Daily demo views and anonymous frontend events: requests, distinct visitors, details (admin only)"""
+    start_day, end_day = parse_day_range(start, end)
+    return {"start": start_day, "end": end_day, "days": await anonymous_event_report(db, start_day, end_day)}
+
+@api_router.get("/admin/funnel")
+async def get_funnel(start: Optional[str] = None, end: Optional[str] = None, admin_user: dict = Depends(require_admin)):
+    """Users reaching each page of the flow and step conversion over a date range (admin only)"""
+    return await funnel_report(db, *parse_day_range(start, end))
+
+@api_router.post("/admin/funnel/rebuild")
+async def start_funnel_rebuild(apply: bool = False, admin_user: dict = Depends(require_admin)):
+    """Recompute the funnel rollups from raw visits; compare only, or replace them with apply=true (admin only)"""
+    global funnel_rebuild_job
+    if funnel_rebuild_job is not None and funnel_rebuild_job.running:
+        return {"success": True, "message": "Funnel rebuild already running", **funnel_rebuild_job.progress()}
+    funnel_rebuild_job = FunnelRebuildJob(db, source="buckets" if PAGE_VISIT_STORAGE == 'buckets' else "documents", apply=apply)
+    funnel_rebuild_job.start()
+    logger.info(f"Admin {admin_user.get('email')} started a funnel rebuild (apply={apply})")
+    return {"success": True, "message": "Funnel rebuild started"}
+
+@api_router.get("/admin/funnel/rebuild")
+async def get_funnel_rebuild_status(admin_user: dict = Depends(require_admin)):
+    """Progress and verification result of the last funnel rebuild (admin only)"""
+    if funnel_rebuild_job is None:
+        return {"status": "idle"}
+    return funnel_rebuild_job.progress()
+
+@api_router.post("/admin/sessions/sessionize")
+async def start_sessionize(admin_user: dict = Depends(require_admin)):
+    """Summarise the sessions touched since the last run now, instead of waiting for the schedule (admin only)"""
+    job = get_sessionize_job()
+    if job.running:
+        return {"success": True, "message": "Sessionization already running", **job.progress()}
+    job.start()
+    logger.info(f"Admin {admin_user.get('email')} started sessionization")
+    return {"success": True, "message": "Sessionization started"}
+
+@api_router.get("/admin/sessions/stats")
+async def get_session_stats(start: Optional[str] = None, end: Optional[str] = None, admin_user: dict = Depends(require_admin)):
+    """Session length, pages per session, bounce and drop-off pages from the session summaries (admin only)"""
+    stats = await session_stats(db, *parse_day_range(start, end))
+    if sessionize_job is None:
+        checkpoint = await db.maintenance_jobs.find_one({"_id": SessionizeJob.name}, {"_id": 0, "last_id": 0})
+        stats["sessionization"] = checkpoint or {"status": "idle"}
+    else:
+        stats["sessionization"] = sessionize_job.progress()
+    return stats
+
+@api_router.get("/admin/password-costs")
+async def get_password_costs(admin_user: dict = Depends(require_admin)):
+    """Number of accounts at each bcrypt cost, to follow rehash migration (admin only)"""
+    pipeline = [
+        {"$match": {"password": {"$type": "string"}}},
+        # "$2b$10$..." -> "10"
+        {"$group": {"_id": {"$substrCP": ["$password", 4, 2]}, "count": {"$sum": 1}}},
+        {"$sort": {"_id": 1}}
+    ]
+    costs = {}
+    async for row in db.access.aggregate(pipeline):
+        costs[row["_id"]] = row["count"]
+    total = sum(costs.values())
+    return {
+        "target_rounds": password_hasher.rounds,
+        "accounts_by_rounds": costs,
+        # Hashes at or above the target are never rehashed
+        "migrated": sum(n for rounds, n in costs.items() if rounds.isdigit() and int(rounds) >= password_hasher.rounds),
+        "total": total
+    }
+
+@api_router.get("/admin/query-plans")
+async def get_query_plans(admin_user: dict = Depends(require_admin)):
+    """explain() the hot queries and report any still doing a collection scan (admin only)"""
+    report = await check_query_plans(db)
+    return {
+        "collscans": [r for r in report if r.get("collscan")],
+        "queries": report
+    }
+
+# Bulk campaigns currently known to this worker, by campaign id
+campaign_jobs = {}
+
+def reverification_version(recipient: dict) -> dict:
+    """Per-recipient message version carrying a fresh verification link"""
+    frontend_url = os.environ.get('FRONTEND_URL', 'http://localhost:3000').rstrip('/')
+    link = f"{frontend_url}/verify?token={create_verification_token(recipient['email'])}"
+    return {"htmlContent": f"""
+        <h1>Please verify your Can I Quit? account</h1>
+        <p>You haven't verified your email address yet. Click the link below to finish:</p>
+        <p><a href="{link}">Verify Email</a></p>
+        <p>Or copy this link: {link}</p>
+        <p>This link expires in 24 hours.</p>
+    """}
+
+def build_campaign_job(campaign: dict) -> CampaignJob:
+    job = CampaignJob(
+        db, email_dispatcher, campaign,
+        version_builder=reverification_version if campaign["audience"] == "unverified" else None,
+        batch_size=int(os.environ.get('CAMPAIGN_BATCH_SIZE', 100)),
+        target_per_sec=float(os.environ.get('CAMPAIGN_RATE_PER_SEC', 20))
+    )
+    campaign_jobs[campaign["_id"]] = job
+    return job
+
+@api_router.post("/admin/campaigns")
+async def create_campaign(request: CampaignRequest, admin_user: dict = Depends(require_admin)):
+    """Create and start a bulk email campaign to verified or unverified users (admin only)"""
+    if request.audience not in AUDIENCES:
+        raise HTTPException(status_code=400, detail=f"Unknown audience, expected one of {list(AUDIENCES)}")
+    if not request.html_content and request.audience != "unverified":
+        raise HTTPException(status_code=400, detail="Missing html_content")
+    if not email_dispatcher.enabled:
+        raise HTTPException(status_code=500, detail="Email sending not configured")
+    
+    sender = {"name": "Can I Quit App", "email": os.environ.get('SMTP_EMAIL', 'no-reply@retirenow.com')}
+    campaign = await CampaignJob.create(db, request.subject, request.html_content, request.audience, sender, admin_user.get("email"))
+    job = build_campaign_job(campaign)
+    job.start()
+    logger.info(f"Admin {admin_user.get('email')} started campaign {campaign['_id']} to {campaign['total']} {request.audience} users")
+    return {"success": True, **job.progress()}
+
+@api_router.get("/admin/campaigns/{campaign_id}")
+async def get_campaign(campaign_id: str, admin_user: dict = Depends(require_admin)):
+    """Live sent/failed counts of a campaign (admin only)"""
+    job = campaign_jobs.get(campaign_id)
+    if job is not None:
+        return job.progress()
+    campaign = await db.campaigns.find_one({"_id": campaign_id}, {"html_content": 0, "last_id": 0})
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return campaign
+
+@api_router.post("/admin/campaigns/{campaign_id}/resume")
+async def resume_campaign(campaign_id: str, admin_user: dict = Depends(require_admin)):
+    """Resume an interrupted campaign from its last checkpoint (admin only)"""
+    job = campaign_jobs.get(campaign_id)
+    if job is not None and job.running:
+        return {"success": True, "message": "Campaign already running", **job.progress()}
+    campaign = await db.campaigns.find_one({"_id": campaign_id})
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    if campaign.get("status") == "done":
+        return {"success": True, "message": "Campaign already finished"}
+    job = build_campaign_job(campaign)
+    job.start()
+    return {"success": True, "message": "Campaign resumed", **job.progress()}
+
 @api_router.post("/admin/stats")
 
 async def get_admin_stats(admin_user: dict = Depends(require_admin)):
@@ -727,6 +1173,8 @@ async def toggle_user_admin_role(user_id: str, admin_user: dict = Depends(requir
             {"user_id": user_id},
             {"$set": {"role": new_role}}
         )
+        user_cache.invalidate(target_user.get("email"))
+        token_cache.invalidate_email(target_user.get("email"))
         
         if result.modified_count == 0:
             raise HTTPException(status_code=500, detail="Failed to update role")
@@ -748,14 +1196,14 @@ async def toggle_user_admin_role(user_id: str, admin_user: dict = Depends(requir
 async def register(user: UserRegister, request: Request, background_tasks: BackgroundTasks):
     logger.info(f"Registration attempt for email: {user.email}")
     
-    # Check if user exists
-    existing = await db.access.find_one({"email": user.email}, {"_id": 0})
-    if existing:
-        logger.warning(f"Registration failed - email already exists: {user.email}")
-        raise HTTPException(status_code=400, detail="Email already registered")
-    
+    # Duplicate emails are rejected by the unique index on access.email; without it, check first
+    if not unique_email_index:
+        if await db.access.find_one({"email": user.email}, {"_id": 1}):
+            logger.warning(f"Registration failed - email already exists: {user.email}")
+            raise HTTPException(status_code=400, detail="Email already registered")
+
     # Create user
-    hashed_pw = hash_password(user.password)
+    hashed_pw = await hash_password(user.password)
     current_time = datetime.now(timezone.utc).isoformat()
     user_ip = request.client.host
 
@@ -772,7 +1220,8 @@ async def register(user: UserRegister, request: Request, background_tasks: Backg
         "last_device_type": "Mobile" if "Mobile" in request.headers.get("User-Agent", "") else "Desktop",
         "total_pages_viewed": 0,
         "is_verified": False,  # New users unverified
-        "master_encryption_key": None  # Will be set below
+        "master_encryption_key": None,  # Will be set below
+        "cohort_counted": True  # Counted in its registration week's cohort below
     }
     
     # Generate and encrypt master key
@@ -787,6 +1236,10 @@ async def register(user: UserRegister, request: Request, background_tasks: Backg
     try:
         result = await db.access.insert_one(user_doc)
         logger.info(f"User registered successfully: {user.email}, inserted_id: {result.inserted_id}")
+        await cohort_buffer.add((week_start(current_time), {"size": 1}))
+    except DuplicateKeyError:
+        logger.warning(f"Registration failed - email already exists: {user.email}")
+        raise HTTPException(status_code=400, detail="Email already registered")
     except Exception as e:
         logger.error(f"Failed to insert user {user.email}: {type(e).__name__}: {e}")
         import traceback
@@ -798,7 +1251,7 @@ async def register(user: UserRegister, request: Request, background_tasks: Backg
     
     # Resolve geolocation in background (avoids a blocking HTTP call on the critical path)
     async def resolve_location_and_update(user_id: str, ip: str, email: str, time: str):
-        location = get_location_from_ip(ip)
+        location = await get_location_from_ip(ip)
         await db.access.update_one({"user_id": user_id}, {"$set": {"last_location": location}})
         
         # Notify Admin
@@ -809,13 +1262,13 @@ async def register(user: UserRegister, request: Request, background_tasks: Backg
             <p><strong>IP Address:</strong> {ip}</p>
             <p><strong>Location:</strong> {location}</p>
         """
-        send_admin_notification(f"New user signed up {email}", admin_content)
+        await notify_admin("registration", f"New user signed up {email}", admin_content, ip=ip, location=location)
 
     background_tasks.add_task(resolve_location_and_update, user_doc["user_id"], user_ip, user.email, current_time)
 
-    # Send Email in Background
+    # Queue the email; the dispatcher sends it in the background
     # This prevents the UI from hitting a timeout while waiting for SMTP
-    background_tasks.add_task(send_verification_email, user.email, verify_token_str)
+    await send_verification_email(user.email, verify_token_str)
 
     return TokenResponse(
         email=user.email, 
@@ -838,6 +1291,7 @@ async def verify_email(request: VerifyRequest):
             {"email": email},
             {"$set": {"is_verified": True}}
         )
+        user_cache.invalidate(email)
         
         if result.modified_count == 0:
              # Check if already verified
@@ -854,16 +1308,40 @@ async def verify_email(request: VerifyRequest):
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=400, detail="Invalid verification link")
 
+async def rehash_password(email: str, password: str, old_hash: str):
+    """Re-hash a verified password at the current bcrypt cost"""
+    try:
+        async with password_admission.slot():
+            new_hash = await password_hasher.hash(password)
+    except AdmissionRejected:
+        # Busy: the next login will try again
+        return
+    # Only replace the hash we verified, in case the password changed meanwhile
+    await db.access.update_one({"email": email, "password": old_hash}, {"$set": {"password": new_hash}})
+    logger.info(f"Password hash for {email} upgraded to {password_hasher.rounds} rounds")
+
 @api_router.post("/auth/login", response_model=TokenResponse)
 async def login(user: UserLogin, request: Request, background_tasks: BackgroundTasks):
-    # Find user
-    user_doc = await db.access.find_one({"email": user.email}, {"_id": 0})
+    # Reject clients with too many recent failures before doing any bcrypt work
+    client_ip = request.client.host
+    retry_after = max(login_failures_by_ip.retry_after(client_ip), login_failures_by_email.retry_after(user.email))
+    if retry_after:
+        raise HTTPException(status_code=429, detail="Too many failed login attempts", headers={"Retry-After": str(retry_after)})
+    
+    # Find user (only what the password and verification checks need)
+    user_doc = await db.access.find_one(
+        {"email": user.email}, {"_id": 0, "password": 1, "is_verified": 1, "created_at": 1, "cohort_weeks": 1}
+    )
     if not user_doc:
+        login_failures_by_ip.record(client_ip)
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # Verify password
-    if not verify_password(user.password, user_doc['password']):
+    if not await verify_password(user.password, user_doc['password']):
+        login_failures_by_ip.record(client_ip)
+        login_failures_by_email.record(user.email)
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    login_failures_by_email.reset(user.email)
 
     # CHECK VERIFICATION STATUS
     # Default to True for old users, False for new ones
@@ -871,25 +1349,44 @@ async def login(user: UserLogin, request: Request, background_tasks: BackgroundT
     if is_verified is False:
         raise HTTPException(status_code=403, detail="Email not verified. Please check your inbox.")
     
-    # Update login analytics
+    # Upgrade hashes stored with a different bcrypt cost now that we know the password
+    if password_hasher.needs_rehash(user_doc['password']):
+        background_tasks.add_task(rehash_password, user.email, user.password, user_doc['password'])
+    
+    # Update login analytics and read back the fields we return, in one round trip
+    # last_location is filled in asynchronously below so login never waits on geolocation
     current_time = datetime.now(timezone.utc).isoformat()
-    current_location = get_location_from_ip(request.client.host)
+    user_ip = request.client.host
+    
+    # Cohort retention: only the first login of a week writes anything
+    try:
+        cohort_week = week_offset(user_doc["created_at"], current_time) if user_doc.get("created_at") else 0
+    except (TypeError, ValueError):
+        cohort_week = 0
+    if 1 <= cohort_week <= COHORT_MAX_WEEKS and not int(user_doc.get("cohort_weeks") or 0) >> cohort_week & 1:
+        background_tasks.add_task(record_cohort_login, user.email, cohort_week)
     
-    await db.access.update_one(
+    user_doc = await db.access.find_one_and_update(
         {"email": user.email},
         {
             "$inc": {"login_count": 1},
             "$set": {
                 "last_login": current_time,
-                "last_ip": request.client.host,
-                "last_location": current_location,
+                "last_ip": user_ip,
                 "last_device_type": "Mobile" if "Mobile" in request.headers.get("User-Agent", "") else "Desktop"
             }
-        }
+        },
+        projection={"_id": 0, "user_id": 1, "role": 1, "login_count": 1, "master_encryption_key": 1},
+        return_document=ReturnDocument.AFTER
     )
+    if not user_doc:
+        # Deleted between the password check and the update
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    
+    active_users.add(user_doc.get("user_id"))
     
-    # Log the login event in analytics collection
-    await db.login_events.insert_one({
+    # Log the login event in analytics collection (off the response path)
+    background_tasks.add_task(login_events_buffer.add, {
         "user_id": user_doc.get("user_id"),
         "email": user.email,
         "timestamp": current_time
@@ -909,19 +1406,21 @@ async def login(user: UserLogin, request: Request, background_tasks: BackgroundT
     
     token = create_token(user.email)
     
-    # Notify Admin of Login
-    try:
+    # Resolve location and notify Admin of Login in background
+    async def resolve_login_location(email: str, ip: str, time: str, login_count: int):
+        location = await get_location_from_ip(ip)
+        await db.access.update_one({"email": email}, {"$set": {"last_location": location}})
+        
         admin_content = f"""
             <h1>User Login</h1>
-            <p><strong>Email:</strong> {user.email}</p>
-            <p><strong>Time:</strong> {current_time}</p>
-            <p><strong>Location:</strong> {current_location}</p>
-            <p><strong>Login Count:</strong> {user_doc.get('login_count', 0) + 1}</p>
+            <p><strong>Email:</strong> {email}</p>
+            <p><strong>Time:</strong> {time}</p>
+            <p><strong>Location:</strong> {location}</p>
+            <p><strong>Login Count:</strong> {login_count}</p>
         """
-        background_tasks.add_task(send_admin_notification, f"Existing user logged {user.email}", admin_content)
-    except Exception:
-        # Don't fail login if notification setup fails
-        pass
+        await notify_admin("login", f"Existing user logged {email}", admin_content, ip=ip, location=location)
+    
+    background_tasks.add_task(resolve_login_location, user.email, user_ip, current_time, user_doc.get('login_count', 1))
 
     return TokenResponse(
         token=token, 
@@ -931,7 +1430,7 @@ async def login(user: UserLogin, request: Request, background_tasks: BackgroundT
     )
 
 @api_router.post("/auth/request-password-reset")
-async def request_password_reset(request: PasswordResetRequest, background_tasks: BackgroundTasks):
+async def request_password_reset(request: PasswordResetRequest):
     """Request a password reset email"""
     # Check if user exists
     user_doc = await db.access.find_one({"email": request.email}, {"_id": 0})
@@ -944,8 +1443,8 @@ async def request_password_reset(request: PasswordResetRequest, background_tasks
     # Generate reset token
     reset_token = create_password_reset_token(request.email)
     
-    # Send email in background
-    background_tasks.add_task(send_password_reset_email, request.email, reset_token)
+    # Queue the email; the dispatcher sends it in the background
+    await send_password_reset_email(request.email, reset_token)
     
     logger.info(f"Password reset requested for: {request.email}")
     return {"success": True, "message": "If the email exists, a reset link has been sent"}
@@ -962,13 +1461,15 @@ async def reset_password(request: PasswordResetConfirm):
         email = payload['email']
         
         # Hash new password
-        new_password_hash = hash_password(request.new_password)
+        new_password_hash = await hash_password(request.new_password)
         
         # Update password (master key remains unchanged!)
         result = await db.access.update_one(
             {"email": email},
             {"$set": {"password": new_password_hash}}
         )
+        user_cache.invalidate(email)
+        token_cache.invalidate_email(email)
         
         if result.modified_count == 0:
             user = await db.access.find_one({"email": email})
@@ -984,103 +1485,115 @@ async def reset_password(request: PasswordResetConfirm):
         raise HTTPException(status_code=400, detail="Invalid reset link")
 
 @api_router.post("/track-demo")
-async def track_demo(request_data: DemoTrackRequest, request: Request, background_tasks: BackgroundTasks):
+async def track_demo(request_data: DemoTrackRequest, request: Request):
     """Track when a user views the demo video"""
-    current_time = datetime.now(timezone.utc).isoformat()
-    ip_address = request.client.host
-    
-    def notify_demo_view(ip: str, lang: str, time: str):
-        location = get_location_from_ip(ip)
-        admin_content = f"""
-            <h1>Demo View</h1>
-            <p><strong>Language:</strong> {lang.upper()}</p>
-            <p><strong>Time:</strong> {time}</p>
-            <p><strong>IP Address:</strong> {ip}</p>
-            <p><strong>Location:</strong> {location}</p>
-        """
-        send_admin_notification(f"Demo view by {ip}", admin_content)
-
-    background_tasks.add_task(notify_demo_view, ip_address, request_data.language, current_time)
+    # Field name in the daily counters: keep it to a plain language code
+    language = re.sub(r'[^a-z0-9_-]', '', request_data.language.lower())[:16]
+    await anonymous_events.add(request.client.host, "demo_view", detail=language or None)
     return {"success": True}
 
 @api_router.post("/track-event")
-async def track_event(request_data: TrackEventRequest, request: Request, background_tasks: BackgroundTasks):
+async def track_event(request_data: TrackEventRequest, request: Request):
     """Track generic events from the frontend"""
-    current_time = datetime.now(timezone.utc).isoformat()
-    ip_address = request.client.host
-    
-    def notify_event(ip: str, event: str, time: str):
-        location = get_location_from_ip(ip)
-        
-        if event == "create_account_link":
-            subject = f"Create account link used by {ip}"
-            title = "Create Account Link Clicked"
-        elif event == "create_account_action":
-            subject = f"Create account action used by {ip}"
-            title = "Create Account Action Triggered"
-        else:
-            subject = f"Event {event} by {ip}"
-            title = f"Event: {event}"
-            
-        admin_content = f"""
-            <h1>{title}</h1>
-            <p><strong>Time:</strong> {time}</p>
-            <p><strong>IP Address:</strong> {ip}</p>
-            <p><strong>Location:</strong> {location}</p>
-        """
-        send_admin_notification(subject, admin_content)
-
-    background_tasks.add_task(notify_event, ip_address, request_data.event_type, current_time)
+    await anonymous_events.add(request.client.host, request_data.event_type[:64])
     return {"success": True}
 
+# Batched page tracking: cap on entries per request and accepted client clock window
+TRACK_BATCH_MAX = int(os.environ.get('TRACK_BATCH_MAX', 50))
+TRACK_MAX_EVENT_AGE = timedelta(seconds=int(os.environ.get('TRACK_MAX_EVENT_AGE_SECONDS', 24 * 3600)))
+TRACK_MAX_CLOCK_SKEW = timedelta(seconds=int(os.environ.get('TRACK_MAX_CLOCK_SKEW_SECONDS', 300)))
+
+def visit_time(client_timestamp: Optional[str], received: datetime) -> datetime:
+    """Client-reported visit time, or the receive time if missing or outside the accepted window"""
+    if not client_timestamp:
+        return received
+    try:
+        sent = datetime.fromisoformat(client_timestamp.replace('Z', '+00:00'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid client_timestamp: {client_timestamp}")
+    if sent.tzinfo is None:
+        sent = sent.replace(tzinfo=timezone.utc)
+    if not received - TRACK_MAX_EVENT_AGE <= sent <= received + TRACK_MAX_CLOCK_SKEW:
+        # A wrong client clock shouldn't rewrite history: keep the event, trust our own clock
+        return received
+    return sent.astimezone(timezone.utc)
+
+async def record_page_visits(email: str, visits: List[PageVisitRequest]) -> int:
+    """Apply a batch of visits with one aggregated user update; visit documents are written behind"""
+    if not visits:
+        raise HTTPException(status_code=400, detail="No visits to track")
+    if len(visits) > TRACK_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Too many visits in one batch (max {TRACK_BATCH_MAX})")
+    
+    received = datetime.now(timezone.utc)
+    timed = sorted(((visit_time(v.client_timestamp, received), v) for v in visits), key=lambda tv: tv[0])
+    latest_time, latest = timed[-1]
+    
+    user_doc = await db.access.find_one_and_update(
+        {"email": email},
+        {
+            "$set": {
+                "last_page_visited": latest.page_path,
+                "last_page_visit_time": latest_time.isoformat()
+            },
+            "$inc": {"total_pages_viewed": len(visits)},
+            # $max keeps the deepest page correct under concurrent requests
+            "$max": {"deepest_page_depth": max(get_page_depth(v.page_path) for v in visits)}
+        },
+        # Document as it was before the update: the depth this batch starts from
+        projection={"_id": 0, "user_id": 1, "deepest_page_depth": 1}
+    )
+    if not user_doc:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    # Log the page visits in analytics collection (written behind, in batches)
+    deepest = user_doc.get("deepest_page_depth", -1)
+    for at, visit in timed:
+        depth = get_page_depth(visit.page_path)
+        await funnel_buffer.add((at.strftime("%Y-%m-%d"), funnel_increments(deepest, depth)))
+        deepest = max(deepest, depth)
+        active_users.add(user_doc.get("user_id"), at)
+        if PAGE_VISIT_STORAGE != 'buckets':
+            await page_visits_buffer.add({
+                "user_id": user_doc.get("user_id"),
+                "email": email,
+                "page_path": visit.page_path,
+                "session_id": visit.session_id,
+                "timestamp": at.isoformat()
+            })
+        if PAGE_VISIT_STORAGE != 'documents':
+            await visit_bucket_buffer.add({
+                "user_id": user_doc.get("user_id"),
+                "timestamp": at,
+                "depth": depth
+            })
+    return len(visits)
+
 @api_router.post("/track-page")
 
 async def track_page_visit(request: PageVisitRequest, email: str = Depends(verify_token)):
     """Track user page visits for analytics"""
     try:
-        current_time = datetime.now(timezone.utc).isoformat()
-        
-        # Get current user data
-        user_doc = await db.access.find_one({"email": email}, {"_id": 0})
-        if not user_doc:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Calculate page depth
-        new_page_depth = get_page_depth(request.page_path)
-        current_deepest = user_doc.get("deepest_page", "/")
-        current_deepest_depth = get_page_depth(current_deepest)
-        
-        # Update user's last visited page and deepest page if applicable
-        update_data = {
-            "last_page_visited": request.page_path,
-            "last_page_visit_time": current_time
-        }
-        
-        if new_page_depth > current_deepest_depth:
-            update_data["deepest_page"] = request.page_path
-        
-        await db.access.update_one(
-            {"email": email},
-            {
-                "$set": update_data,
-                "$inc": {"total_pages_viewed": 1}
-            }
-        )
-        
-        # Log the page visit in analytics collection
-        await db.page_visits.insert_one({
-            "user_id": user_doc.get("user_id"),
-            "email": email,
-            "page_path": request.page_path,
-            "session_id": request.session_id,
-            "timestamp": current_time
-        })
-        
+        await record_page_visits(email, [request])
         return {"success": True, "page": request.page_path}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error tracking page visit: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.post("/track-pages")
+async def track_page_visits(request: PageVisitBatchRequest, email: str = Depends(verify_token)):
+    """Track a batch of page visits buffered by the client"""
+    try:
+        tracked = await record_page_visits(email, request.visits)
+        return {"success": True, "tracked": tracked}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error tracking page visits: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @api_router.post("/life-expectancy", response_model=LifeExpectancyResponse)
 async def calculate_life_expectancy(request: LifeExpectancyRequest, email: str = Depends(verify_token)):
     try:
@@ -1185,11 +1698,67 @@ async def startup_db_client():
         # Test the connection
         await client.admin.command('ping')
         logger.info(f"Successfully connected to MongoDB database: {os.environ.get('DB_NAME', 'unknown')}")
+        indexes = await ensure_indexes(db)
+        global unique_email_index
+        unique_email_index = "email_unique" in indexes.get("access", [])
+        if not unique_email_index:
+            logger.error("access.email_unique is missing: registration falls back to a duplicate pre-check")
+        if PAGE_VISIT_STORAGE != 'documents':
+            await mark_bucketing_started(db)
     except Exception as e:
         logger.error(f"Failed to connect to MongoDB: {e}")
 
+    password_hasher.start()
+    await password_hasher.calibrate(db.app_config)
+    await geo_resolver.start()
+    await email_dispatcher.start()
+    admin_digest.start()
+    page_visits_buffer.start()
+    visit_bucket_buffer.start()
+    funnel_buffer.start()
+    login_events_buffer.start()
+    anonymous_event_counters.start()
+    anonymous_events.start()
+    active_users.start()
+    cohort_buffer.start()
+    global sessionize_task
+    if SESSIONIZE_INTERVAL > 0 and PAGE_VISIT_STORAGE != 'buckets':
+        sessionize_task = asyncio.create_task(sessionize_periodically(get_sessionize_job(), SESSIONIZE_INTERVAL))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if key_rotation_job is not None:
+        await key_rotation_job.cancel()
+    for job in campaign_jobs.values():
+        await job.cancel()
+    if bucket_backfill_job is not None:
+        await bucket_backfill_job.cancel()
+    if funnel_rebuild_job is not None:
+        await funnel_rebuild_job.cancel()
+    for job in retention_jobs:
+        await job.cancel()
+    if cohort_backfill_job is not None:
+        await cohort_backfill_job.cancel()
+    if sessionize_task is not None:
+        sessionize_task.cancel()
+        await asyncio.gather(sessionize_task, return_exceptions=True)
+    if sessionize_job is not None:
+        await sessionize_job.cancel()
+    # Hand pending anonymous events to the counters and the digest before those stop
+    await anonymous_events.stop()
+    # Write out buffered analytics events while the Mongo client is still open
+    await page_visits_buffer.stop()
+    await visit_bucket_buffer.stop()
+    await funnel_buffer.stop()
+    await login_events_buffer.stop()
+    await anonymous_event_counters.stop()
+    await active_users.stop()
+    await cohort_buffer.stop()
+    # Flush pending digest events before the dispatcher drains its queue
+    await admin_digest.stop()
+    await email_dispatcher.stop()
+    password_hasher.shutdown()
+    await geo_resolver.close()
     client.close()
 
 if __name__ == "__main__":
@@ -0,0 +1,151 @@
+"""
+Session summaries built from page_visits.session_id.
+
+page_sessions holds one document per client session:
+
+    {"_id": "<session_id>", "user_id": ..., "day": "2026-10-17",
+     "start": ISO, "end": ISO, "duration_seconds": 312.0, "pages": 7,
+     "entry_page": "/", "max_depth": 5, "drop_off_page": "/costs", "completed": false}
+
+SessionizeJob is an incremental BatchJob over page_visits: its checkpoint
+_id is a watermark, so each run only reads the visits inserted since the
+previous one. The sessions those visits belong to are then recomputed in
+full with one aggregation that walks the (session_id, timestamp) index,
+so a session spanning several runs is still summarised from all of its
+visits. Visits younger than settle_seconds are left for the next run:
+write-behind buffers on several workers don't insert in strict _id order.
+
+Bucket-only storage (PAGE_VISIT_STORAGE=buckets) keeps no session ids and
+therefore produces no sessions.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo import ReplaceOne
+
+from maintenance import BatchJob
+from page_depth import PAGE_DEPTH, PAGE_DEPTH_ORDER
+
+logger = logging.getLogger(__name__)
+
+SESSION_COLLECTION = "page_sessions"
+
+# get_page_depth() as an aggregation expression
+PAGE_DEPTH_EXPR = {"$switch": {
+    "branches": [{"case": {"$eq": ["$page_path", page]}, "then": depth} for page, depth in PAGE_DEPTH.items()],
+    "default": -1,
+}}
+
+
+def _duration_seconds(start: str, end: str) -> float:
+    try:
+        return round((datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds(), 1)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+async def summarize_sessions(db, session_ids) -> list:
+    """One summary document per session id, computed from all of its visits"""
+    pipeline = [
+        {"$match": {"session_id": {"$in": list(session_ids)}}},
+        {"$sort": {"session_id": 1, "timestamp": 1}},
+        {"$group": {
+            "_id": "$session_id",
+            "user_id": {"$first": "$user_id"},
+            "start": {"$first": "$timestamp"},
+            "end": {"$last": "$timestamp"},
+            "pages": {"$sum": 1},
+            "entry_page": {"$first": "$page_path"},
+            "drop_off_page": {"$last": "$page_path"},
+            "max_depth": {"$max": PAGE_DEPTH_EXPR},
+        }},
+    ]
+    summaries = []
+    async for session in db.page_visits.aggregate(pipeline):
+        session["day"] = session["start"][:10]
+        session["duration_seconds"] = _duration_seconds(session["start"], session["end"])
+        session["completed"] = session["max_depth"] == len(PAGE_DEPTH_ORDER) - 1
+        summaries.append(session)
+    return summaries
+
+
+class SessionizeJob(BatchJob):
+    """Summarises the sessions touched by page visits newer than the watermark"""
+
+    name = "sessionization"
+    collection = "page_visits"
+    projection = {"session_id": 1}
+    counters = ("sessions_updated",)
+    incremental = True
+
+    def __init__(self, db, settle_seconds: float = 120, batch_size: int = 2000, target_docs_per_sec: float = 20000):
+        super().__init__(db, batch_size=batch_size, target_docs_per_sec=target_docs_per_sec)
+        self.settle_seconds = settle_seconds
+
+    async def query(self) -> dict:
+        settled = datetime.now(timezone.utc) - timedelta(seconds=self.settle_seconds)
+        return {"_id": {"$lt": ObjectId.from_datetime(settled)}}
+
+    async def process(self, batch: list):
+        session_ids = {doc.get("session_id") for doc in batch} - {None}
+        if not session_ids:
+            return
+        summaries = await summarize_sessions(self.db, session_ids)
+        now = datetime.now(timezone.utc).isoformat()
+        ops = [ReplaceOne({"_id": s["_id"]}, {**s, "updated_at": now}, upsert=True) for s in summaries]
+        # bulk_write([]) raises InvalidOperation (e.g. every visit archived meanwhile)
+        if ops:
+            await self.db[SESSION_COLLECTION].bulk_write(ops, ordered=False)
+        self.counts["sessions_updated"] += len(summaries)
+
+
+async def sessionize_periodically(job: SessionizeJob, interval_seconds: float):
+    """Run the job every interval (if it isn't already running) until cancelled"""
+    while True:
+        try:
+            if not job.running:
+                await job.start()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Sessionization run failed: {e}")
+        await asyncio.sleep(interval_seconds)
+
+
+async def session_stats(db, start_day: str, end_day: str) -> dict:
+    """Session length, pages per session and drop-off pages for sessions started between two days (inclusive)"""
+    match = {"$match": {"day": {"$gte": start_day, "$lte": end_day}}}
+    totals = await db[SESSION_COLLECTION].aggregate([
+        match,
+        {"$group": {
+            "_id": None,
+            "sessions": {"$sum": 1},
+            "users": {"$addToSet": "$user_id"},
+            "avg_duration_seconds": {"$avg": "$duration_seconds"},
+            "avg_pages": {"$avg": "$pages"},
+            "single_page": {"$sum": {"$cond": [{"$eq": ["$pages", 1]}, 1, 0]}},
+            "completed": {"$sum": {"$cond": ["$completed", 1, 0]}},
+        }},
+    ]).to_list(length=1)
+    drop_off = await db[SESSION_COLLECTION].aggregate([
+        match,
+        {"$match": {"completed": False}},
+        {"$group": {"_id": "$drop_off_page", "sessions": {"$sum": 1}}},
+        {"$sort": {"sessions": -1}},
+    ]).to_list(length=None)
+
+    total = totals[0] if totals else {}
+    sessions = total.get("sessions", 0)
+    return {
+        "start": start_day,
+        "end": end_day,
+        "sessions": sessions,
+        "users": len(total.get("users", [])),
+        "avg_duration_seconds": round(total.get("avg_duration_seconds") or 0, 1),
+        "avg_pages": round(total.get("avg_pages") or 0, 2),
+        "bounce_rate": round(total.get("single_page", 0) / sessions, 4) if sessions else 0.0,
+        "completion_rate": round(total.get("completed", 0) / sessions, 4) if sessions else 0.0,
+        "drop_off_pages": [{"page": d["_id"], "sessions": d["sessions"]} for d in drop_off],
+    }
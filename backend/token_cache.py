@@ -0,0 +1,83 @@
+"""
+Cache of verified JWT claims.
+
+Every authenticated request used to run a full jwt.decode (HMAC check plus
+claim validation). TokenCache maps a SHA-256 digest of the raw token to its
+decoded claims, so repeat calls with the same token skip the decode. Entries
+are dropped once the token's `exp` passes and can be invalidated explicitly,
+per token or for every token of an account (password reset, role change,
+deletion).
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenCache:
+    """Bounded LRU of token digest -> decoded claims, honouring `exp`"""
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        # verify_token is a sync dependency, so it runs on Starlette's threadpool
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def digest(token: str) -> str:
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def get(self, token: str):
+        key = self.digest(token)
+        with self._lock:
+            payload = self._data.get(key)
+            if payload is not None:
+                exp = payload.get('exp')
+                if exp is None or exp > time.time():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return payload
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, token: str, payload: dict):
+        key = self.digest(token)
+        with self._lock:
+            self._data[key] = payload
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, token: str):
+        with self._lock:
+            if self._data.pop(self.digest(token), None) is not None:
+                self.invalidations += 1
+
+    def invalidate_email(self, email: str):
+        """Drop the cached claims of every token issued to email"""
+        if not email:
+            return
+        with self._lock:
+            # A linear scan is fine: this only runs on rare account changes
+            stale = [key for key, payload in self._data.items() if payload.get('email') == email]
+            for key in stale:
+                del self._data[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "invalidations": self.invalidations,
+        }
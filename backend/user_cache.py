@@ -0,0 +1,59 @@
+"""
+Short-lived cache of user documents for authorization checks.
+
+require_admin only needs the caller's `role`, but used to read the user from
+Mongo on every admin request. UserCache keeps documents by email for a short
+TTL. Writes in this process invalidate the entry straight away; other
+workers see the change once their entry expires, so a stale role is never
+served for longer than the TTL. Expiry is counted from load time and is not
+extended by hits.
+"""
+import logging
+import os
+
+from geolocation import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class UserCache:
+    """Async read-through cache: email -> user document"""
+
+    def __init__(self, ttl: float = None, max_size: int = None):
+        self.ttl = ttl if ttl is not None else float(os.environ.get('USER_CACHE_TTL_SECONDS', 30))
+        self.cache = TTLCache(max_size or int(os.environ.get('USER_CACHE_SIZE', 1000)))
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def get(self, email: str, loader):
+        """Return the cached document for email, calling `await loader(email)` on a miss"""
+        user = self.cache.get(email)
+        if user is not None:
+            self.hits += 1
+            return user
+        self.misses += 1
+        user = await loader(email)
+        if user is not None and self.ttl > 0:
+            self.cache.set(email, user, self.ttl)
+        return user
+
+    def invalidate(self, email: str):
+        if email:
+            self.cache.pop(email)
+            self.invalidations += 1
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.cache),
+            "max_size": self.cache.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "invalidations": self.invalidations,
+        }
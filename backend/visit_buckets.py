@@ -0,0 +1,180 @@
+"""
+Bucketed page-visit storage.
+
+page_visits holds one document per view (user_id, email, path, session,
+ISO timestamp), which is mostly repeated keys and index entries. The
+page_visit_buckets collection keeps one document per user per UTC day:
+
+    {"_id": "<user_id>:2026-10-17", "user_id": ..., "day": "2026-10-17",
+     "count": 3, "visits": [[offset_seconds, page_depth], ...]}
+
+Visits are appended with $push/$each and upsert, through a write-behind
+buffer that groups a flush into one bulk_write. BucketBackfillJob converts
+the page_visits written before bucketing was enabled, and page_analytics()
+serves the admin analytics from the buckets.
+"""
+import logging
+import re
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from maintenance import BatchJob
+from page_depth import PAGE_DEPTH_ORDER, get_page_depth
+from write_behind import WriteBehindBuffer
+
+logger = logging.getLogger(__name__)
+
+BUCKET_COLLECTION = "page_visit_buckets"
+# "documents": page_visits only, "buckets": page_visit_buckets only, "both": dual write
+STORAGE_MODES = ("documents", "buckets", "both")
+# maintenance_jobs document recording when live bucket writes started
+BUCKETING_MARKER_ID = "page_visit_bucketing"
+DUPLICATE_KEY = 11000
+
+
+def bucket_key(user_id: str, at: datetime):
+    """(bucket _id, day, offset_seconds) for a visit at `at`"""
+    at = at.astimezone(timezone.utc)
+    day = at.strftime("%Y-%m-%d")
+    offset = at.hour * 3600 + at.minute * 60 + at.second
+    return f"{user_id}:{day}", day, offset
+
+
+def bucket_updates(visits, guard_id=None) -> list:
+    """
+    Group visits ({"user_id", "timestamp": datetime, "depth"}) into one upsert
+    per bucket. Returns [(UpdateOne, visit count)] in first-seen order.
+
+    With guard_id (backfill), a bucket already carrying a backfill_last_id at
+    or past it is skipped: the upsert then hits a duplicate _id, which the
+    caller treats as "already applied".
+    """
+    grouped = OrderedDict()
+    for visit in visits:
+        bucket_id, day, offset = bucket_key(visit["user_id"], visit["timestamp"])
+        entry = grouped.setdefault(bucket_id, {"user_id": visit["user_id"], "day": day, "pairs": []})
+        entry["pairs"].append([offset, visit["depth"]])
+
+    ops = []
+    for bucket_id, entry in grouped.items():
+        query = {"_id": bucket_id}
+        update = {
+            "$push": {"visits": {"$each": entry["pairs"]}},
+            "$inc": {"count": len(entry["pairs"])},
+            "$setOnInsert": {"user_id": entry["user_id"], "day": entry["day"]},
+        }
+        if guard_id is not None:
+            query["backfill_last_id"] = {"$not": {"$gte": guard_id}}
+            update["$set"] = {"backfill_last_id": guard_id}
+        ops.append((UpdateOne(query, update, upsert=True), len(entry["pairs"])))
+    return ops
+
+
+async def write_buckets(collection, ops: list, skip_duplicates: bool = False) -> int:
+    """Run bucket_updates() ops as one unordered bulk_write; returns the visits written"""
+    if not ops:
+        return 0
+    try:
+        await collection.bulk_write([op for op, _ in ops], ordered=False)
+        return sum(n for _, n in ops)
+    except BulkWriteError as e:
+        failed = 0
+        for error in e.details.get("writeErrors", []):
+            if skip_duplicates and error.get("code") == DUPLICATE_KEY:
+                continue
+            failed += ops[error["index"]][1]
+        return sum(n for _, n in ops) - failed
+
+
+class VisitBucketBuffer(WriteBehindBuffer):
+    """Write-behind buffer whose flushes become one $push upsert per bucket"""
+
+    async def store(self, batch: list) -> int:
+        return await write_buckets(self.get_collection(), bucket_updates(batch))
+
+
+async def mark_bucketing_started(db) -> str:
+    """Record (once) when live bucket writes began; older page_visits are the backfill's job"""
+    now = datetime.now(timezone.utc).isoformat()
+    await db.maintenance_jobs.update_one(
+        {"_id": BUCKETING_MARKER_ID},
+        {"$setOnInsert": {"since": now}},
+        upsert=True
+    )
+    marker = await db.maintenance_jobs.find_one({"_id": BUCKETING_MARKER_ID})
+    return marker["since"]
+
+
+class BucketBackfillJob(BatchJob):
+    """Converts page_visits written before bucketing started into page_visit_buckets"""
+
+    name = "page_visit_bucket_backfill"
+    collection = "page_visits"
+    projection = {"_id": 1, "user_id": 1, "page_path": 1, "timestamp": 1}
+    counters = ("visits_bucketed", "skipped")
+
+    async def query(self) -> dict:
+        marker = await self.db.maintenance_jobs.find_one({"_id": BUCKETING_MARKER_ID})
+        # No marker: buckets were never written live, so every visit needs converting
+        if not marker:
+            return {}
+        # Cut on the ObjectId insert time: timestamp comes from the client and can't be trusted
+        return {"_id": {"$lt": ObjectId.from_datetime(datetime.fromisoformat(marker["since"]))}}
+
+    async def process(self, batch: list):
+        visits = []
+        for doc in batch:
+            try:
+                at = datetime.fromisoformat(doc["timestamp"])
+            except (KeyError, TypeError, ValueError):
+                self.counts["skipped"] += 1
+                continue
+            if at.tzinfo is None:
+                at = at.replace(tzinfo=timezone.utc)
+            visits.append({"user_id": doc.get("user_id"), "timestamp": at, "depth": get_page_depth(doc.get("page_path"))})
+        ops = bucket_updates(visits, guard_id=batch[-1]["_id"])
+        self.counts["visits_bucketed"] += await write_buckets(self.db[BUCKET_COLLECTION], ops, skip_duplicates=True)
+
+
+async def delete_user_buckets(db, user_id: str):
+    # Bucket _ids start with the user_id, so this is an _id index prefix scan
+    await db[BUCKET_COLLECTION].delete_many({"_id": {"$regex": f"^{re.escape(user_id)}:"}})
+
+
+async def page_analytics(db, start_day: str, end_day: str) -> dict:
+    """Daily views / active users and views per page between two YYYY-MM-DD days (inclusive)"""
+    match = {"$match": {"day": {"$gte": start_day, "$lte": end_day}}}
+    buckets = db[BUCKET_COLLECTION]
+    daily = await buckets.aggregate([
+        match,
+        # One bucket per user per day: the bucket count is the day's active users
+        {"$group": {"_id": "$day", "views": {"$sum": "$count"}, "active_users": {"$sum": 1}}},
+        {"$sort": {"_id": 1}},
+    ]).to_list(length=None)
+    users = await buckets.aggregate([
+        match,
+        {"$group": {"_id": "$user_id"}},
+        {"$count": "users"},
+    ]).to_list(length=None)
+    pages = await buckets.aggregate([
+        match,
+        {"$unwind": "$visits"},
+        {"$group": {"_id": {"$arrayElemAt": ["$visits", 1]}, "views": {"$sum": 1}}},
+        {"$sort": {"_id": 1}},
+    ]).to_list(length=None)
+
+    def page_name(depth):
+        return PAGE_DEPTH_ORDER[depth] if 0 <= depth < len(PAGE_DEPTH_ORDER) else "other"
+
+    return {
+        "start": start_day,
+        "end": end_day,
+        "total_views": sum(d["views"] for d in daily),
+        "unique_users": users[0]["users"] if users else 0,
+        "days": [{"day": d["_id"], "views": d["views"], "active_users": d["active_users"]} for d in daily],
+        "pages": [{"page": page_name(p["_id"]), "depth": p["_id"], "views": p["views"]} for p in pages],
+    }
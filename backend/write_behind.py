@@ -0,0 +1,185 @@
+"""
+Write-behind buffer for analytics inserts (page_visits, login_events).
+
+Every page view and login used to await its own insert_one. A
+WriteBehindBuffer collects the event documents in memory and writes them
+with one unordered insert_many once `max_batch` documents are pending or
+the oldest has waited `max_age` seconds. Memory is bounded by
+`max_buffer`; past that, new events are dropped or the caller waits for the
+next flush, depending on the overflow policy. stop() flushes whatever is
+left, so call it on shutdown before the Mongo client is closed.
+
+Subclasses change how a flushed batch is stored by overriding store();
+IncrementBuffer turns counter increments into one $inc upsert per document.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("drop", "block")
+
+
+class WriteBehindBuffer:
+    """Bounded in-memory queue of documents flushed to one collection with insert_many"""
+
+    def __init__(self, name: str, get_collection, max_batch: int = 100, max_age: float = 1.0,
+                 max_buffer: int = 10000, overflow: str = "drop"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r}, expected one of {OVERFLOW_POLICIES}")
+        self.name = name
+        # Resolved on every flush so the target follows the module-level db
+        self.get_collection = get_collection
+        self.max_batch = max(1, max_batch)
+        self.max_age = max_age
+        self.max_buffer = max(self.max_batch, max_buffer)
+        self.overflow = overflow
+        self._buffer = []
+        self._oldest_at = None
+        self._wake = asyncio.Event()
+        self._space = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._stopping = False
+        self.added = 0
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.batches = 0
+        self.max_batch_seen = 0
+        self.total_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            # Let the flusher finish its current batch rather than cancelling it mid-insert
+            self._stopping = True
+            self._wake.set()
+            await self._task
+            self._task = None
+            self._stopping = False
+        await self.flush()
+
+    async def add(self, document: dict) -> bool:
+        """Queue one document. Returns False if it was dropped because the buffer is full."""
+        while len(self._buffer) >= self.max_buffer:
+            if self.overflow == "drop":
+                self.dropped += 1
+                if self.dropped % 1000 == 1:
+                    logger.warning(f"Write-behind buffer {self.name} full, {self.dropped} event(s) dropped so far")
+                return False
+            self.blocked += 1
+            if self._task is None:
+                # No background flusher (not started, or stopping): make room ourselves
+                await self.flush()
+                continue
+            self._space.clear()
+            self._wake.set()
+            await self._space.wait()
+
+        if not self._buffer:
+            self._oldest_at = time.monotonic()
+        self._buffer.append(document)
+        self.added += 1
+        if len(self._buffer) >= self.max_batch:
+            self._wake.set()
+        return True
+
+    async def _run(self):
+        while not self._stopping:
+            timeout = self.max_age
+            if self._oldest_at is not None:
+                timeout = max(0.0, self._oldest_at + self.max_age - time.monotonic())
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind buffer {self.name} flush failed: {e}")
+
+    async def flush(self):
+        """Write everything pending in batches of at most max_batch"""
+        async with self._flush_lock:
+            while self._buffer:
+                batch = self._buffer[:self.max_batch]
+                del self._buffer[:self.max_batch]
+                self._oldest_at = time.monotonic() if self._buffer else None
+                self._space.set()
+                await self._write(batch)
+
+    async def store(self, batch: list) -> int:
+        """Write one batch and return how many documents made it"""
+        try:
+            # Unordered: one bad document doesn't stop the rest of the batch
+            await self.get_collection().insert_many(batch, ordered=False)
+            return len(batch)
+        except BulkWriteError as e:
+            return e.details.get("nInserted", 0)
+
+    async def _write(self, batch: list):
+        started = time.perf_counter()
+        try:
+            written = await self.store(batch)
+        except Exception as e:
+            written = 0
+            logger.error(f"Write-behind buffer {self.name}: batch of {len(batch)} lost: {e}")
+        if written < len(batch):
+            logger.error(f"Write-behind buffer {self.name}: {len(batch) - written} of {len(batch)} writes failed")
+        self.written += written
+        self.failed += len(batch) - written
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.batches += 1
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        self.total_flush_ms += elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+
+    def stats(self) -> dict:
+        return {
+            "overflow": self.overflow,
+            "buffered": len(self._buffer),
+            "max_buffer": self.max_buffer,
+            "added": self.added,
+            "written": self.written,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "blocked": self.blocked,
+            "batches": self.batches,
+            "avg_batch_size": round((self.written + self.failed) / self.batches, 1) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "avg_flush_ms": round(self.total_flush_ms / self.batches, 2) if self.batches else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
+
+
+class IncrementBuffer(WriteBehindBuffer):
+    """
+    Write-behind buffer for counters. Items are (document _id, {field: n});
+    a flush sums them per document and applies one $inc upsert each.
+    """
+
+    async def store(self, batch: list) -> int:
+        totals = OrderedDict()
+        items = Counter()
+        for doc_id, increments in batch:
+            totals.setdefault(doc_id, Counter()).update(increments)
+            items[doc_id] += 1
+        ids = list(totals)
+        ops = [UpdateOne({"_id": doc_id}, {"$inc": dict(totals[doc_id])}, upsert=True) for doc_id in ids]
+        try:
+            await self.get_collection().bulk_write(ops, ordered=False)
+            return len(batch)
+        except BulkWriteError as e:
+            return len(batch) - sum(items[ids[error["index"]]] for error in e.details.get("writeErrors", []))
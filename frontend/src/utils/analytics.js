@@ -3,6 +3,14 @@ import { API_BASE_URL } from './apiConfig';
 
 const BACKEND_URL = API_BASE_URL;
 
+// Page visits are buffered and sent together to /api/track-pages
+const FLUSH_DELAY_MS = 5000;
+const MAX_BATCH = 20;
+
+let pendingVisits = [];
+let pendingToken = null;
+let flushTimer = null;
+
 // Generate or retrieve session ID
 const getSessionId = () => {
   let sessionId = sessionStorage.getItem('quit_session_id');
@@ -14,20 +22,36 @@ const getSessionId = () => {
 };
 
 /**
- * Track a page visit for analytics
- * @param {string} pagePath - The path of the page being visited
- * @param {string} token - The user's JWT token
+ * Send all buffered page visits in one request
+ * @param {boolean} keepalive - Use fetch keepalive so the request survives page unload
  */
-export const trackPageVisit = async (pagePath, token) => {
-  if (!token || !BACKEND_URL) return;
-  
+export const flushPageVisits = async (keepalive = false) => {
+  if (flushTimer) {
+    clearTimeout(flushTimer);
+    flushTimer = null;
+  }
+  if (!pendingVisits.length || !pendingToken) return;
+
+  const visits = pendingVisits;
+  const token = pendingToken;
+  pendingVisits = [];
+
   try {
+    if (keepalive) {
+      fetch(`${BACKEND_URL}/api/track-pages`, {
+        method: 'POST',
+        keepalive: true,
+        headers: {
+          'Content-Type': 'application/json',
+          Authorization: `Bearer ${token}`
+        },
+        body: JSON.stringify({ visits })
+      });
+      return;
+    }
     await axios.post(
-      `${BACKEND_URL}/api/track-page`,
-      {
-        page_path: pagePath,
-        session_id: getSessionId()
-      },
+      `${BACKEND_URL}/api/track-pages`,
+      { visits },
       {
         headers: {
           Authorization: `Bearer ${token}`
@@ -40,4 +64,39 @@ export const trackPageVisit = async (pagePath, token) => {
   }
 };
 
-export default { trackPageVisit, getSessionId };
+/**
+ * Track a page visit for analytics
+ * @param {string} pagePath - The path of the page being visited
+ * @param {string} token - The user's JWT token
+ */
+export const trackPageVisit = async (pagePath, token) => {
+  if (!token || !BACKEND_URL) return;
+
+  // A different user (or a refreshed token): send what belongs to the previous one first
+  if (pendingToken && pendingToken !== token) {
+    await flushPageVisits();
+  }
+  pendingToken = token;
+  pendingVisits.push({
+    page_path: pagePath,
+    session_id: getSessionId(),
+    client_timestamp: new Date().toISOString()
+  });
+
+  if (pendingVisits.length >= MAX_BATCH) {
+    await flushPageVisits();
+  } else if (!flushTimer) {
+    flushTimer = setTimeout(() => flushPageVisits(), FLUSH_DELAY_MS);
+  }
+};
+
+if (typeof window !== 'undefined') {
+  window.addEventListener('pagehide', () => flushPageVisits(true));
+  document.addEventListener('visibilitychange', () => {
+    if (document.visibilityState === 'hidden') {
+      flushPageVisits(true);
+    }
+  });
+}
+
+export default { trackPageVisit, flushPageVisits, getSessionId };
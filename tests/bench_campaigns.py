@@ -0,0 +1,131 @@
+"""
+End-to-end campaign run: real MongoDB (BENCH_MONGO_URL, default localhost)
+plus a local fake of the Brevo send endpoint. The campaign is interrupted
+half-way and resumed; every verified user must be emailed exactly once.
+A second campaign runs through a Brevo outage long enough to open the
+circuit breaker; it must still reach every unverified user exactly once.
+A third one is rejected by Brevo: every recipient lands in campaign_failures.
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+
+from campaigns import CampaignJob  # noqa: E402
+from circuit_breaker import CircuitBreaker  # noqa: E402
+from email_dispatcher import EmailDispatcher  # noqa: E402
+
+MONGO_URL = os.environ.get("BENCH_MONGO_URL", "mongodb://localhost:27017")
+USERS = int(os.environ.get("BENCH_USERS", "250"))
+
+
+class FakeBrevo(BaseHTTPRequestHandler):
+    recipients = Counter()
+    calls = 0
+    # Answer 503 to this many calls (simulated outage)
+    fail_next = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.lock:
+            type(self).calls += 1
+            if body["subject"] == "Rejected":
+                status = 400
+            elif type(self).fail_next > 0:
+                type(self).fail_next -= 1
+                status = 503
+            else:
+                status = None
+            if status:
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            for version in body["messageVersions"]:
+                type(self).recipients[version["to"][0]["email"]] += 1
+        self.send_response(201)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeBrevo)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/v3/smtp/email"
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[f"bench_campaigns_{os.getpid()}"]
+
+    async def scenario():
+        await db.access.insert_many(
+            [{"email": f"user{i}@example.com", "is_verified": i % 5 != 0} for i in range(USERS)]
+            + [{"email": "legacy@example.com"}]  # no is_verified field -> counts as verified
+        )
+        dispatcher = EmailDispatcher("test-key", api_url=url)
+        await dispatcher.open()
+        sender = {"name": "Test", "email": "no-reply@example.com"}
+        campaign = await CampaignJob.create(db, "News", "<p>Hello</p>", "verified", sender, "admin@example.com")
+
+        job = CampaignJob(db, dispatcher, campaign, batch_size=25, target_per_sec=1000)
+        job.start()
+        while job.sent < 100:
+            await asyncio.sleep(0.01)
+        await job.cancel()
+        assert (await db.campaigns.find_one({"_id": campaign["_id"]}))["status"] == "paused"
+
+        resumed = CampaignJob(db, dispatcher, await db.campaigns.find_one({"_id": campaign["_id"]}), batch_size=25, target_per_sec=1000)
+        await resumed.start()
+        await dispatcher.close()
+
+        # Outage: 8 failing calls open the breaker; the job must wait it out without skipping anyone
+        dispatcher = EmailDispatcher("test-key", api_url=url, backoff_base=0.01,
+                                     breaker=CircuitBreaker("brevo", open_seconds=0.2))
+        await dispatcher.open()
+        outage = await CampaignJob.create(db, "Reminder", "<p>Verify</p>", "unverified", sender, "admin@example.com")
+        FakeBrevo.fail_next = 8
+        outage_job = CampaignJob(db, dispatcher, outage, batch_size=10, target_per_sec=1000, retry_backoff=0.05)
+        await outage_job.start()
+
+        rejected = await CampaignJob.create(db, "Rejected", "<p>Nope</p>", "unverified", sender, "admin@example.com")
+        rejected_job = CampaignJob(db, dispatcher, rejected, batch_size=10, target_per_sec=1000)
+        await rejected_job.start()
+        failures = await db.campaign_failures.count_documents({"campaign_id": rejected["_id"]})
+        await dispatcher.close()
+        return (campaign, resumed.progress(), outage_job.progress(), dispatcher.stats()["short_circuited"],
+                rejected_job.progress(), failures)
+
+    try:
+        campaign, progress, outage_progress, short_circuited, rejected_progress, failures = asyncio.run(scenario())
+    finally:
+        asyncio.run(client.drop_database(db.name))
+        server.shutdown()
+        client.close()
+
+    expected = USERS - USERS // 5 + 1
+    assert campaign["total"] == expected
+    assert progress["status"] == "done" and progress["sent"] == expected and progress["failed"] == 0, progress
+    assert len(FakeBrevo.recipients) == USERS + 1, len(FakeBrevo.recipients)
+    assert set(FakeBrevo.recipients.values()) == {1}, Counter(FakeBrevo.recipients.values())
+    print(f"{expected} recipients in {FakeBrevo.calls} API calls: {progress}")
+    assert outage_progress["status"] == "done" and outage_progress["sent"] == USERS // 5, outage_progress
+    assert outage_progress["failed"] == 0
+    print(f"through the outage ({short_circuited} calls short-circuited): {outage_progress}")
+    assert rejected_progress["status"] == "done" and rejected_progress["failed"] == failures == USERS // 5, rejected_progress
+    print(f"rejected campaign: {failures} recipients in campaign_failures")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
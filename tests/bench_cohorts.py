@@ -0,0 +1,140 @@
+"""
+Cohort retention counters vs an exact recount from login_events.
+
+Needs a reachable MongoDB (BENCH_MONGO_URL, default localhost); data goes
+to a throwaway database that is dropped afterwards. Creates BENCH_USERS
+users registered over the last BENCH_WEEKS weeks with decaying weekly
+login probabilities, then:
+
+1. runs CohortBackfillJob and compares the matrix with a recount in Python;
+2. replays the current week's logins through the live login hook and runs
+   the backfill again: nothing may be counted twice.
+
+Prints the backfill rate and the matrix read time.
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", os.environ.get("BENCH_MONGO_URL", "mongodb://localhost:27017"))
+os.environ.setdefault("DB_NAME", "bench")
+
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+
+import server  # noqa: E402
+from cohorts import CohortBackfillJob, cohort_matrix, week_offset, week_start  # noqa: E402
+from db_indexes import ensure_indexes  # noqa: E402
+
+MONGO_URL = os.environ.get("BENCH_MONGO_URL", "mongodb://localhost:27017")
+USERS = int(os.environ.get("BENCH_USERS", "1500"))
+WEEKS = int(os.environ.get("BENCH_WEEKS", "12"))
+
+
+def synthetic(rng, now):
+    users, logins = [], []
+    for _ in range(USERS):
+        created = now - timedelta(weeks=rng.uniform(0, WEEKS - 0.01))
+        user = {"user_id": str(uuid.uuid4()), "email": f"{uuid.uuid4().hex[:12]}@example.com",
+                "created_at": created.isoformat()}
+        users.append(user)
+        at = created
+        while True:
+            at += timedelta(days=rng.expovariate(1 / (3 + 4 * rng.random())))
+            if at > now or rng.random() < 0.12:
+                break
+            logins.append({"user_id": user["user_id"], "email": user["email"], "timestamp": at.isoformat()})
+    return users, logins
+
+
+def exact_matrix(users, logins):
+    created = {u["user_id"]: u["created_at"] for u in users}
+    size = defaultdict(int)
+    returned = defaultdict(set)
+    for u in users:
+        size[week_start(u["created_at"])] += 1
+    for login in logins:
+        k = week_offset(created[login["user_id"]], login["timestamp"])
+        if k >= 1:
+            returned[(week_start(created[login["user_id"]]), k)].add(login["user_id"])
+    return size, {key: len(ids) for key, ids in returned.items()}
+
+
+def matches(matrix, size, returned):
+    for row in matrix["cohorts"]:
+        if row["size"] != size.get(row["cohort"], 0):
+            return False
+        for k, n in enumerate(row["returned"], start=1):
+            if n != returned.get((row["cohort"], k), 0):
+                return False
+    return True
+
+
+async def run(db):
+    await ensure_indexes(db)
+    now = datetime.now(timezone.utc)
+    users, logins = synthetic(random.Random(17), now)
+    # Logins of the current week arrive "live" after the backfill
+    current_week = week_start(now)
+    history = [login for login in logins if week_start(login["timestamp"]) != current_week]
+    live = [login for login in logins if week_start(login["timestamp"]) == current_week]
+    await db.access.insert_many([dict(u) for u in users])
+    await db.login_events.insert_many([dict(login) for login in history])
+
+    job = CohortBackfillJob(db, batch_size=200, target_docs_per_sec=10 ** 9)
+    await job.start()
+    progress = job.progress()
+    matrix = await cohort_matrix(db, WEEKS + 1)
+    size, returned = exact_matrix(users, history)
+    ok = progress["status"] == "done" and matches(matrix, size, returned)
+    print(f"backfill: {progress['users']} users, {progress['logins_scanned']} logins at "
+          f"{progress['docs_per_sec']} users/s, {progress['weeks_counted']} user-weeks; matches recount: {ok}")
+
+    server.cohort_buffer.start()
+    created = {u["user_id"]: u["created_at"] for u in users}
+    for login in live:
+        k = week_offset(created[login["user_id"]], login["timestamp"])
+        if k >= 1:
+            await server.record_cohort_login(login["email"], k)
+    await server.cohort_buffer.stop()
+    await db.login_events.insert_many([dict(login) for login in live])
+    # The live logins are in login_events now: a rerun must find every bit already set
+    rerun = CohortBackfillJob(db, batch_size=200, target_docs_per_sec=10 ** 9)
+    await rerun.start()
+
+    started = time.perf_counter()
+    matrix = await cohort_matrix(db, WEEKS + 1)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    size, returned = exact_matrix(users, logins)
+    ok = ok and rerun.counts["weeks_counted"] == 0 and rerun.counts["signups_counted"] == 0 and matches(matrix, size, returned)
+    print(f"after {len(live)} live logins and a rerun: matches recount: {ok}, matrix read in {elapsed_ms:.1f} ms")
+    for row in matrix["cohorts"]:
+        print(f"  {row['cohort']} {row['size']:>5}  " + " ".join(f"{r:>5.0%}" for r in row["retention"]))
+    return ok
+
+
+def main():
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[f"bench_cohorts_{os.getpid()}"]
+    server.db = db
+
+    async def scenario():
+        try:
+            return await run(db)
+        finally:
+            await client.drop_database(db.name)
+
+    try:
+        return asyncio.run(scenario())
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,111 @@
+"""
+Funnel rollups: live $inc counters vs a rebuild from raw visits.
+
+Needs a reachable MongoDB (BENCH_MONGO_URL, default localhost); data goes
+to a throwaway database that is dropped afterwards. Simulated users walk
+part of the flow through /api/track-pages concurrently; the rebuild job
+must then find no day where the live rollups differ from the raw events,
+and the funnel report is timed. With visits in the archive, an applying
+rebuild must leave the live rollups alone.
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", os.environ.get("BENCH_MONGO_URL", "mongodb://localhost:27017"))
+os.environ.setdefault("DB_NAME", "bench")
+os.environ.setdefault("PAGE_VISIT_STORAGE", "both")
+
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+
+import server  # noqa: E402
+from funnel import FunnelRebuildJob, funnel_report  # noqa: E402
+from page_depth import PAGE_DEPTH_ORDER  # noqa: E402
+from retention import write_partition  # noqa: E402
+
+MONGO_URL = os.environ.get("BENCH_MONGO_URL", "mongodb://localhost:27017")
+USERS = int(os.environ.get("BENCH_USERS", "200"))
+
+
+async def run(db):
+    rng = random.Random(3)
+    await db.access.insert_many([{"user_id": f"u{i}", "email": f"user{i}@example.com"} for i in range(USERS)])
+    for buffer in (server.page_visits_buffer, server.visit_bucket_buffer, server.funnel_buffer):
+        buffer.start()
+
+    now = datetime.now(timezone.utc)
+
+    async def walk(i):
+        # A few sessions in the last day (accepted client timestamps), going a bit deeper each time
+        stop = rng.randrange(1, len(PAGE_DEPTH_ORDER) + 1)
+        for session in range(rng.randrange(1, 4)):
+            at = now - timedelta(hours=20 - 7 * session, minutes=rng.randrange(60))
+            pages = PAGE_DEPTH_ORDER[:min(stop, 3 + 3 * session)] + (["/admin"] if rng.random() < 0.2 else [])
+            visits = [
+                server.PageVisitRequest(page_path=page, session_id=f"s{i}-{session}",
+                                        client_timestamp=(at + timedelta(seconds=30 * n)).isoformat())
+                for n, page in enumerate(pages)
+            ]
+            await server.track_page_visits(server.PageVisitBatchRequest(visits=visits), email=f"user{i}@example.com")
+
+    await asyncio.gather(*[walk(i) for i in range(USERS)])
+    for buffer in (server.page_visits_buffer, server.visit_bucket_buffer, server.funnel_buffer):
+        await buffer.stop()
+
+    ok = True
+    for source in ("documents", "buckets"):
+        job = FunnelRebuildJob(db, source=source)
+        await job.start()
+        progress = job.progress()
+        print(f"rebuild from {source}: {progress['visits']} visits, {progress['users']} users, "
+              f"{progress['days']} days, mismatched days: {progress['mismatched_days']}")
+        ok = ok and progress["status"] == "done" and not progress["mismatched_days"]
+
+    # Yesterday's visits "archived": the raw events are now a partial history
+    with tempfile.TemporaryDirectory() as archive_dir:
+        day = (now - timedelta(days=1)).date().isoformat()
+        write_partition(Path(archive_dir) / "page_visits" / f"date={day}" / "part-0",
+                        [{"user_id": "u0", "page_path": PAGE_DEPTH_ORDER[0], "timestamp": f"{day}T12:00:00+00:00"}])
+        live = await db.funnel_daily.find().sort("_id", 1).to_list(length=None)
+        job = FunnelRebuildJob(db, source="documents", apply=True, archive_dir=archive_dir)
+        await job.start()
+        progress = job.progress()
+        print(f"applying rebuild with archived visits: applied={progress['applied']}, refused: {progress['apply_refused']}")
+        ok = ok and not progress["applied"] and progress["apply_refused"]
+        ok = ok and await db.funnel_daily.find().sort("_id", 1).to_list(length=None) == live
+
+    start, end = (now - timedelta(days=7)).date().isoformat(), now.date().isoformat()
+    started = time.perf_counter()
+    report = await funnel_report(db, start, end)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    for step in report["steps"]:
+        print(f"  {step['page']:<24} {step['users_reached']:>5} users  {step['conversion_from_start']:>7.1%}")
+    print(f"funnel report over {report['days_with_data']} days: {elapsed_ms:.1f} ms")
+    return ok and report["steps"][0]["users_reached"] == USERS
+
+
+def main():
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[f"bench_funnel_{os.getpid()}"]
+    server.db = db
+
+    async def scenario():
+        try:
+            return await run(db)
+        finally:
+            await client.drop_database(db.name)
+
+    try:
+        return asyncio.run(scenario())
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
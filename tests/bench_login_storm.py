@@ -0,0 +1,87 @@
+"""
+Benchmark: /api/track-page latency with and without a concurrent login storm.
+
+Run against a local backend (uvicorn server:app --port 8000). BENCH_EMAIL /
+BENCH_PASSWORD must belong to a verified account; the storm reuses them so
+every login performs a real bcrypt check.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+HOST = os.environ.get("BENCH_HOST", "localhost")
+PORT = int(os.environ.get("BENCH_PORT", "8000"))
+EMAIL = os.environ.get("BENCH_EMAIL", "")
+PASSWORD = os.environ.get("BENCH_PASSWORD", "")
+REQUESTS = int(os.environ.get("BENCH_REQUESTS", "400"))
+CONCURRENCY = int(os.environ.get("BENCH_CONCURRENCY", "16"))
+STORM_THREADS = int(os.environ.get("BENCH_STORM_THREADS", "8"))
+
+
+def post(path, payload, token=None):
+    conn = http.client.HTTPConnection(HOST, PORT, timeout=30)
+    headers = {"Content-type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    try:
+        conn.request("POST", path, json.dumps(payload), headers)
+        resp = conn.getresponse()
+        return resp.status, resp.read()
+    finally:
+        conn.close()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def track_page_load(token):
+    def one(_):
+        started = time.perf_counter()
+        post("/api/track-page", {"page_path": "/income", "session_id": "bench"}, token)
+        return (time.perf_counter() - started) * 1000
+
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        return list(pool.map(one, range(REQUESTS)))
+
+
+def login_storm(stop: threading.Event):
+    while not stop.is_set():
+        post("/api/auth/login", {"email": EMAIL, "password": PASSWORD})
+
+
+def run():
+    status, body = post("/api/auth/login", {"email": EMAIL, "password": PASSWORD})
+    if status != 200:
+        print(f"Login failed ({status}): {body}")
+        return False
+    token = json.loads(body)["token"]
+
+    baseline = track_page_load(token)
+
+    stop = threading.Event()
+    storm = [threading.Thread(target=login_storm, args=(stop,), daemon=True) for _ in range(STORM_THREADS)]
+    for t in storm:
+        t.start()
+    try:
+        under_storm = track_page_load(token)
+    finally:
+        stop.set()
+        for t in storm:
+            t.join()
+
+    for label, samples in [("baseline", baseline), ("login storm", under_storm)]:
+        print(f"{label:>12}: p50={percentile(samples, 50):7.1f} ms  p99={percentile(samples, 99):7.1f} ms  n={len(samples)}")
+    return True
+
+
+if __name__ == "__main__":
+    if not EMAIL or not PASSWORD:
+        print("Set BENCH_EMAIL and BENCH_PASSWORD to a verified account")
+        sys.exit(1)
+    sys.exit(0 if run() else 1)
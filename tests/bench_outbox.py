@@ -0,0 +1,105 @@
+"""
+Benchmark: email outbox throughput against a local stub mail API.
+
+Needs a reachable MongoDB (BENCH_MONGO_URL, default localhost); jobs are
+written to a throwaway database that is dropped afterwards. A share of the
+stub's responses are 503s to exercise retry and dead-lettering, and a few
+recipients get a 400, which must be dead-lettered on the first attempt.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+
+from email_dispatcher import EmailDispatcher  # noqa: E402
+from outbox import OutboxWorker, enqueue_email, PRIORITY_TRANSACTIONAL  # noqa: E402
+
+MONGO_URL = os.environ.get("BENCH_MONGO_URL", "mongodb://localhost:27017")
+JOBS = int(os.environ.get("BENCH_JOBS", "2000"))
+WORKERS = int(os.environ.get("BENCH_WORKERS", "2"))
+BATCH_SIZE = int(os.environ.get("BENCH_BATCH_SIZE", "20"))
+FAIL_EVERY = int(os.environ.get("BENCH_FAIL_EVERY", "50"))
+# Jobs whose recipient the stub rejects with a 400
+REJECT_EVERY = 100
+
+
+class StubMailApi(BaseHTTPRequestHandler):
+    count = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        with self.lock:
+            type(self).count += 1
+            n = type(self).count
+        if b"reject" in body:
+            status = 400
+        else:
+            status = 503 if FAIL_EVERY and n % FAIL_EVERY == 0 else 201
+        self.send_response(status)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+async def run(db, url):
+    for i in range(JOBS):
+        priority = PRIORITY_TRANSACTIONAL if i % 10 == 0 else 0
+        email = f"reject{i}@example.com" if i % REJECT_EVERY == 7 else f"user{i}@example.com"
+        await enqueue_email(db, {"to": [{"email": email}], "subject": "bench"}, f"job {i}", priority)
+
+    dispatcher = EmailDispatcher("bench-key", api_url=url, workers=BATCH_SIZE * WORKERS, max_retries=0)
+    await dispatcher.open()
+    workers = [OutboxWorker(db, dispatcher, batch_size=BATCH_SIZE, max_attempts=3, retry_base_seconds=0) for _ in range(WORKERS)]
+
+    async def drain(worker):
+        while await worker.run_once():
+            pass
+
+    started = time.perf_counter()
+    # Retries become due immediately (retry_base_seconds=0), so keep going until nothing is claimable
+    while await db.email_outbox.count_documents({"status": {"$in": ["pending", "sending"]}}):
+        await asyncio.gather(*[drain(w) for w in workers])
+    elapsed = time.perf_counter() - started
+    await dispatcher.close()
+
+    sent = await db.email_outbox.count_documents({"status": "sent"})
+    dead = await db.email_outbox.count_documents({"status": "dead"})
+    rejected = await db.email_outbox.count_documents({"status": "dead", "attempts": 1, "payload.to.email": {"$regex": "^reject"}})
+    print(f"jobs: {JOBS}  workers: {WORKERS}  batch: {BATCH_SIZE}")
+    print(f"sent: {sent}  dead-lettered: {dead} ({rejected} rejected)  retries: {sum(w.retried for w in workers)}")
+    print(f"throughput: {JOBS / elapsed:.0f} jobs/s ({elapsed:.2f}s)")
+    return sent + dead == JOBS and rejected == len(range(7, JOBS, REJECT_EVERY))
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubMailApi)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[f"bench_outbox_{os.getpid()}"]
+
+    async def scenario():
+        try:
+            return await run(db, f"http://127.0.0.1:{server.server_port}/v3/smtp/email")
+        finally:
+            await client.drop_database(db.name)
+
+    try:
+        return asyncio.run(scenario())
+    finally:
+        server.shutdown()
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
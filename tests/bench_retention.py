@@ -0,0 +1,128 @@
+"""
+Retention: archive old page_visits/login_events and query the archives.
+
+Needs a reachable MongoDB (BENCH_MONGO_URL, default localhost); data goes
+to a throwaway database that is dropped afterwards and the archive files
+to a temporary directory. Events are inserted with ObjectIds dated over
+the past BENCH_DAYS days; ArchiveJob moves those older than the retention
+age out of Mongo. Prints rows/sec, bytes reclaimed vs bytes written, and
+checks that the archive report counts every archived event while the
+recent ones stay in Mongo.
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from bson import ObjectId  # noqa: E402
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+
+from page_depth import PAGE_DEPTH_ORDER  # noqa: E402
+from retention import ARCHIVE_FORMAT, archive_jobs, archived_daily_counts  # noqa: E402
+
+MONGO_URL = os.environ.get("BENCH_MONGO_URL", "mongodb://localhost:27017")
+EVENTS = int(os.environ.get("BENCH_EVENTS", "20000"))
+DAYS = int(os.environ.get("BENCH_DAYS", "120"))
+RETENTION_DAYS = int(os.environ.get("BENCH_RETENTION_DAYS", "30"))
+
+
+def oid_at(at):
+    """A unique ObjectId carrying the insert time `at` (from_datetime alone collides within a second)"""
+    return ObjectId(ObjectId.from_datetime(at).binary[:4] + ObjectId().binary[4:])
+
+
+def synthetic_events(rng, now):
+    for _ in range(EVENTS):
+        days_ago = rng.uniform(0, DAYS)
+        if abs(days_ago - RETENTION_DAYS) < 0.01:
+            # Keep clear of the cutoff, which the job computes a moment later
+            days_ago += 0.02
+        at = now - timedelta(days=days_ago)
+        timestamp = at.isoformat()
+        yield "page_visits", {
+            "_id": oid_at(at),
+            "user_id": f"u{rng.randrange(500)}",
+            "page_path": rng.choice(PAGE_DEPTH_ORDER),
+            "session_id": f"session_{rng.randrange(10 ** 6)}",
+            "timestamp": timestamp,
+        }
+        if rng.random() < 0.2:
+            yield "login_events", {
+                "_id": oid_at(at),
+                "email": f"user{rng.randrange(500)}@example.com",
+                "ip": f"10.0.{rng.randrange(256)}.{rng.randrange(256)}",
+                "timestamp": timestamp,
+            }
+
+
+async def run(db, archive_dir):
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(days=RETENTION_DAYS)
+    expected = {"page_visits": Counter(), "login_events": Counter()}
+    recent = Counter()
+    docs = {"page_visits": [], "login_events": []}
+    for collection, doc in synthetic_events(random.Random(11), now):
+        docs[collection].append(doc)
+        if doc["_id"].generation_time < cutoff:
+            expected[collection][doc["timestamp"][:10]] += 1
+        else:
+            recent[collection] += 1
+    for collection, rows in docs.items():
+        for i in range(0, len(rows), 5000):
+            await db[collection].insert_many(rows[i:i + 5000])
+
+    jobs = archive_jobs(db, retention_days=RETENTION_DAYS, archive_dir=archive_dir,
+                        batch_size=2000, target_docs_per_sec=10 ** 9)
+    started = time.perf_counter()
+    await asyncio.gather(*[job.start() for job in jobs])
+    elapsed = time.perf_counter() - started
+
+    ok = True
+    print(f"archive format: {ARCHIVE_FORMAT}, retention {RETENTION_DAYS} days, {elapsed:.2f}s")
+    for job in jobs:
+        progress = job.progress()
+        archived = progress["archived"]
+        left = await db[job.collection].count_documents({})
+        print(f"{job.collection:>14}: {archived} archived at {progress['docs_per_sec']} rows/s, "
+              f"{progress['files_written']} files, {progress['bytes_reclaimed']} BSON bytes reclaimed, "
+              f"{progress['bytes_written']} bytes on disk "
+              f"({progress['bytes_reclaimed'] / max(progress['bytes_written'], 1):.1f}x), {left} left in Mongo")
+
+        started = time.perf_counter()
+        counts = archived_daily_counts(job.collection, "0000-01-01", "9999-12-31", archive_dir=archive_dir)
+        print(f"{'':>14}  archive report over {len(counts)} days: {(time.perf_counter() - started) * 1000:.1f} ms")
+        ok = (ok and progress["status"] == "done" and archived == sum(expected[job.collection].values())
+              and counts == dict(sorted(expected[job.collection].items())) and left == recent[job.collection])
+
+    # A rerun finds nothing left to archive and writes no files
+    rerun = archive_jobs(db, retention_days=RETENTION_DAYS, archive_dir=archive_dir, target_docs_per_sec=10 ** 9)
+    await asyncio.gather(*[job.start() for job in rerun])
+    return ok and all(job.progress()["archived"] == 0 for job in rerun)
+
+
+def main():
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[f"bench_retention_{os.getpid()}"]
+
+    async def scenario():
+        try:
+            with tempfile.TemporaryDirectory() as archive_dir:
+                return await run(db, Path(archive_dir))
+        finally:
+            await client.drop_database(db.name)
+
+    try:
+        return asyncio.run(scenario())
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
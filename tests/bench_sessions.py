@@ -0,0 +1,135 @@
+"""
+Sessionization: incremental session summaries vs an exact recount.
+
+Needs a reachable MongoDB (BENCH_MONGO_URL, default localhost); data goes
+to a throwaway database that is dropped afterwards. Inserts BENCH_SESSIONS
+sessions of visits, runs SessionizeJob, then appends a second wave that
+continues some sessions and opens new ones. The second run must read only
+the new visits, and every summary must match the sessions recomputed in
+Python from all visits. Prints run times and the session stats query time.
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from bson import ObjectId  # noqa: E402
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+
+from db_indexes import ensure_indexes  # noqa: E402
+from page_depth import PAGE_DEPTH_ORDER, get_page_depth  # noqa: E402
+from sessions import SESSION_COLLECTION, SessionizeJob, session_stats  # noqa: E402
+
+MONGO_URL = os.environ.get("BENCH_MONGO_URL", "mongodb://localhost:27017")
+SESSIONS = int(os.environ.get("BENCH_SESSIONS", "1000"))
+
+
+def oid_at(at):
+    """A unique ObjectId carrying the insert time `at`"""
+    return ObjectId(ObjectId.from_datetime(at).binary[:4] + ObjectId().binary[4:])
+
+
+def session_visits(rng, session_id, user_id, at, first_page, count):
+    for n in range(count):
+        at += timedelta(seconds=rng.randrange(5, 180))
+        page = PAGE_DEPTH_ORDER[min(first_page + n, len(PAGE_DEPTH_ORDER) - 1)]
+        yield {
+            # Inserted "an hour ago" so the settle window doesn't hold them back
+            "_id": oid_at(datetime.now(timezone.utc) - timedelta(hours=1)),
+            "user_id": user_id,
+            "page_path": page if rng.random() > 0.05 else "/admin",
+            "session_id": session_id,
+            "timestamp": at.isoformat(),
+        }
+
+
+def exact_sessions(visits):
+    sessions = {}
+    for visit in sorted(visits, key=lambda v: (v["session_id"], v["timestamp"])):
+        s = sessions.setdefault(visit["session_id"], {
+            "start": visit["timestamp"], "pages": 0, "entry_page": visit["page_path"], "max_depth": -1,
+        })
+        s["end"] = visit["timestamp"]
+        s["pages"] += 1
+        s["drop_off_page"] = visit["page_path"]
+        s["max_depth"] = max(s["max_depth"], get_page_depth(visit["page_path"]))
+    return sessions
+
+
+async def run(db):
+    await ensure_indexes(db)
+    rng = random.Random(5)
+    start = datetime(2026, 9, 1, tzinfo=timezone.utc)
+    sessions = []
+    visits = []
+    for i in range(SESSIONS):
+        at = start + timedelta(days=rng.randrange(30), seconds=rng.randrange(80000))
+        batch = list(session_visits(rng, f"session_{i}", f"u{i % 300}", at, 0, rng.randrange(1, 9)))
+        sessions.append((f"session_{i}", f"u{i % 300}", datetime.fromisoformat(batch[-1]["timestamp"]), len(batch)))
+        visits += batch
+    await db.page_visits.insert_many([dict(v) for v in visits])
+
+    first_job = SessionizeJob(db, settle_seconds=60, target_docs_per_sec=10 ** 9)
+    started = time.perf_counter()
+    await first_job.start()
+    first_elapsed = time.perf_counter() - started
+
+    # Second wave: a third of the sessions go on, plus new sessions
+    wave = []
+    for session_id, user_id, last_at, pages in rng.sample(sessions, SESSIONS // 3):
+        wave += session_visits(rng, session_id, user_id, last_at, pages, rng.randrange(1, 4))
+    for i in range(SESSIONS, SESSIONS + SESSIONS // 10):
+        at = start + timedelta(days=rng.randrange(30), seconds=rng.randrange(80000))
+        wave += session_visits(rng, f"session_{i}", f"u{i % 300}", at, 0, rng.randrange(1, 9))
+    # Later ObjectIds, past the first run's watermark
+    await db.page_visits.insert_many([{**v, "_id": oid_at(datetime.now(timezone.utc) - timedelta(minutes=30))} for v in wave])
+
+    second_job = SessionizeJob(db, settle_seconds=60, target_docs_per_sec=10 ** 9)
+    started = time.perf_counter()
+    await second_job.start()
+    second_elapsed = time.perf_counter() - started
+
+    exact = exact_sessions(visits + wave)
+    stored = {s["_id"]: s async for s in db[SESSION_COLLECTION].find({})}
+    wrong = [
+        sid for sid, s in exact.items()
+        if sid not in stored or any(stored[sid][k] != v for k, v in s.items())
+    ]
+
+    started = time.perf_counter()
+    stats = await session_stats(db, "2026-09-01", "2026-10-31")
+    stats_ms = (time.perf_counter() - started) * 1000
+
+    print(f"first run: {first_job.processed_this_run} visits, {first_job.counts['sessions_updated']} sessions in {first_elapsed:.2f}s")
+    print(f"second run: {second_job.processed_this_run} new visits (of {len(visits) + len(wave)}), "
+          f"{second_job.counts['sessions_updated'] - first_job.counts['sessions_updated']} sessions in {second_elapsed:.2f}s")
+    print(f"{len(stored)} summaries, {len(wrong)} differing from the exact recount")
+    print(f"session stats: {stats['sessions']} sessions, {stats['avg_pages']} pages, "
+          f"{stats['avg_duration_seconds']}s avg, bounce {stats['bounce_rate']:.1%} in {stats_ms:.1f} ms")
+    return (not wrong and len(stored) == len(exact) and second_job.processed_this_run == len(wave)
+            and stats["sessions"] == len(exact))
+
+
+def main():
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[f"bench_sessions_{os.getpid()}"]
+
+    async def scenario():
+        try:
+            return await run(db)
+        finally:
+            await client.drop_database(db.name)
+
+    try:
+        return asyncio.run(scenario())
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
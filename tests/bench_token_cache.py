@@ -0,0 +1,61 @@
+"""
+Micro-benchmark: verify_token with and without the decoded-JWT cache.
+
+Imports backend/server.py in-process (no running server or Mongo needed;
+the Motor client connects lazily).
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "bench")
+
+from fastapi.security import HTTPAuthorizationCredentials  # noqa: E402
+import server  # noqa: E402
+
+ITERATIONS = int(os.environ.get("BENCH_ITERATIONS", "20000"))
+
+
+def time_calls(credentials, clear_each_time):
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        if clear_each_time:
+            server.token_cache.clear()
+        server.verify_token(credentials)
+    return (time.perf_counter() - started) / ITERATIONS * 1e6
+
+
+def test_token_cache():
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=server.create_token("bench@example.com"))
+    assert server.verify_token(credentials) == "bench@example.com"
+
+    uncached = time_calls(credentials, clear_each_time=True)
+    server.token_cache.clear()
+    cached = time_calls(credentials, clear_each_time=False)
+
+    print(f"uncached: {uncached:6.2f} us/call")
+    print(f"  cached: {cached:6.2f} us/call  ({uncached / cached:.1f}x)")
+    print(f"   stats: {server.token_cache.stats()}")
+    assert server.token_cache.stats()["hits"] >= ITERATIONS - 1
+
+    # Explicit invalidation forces the next call back through jwt.decode
+    server.token_cache.invalidate(credentials.credentials)
+    misses = server.token_cache.stats()["misses"]
+    server.verify_token(credentials)
+    assert server.token_cache.stats()["misses"] == misses + 1
+
+    # Account changes drop every cached token of that email, and only those
+    other = HTTPAuthorizationCredentials(scheme="Bearer", credentials=server.create_token("other@example.com"))
+    server.verify_token(other)
+    server.token_cache.invalidate_email("bench@example.com")
+    misses = server.token_cache.stats()["misses"]
+    server.verify_token(other)
+    server.verify_token(credentials)
+    assert server.token_cache.stats()["misses"] == misses + 1
+
+
+if __name__ == "__main__":
+    test_token_cache()
@@ -0,0 +1,112 @@
+"""
+Benchmark: /api/track-page requests/sec, previous read-modify-write path
+versus the current single atomic update.
+
+Needs a reachable MongoDB (BENCH_MONGO_URL, default localhost); users and
+visits are written to a throwaway database that is dropped afterwards. Each
+user gets the same shuffled mix of pages from concurrent requests, so the
+run also counts deepest-page updates the previous path lost to races.
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", os.environ.get("BENCH_MONGO_URL", "mongodb://localhost:27017"))
+os.environ.setdefault("DB_NAME", "bench")
+
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+
+import server  # noqa: E402
+from page_depth import PAGE_DEPTH_ORDER, get_page_depth, backfill_page_depth, deepest_page_of  # noqa: E402
+
+MONGO_URL = os.environ.get("BENCH_MONGO_URL", "mongodb://localhost:27017")
+USERS = int(os.environ.get("BENCH_USERS", "50"))
+VISITS_PER_USER = int(os.environ.get("BENCH_VISITS_PER_USER", "40"))
+CONCURRENCY = int(os.environ.get("BENCH_CONCURRENCY", "50"))
+
+
+async def previous_track_page(db, request, email):
+    """The read-modify-write path as it was before the atomic update"""
+    current_time = time.time()
+    user_doc = await db.access.find_one({"email": email}, {"_id": 0})
+    new_page_depth = get_page_depth(request.page_path)
+    current_deepest_depth = get_page_depth(user_doc.get("deepest_page", "/"))
+    update_data = {"last_page_visited": request.page_path, "last_page_visit_time": current_time}
+    if new_page_depth > current_deepest_depth:
+        update_data["deepest_page"] = request.page_path
+    await db.access.update_one({"email": email}, {"$set": update_data, "$inc": {"total_pages_viewed": 1}})
+    await db.page_visits.insert_one({
+        "user_id": user_doc.get("user_id"),
+        "email": email,
+        "page_path": request.page_path,
+        "session_id": request.session_id,
+        "timestamp": current_time
+    })
+
+
+async def run(db, track, label):
+    await db.access.delete_many({})
+    await db.page_visits.delete_many({})
+    await db.access.insert_many([
+        {
+            "user_id": f"u{i}",
+            "email": f"user{i}@example.com",
+            # Full-size document, as find_one({"_id": 0}) used to read it
+            "password": "$2b$12$" + "x" * 53,
+            "master_encryption_key": "k" * 140,
+        }
+        for i in range(USERS)
+    ])
+    rng = random.Random(42)
+    jobs = []
+    for i in range(USERS):
+        pages = [PAGE_DEPTH_ORDER[n % len(PAGE_DEPTH_ORDER)] for n in range(VISITS_PER_USER)]
+        rng.shuffle(pages)
+        jobs += [(f"user{i}@example.com", page) for page in pages]
+    rng.shuffle(jobs)
+
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def one(email, page):
+        async with semaphore:
+            await track(server.PageVisitRequest(page_path=page, session_id="bench"), email)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(email, page) for email, page in jobs])
+    elapsed = time.perf_counter() - started
+
+    await backfill_page_depth(db)
+    users = await db.access.find({}, {"_id": 0, "deepest_page": 1, "deepest_page_depth": 1}).to_list(length=None)
+    deepest = PAGE_DEPTH_ORDER[min(VISITS_PER_USER, len(PAGE_DEPTH_ORDER)) - 1]
+    lost = sum(1 for user in users if deepest_page_of(user) != deepest)
+    print(f"{label:>10}: {len(jobs) / elapsed:7.0f} req/s  ({elapsed:.2f}s, wrong deepest page: {lost}/{USERS})")
+    return len(jobs) / elapsed, lost
+
+
+def main():
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[f"bench_track_page_{os.getpid()}"]
+    server.db = db
+
+    async def scenario():
+        try:
+            before, _ = await run(db, lambda request, email: previous_track_page(db, request, email), "previous")
+            after, lost = await run(db, server.track_page_visit, "current")
+            return before, after, lost
+        finally:
+            await client.drop_database(db.name)
+
+    try:
+        before, after, lost = asyncio.run(scenario())
+    finally:
+        client.close()
+    print(f"speedup: {after / before:.2f}x")
+    return lost == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
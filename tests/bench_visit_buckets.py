@@ -0,0 +1,105 @@
+"""
+Report: page_visits documents vs page_visit_buckets on a synthetic dataset.
+
+Needs a reachable MongoDB (BENCH_MONGO_URL, default localhost); data goes
+to a throwaway database that is dropped afterwards. Generates BENCH_USERS
+users x BENCH_DAYS days of visits, converts them with BucketBackfillJob
+(twice, to check the rerun adds nothing) and prints document counts, data
+and index sizes, and checks the admin analytics totals against the source.
+"""
+import asyncio
+import os
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import bson  # noqa: E402
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+from pymongo.errors import OperationFailure  # noqa: E402
+
+from db_indexes import ensure_indexes  # noqa: E402
+from page_depth import PAGE_DEPTH_ORDER  # noqa: E402
+from visit_buckets import BUCKET_COLLECTION, BucketBackfillJob, page_analytics  # noqa: E402
+
+MONGO_URL = os.environ.get("BENCH_MONGO_URL", "mongodb://localhost:27017")
+USERS = int(os.environ.get("BENCH_USERS", "200"))
+DAYS = int(os.environ.get("BENCH_DAYS", "30"))
+VIEWS_PER_ACTIVE_DAY = int(os.environ.get("BENCH_VIEWS_PER_DAY", "15"))
+
+
+def synthetic_visits(rng):
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    for _ in range(USERS):
+        user_id = str(uuid.uuid4())
+        email = f"{user_id[:8]}@example.com"
+        for day in range(DAYS):
+            if rng.random() < 0.6:
+                continue
+            session = f"session_{rng.randrange(10 ** 12)}"
+            at = start + timedelta(days=day, seconds=rng.randrange(20 * 3600))
+            for n in range(rng.randrange(1, 2 * VIEWS_PER_ACTIVE_DAY)):
+                at += timedelta(seconds=rng.randrange(5, 120))
+                yield {
+                    "user_id": user_id,
+                    "email": email,
+                    "page_path": PAGE_DEPTH_ORDER[min(n, len(PAGE_DEPTH_ORDER) - 1)],
+                    "session_id": session,
+                    "timestamp": at.isoformat(),
+                }
+
+
+async def sizes(db, name):
+    try:
+        stats = await db.command({"collStats": name})
+        return stats["count"], stats["size"], stats.get("storageSize", 0), stats.get("totalIndexSize", 0)
+    except (OperationFailure, NotImplementedError, KeyError):
+        # No collStats (e.g. a mock): fall back to the BSON size of the documents
+        docs = await db[name].find({}).to_list(length=None)
+        return len(docs), sum(len(bson.encode(d)) for d in docs), 0, 0
+
+
+async def run(db):
+    await ensure_indexes(db)
+    visits = list(synthetic_visits(random.Random(7)))
+    for i in range(0, len(visits), 5000):
+        await db.page_visits.insert_many(visits[i:i + 5000])
+
+    job = BucketBackfillJob(db, batch_size=1000, target_docs_per_sec=10 ** 9)
+    await job.start()
+    bucketed = job.counts["visits_bucketed"]
+    await BucketBackfillJob(db, batch_size=1000, target_docs_per_sec=10 ** 9).start()
+
+    before = await sizes(db, "page_visits")
+    after = await sizes(db, BUCKET_COLLECTION)
+    report = await page_analytics(db, "2026-01-01", "2026-12-31")
+
+    print(f"synthetic visits: {len(visits)} ({USERS} users x {DAYS} days), converted at {job.progress()['docs_per_sec']} docs/s")
+    print(f"{'':>20} {'documents':>12} {'data bytes':>12} {'storage':>12} {'indexes':>12}")
+    print(f"{'page_visits':>20} {before[0]:>12} {before[1]:>12} {before[2]:>12} {before[3]:>12}")
+    print(f"{BUCKET_COLLECTION:>20} {after[0]:>12} {after[1]:>12} {after[2]:>12} {after[3]:>12}")
+    print(f"document count: {before[0] / after[0]:.1f}x fewer, data size: {before[1] / after[1]:.1f}x smaller")
+    return bucketed == len(visits) and report["total_views"] == len(visits)
+
+
+def main():
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[f"bench_visit_buckets_{os.getpid()}"]
+
+    async def scenario():
+        try:
+            return await run(db)
+        finally:
+            await client.drop_database(db.name)
+
+    try:
+        return asyncio.run(scenario())
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
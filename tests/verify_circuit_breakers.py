@@ -0,0 +1,194 @@
+"""
+Fault injection for the outbound integrations: local stubs of Brevo and
+ip-api that can be switched between healthy, erroring, slow and dropping
+connections, checked against the circuit breakers and bulkheads.
+"""
+import asyncio
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from circuit_breaker import CircuitBreaker  # noqa: E402
+from email_dispatcher import EmailDispatcher  # noqa: E402
+from geolocation import GeoResolver  # noqa: E402
+
+
+class FaultyStub(BaseHTTPRequestHandler):
+    """mode: "ok", "error" (503), "slow" (sleeps `delay`) or "drop" (closes the connection)"""
+    mode = "ok"
+    delay = 0.0
+    calls = 0
+
+    def _respond(self, body: dict, status: int = 200):
+        type(self).calls += 1
+        if self.mode == "drop":
+            self.close_connection = True
+            self.connection.close()
+            return
+        if self.mode == "slow":
+            time.sleep(self.delay)
+        if self.mode == "error":
+            status = 503
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._respond({"status": "success", "city": "Zurich", "country": "Switzerland"})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self._respond({"messageId": "stub"}, 201)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub(mode="ok", delay=0.0):
+    handler = type("Handler", (FaultyStub,), {"mode": mode, "delay": delay, "calls": 0})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, handler, f"http://127.0.0.1:{server.server_port}"
+
+
+def fast_breaker(name):
+    return CircuitBreaker(name, window_seconds=10, min_calls=4, failure_rate=0.5,
+                          slow_call_seconds=0.2, slow_call_rate=0.5, open_seconds=0.3)
+
+
+def test_brevo_errors_open_then_recover():
+    server, handler, url = start_stub("error")
+
+    async def scenario():
+        dispatcher = EmailDispatcher("key", api_url=url, max_retries=0, breaker=fast_breaker("brevo"))
+        await dispatcher.open()
+        try:
+            for _ in range(4):
+                assert not await dispatcher.send({"subject": "x"}, "probe")
+            assert dispatcher.breaker.state == "open"
+            # Open: no network call is made
+            calls = handler.calls
+            for _ in range(10):
+                assert not await dispatcher.send({"subject": "x"}, "short-circuited")
+            assert handler.calls == calls
+            assert dispatcher.stats()["breaker"]["short_circuited"] == 10
+
+            # A failed half-open probe re-opens the breaker
+            await asyncio.sleep(0.35)
+            assert not await dispatcher.send({"subject": "x"}, "probe")
+            assert dispatcher.breaker.state == "open"
+
+            # Once Brevo is healthy, the next probe closes it
+            handler.mode = "ok"
+            await asyncio.sleep(0.35)
+            assert await dispatcher.send({"subject": "x"}, "probe")
+            assert dispatcher.breaker.state == "closed"
+            assert dispatcher.breaker.times_opened == 2
+        finally:
+            await dispatcher.close()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        server.shutdown()
+
+
+def test_brevo_dropped_connections_open():
+    server, handler, url = start_stub("drop")
+
+    async def scenario():
+        dispatcher = EmailDispatcher("key", api_url=url, max_retries=3, backoff_base=0.01, breaker=fast_breaker("brevo"))
+        await dispatcher.open()
+        try:
+            # Retries stop as soon as the breaker opens: 4 attempts, not 4 + 3 more
+            assert not await dispatcher.send({"subject": "x"}, "dropped")
+            assert handler.calls == 4, handler.calls
+            assert dispatcher.breaker.state == "open"
+            assert dispatcher.short_circuited == 0
+        finally:
+            await dispatcher.close()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        server.shutdown()
+
+
+def test_slow_ip_api_opens_on_latency():
+    server, handler, url = start_stub("slow", delay=0.25)
+
+    async def scenario():
+        resolver = GeoResolver(base_url=url, timeout=2.0, breaker=fast_breaker("ip-api"), rate_per_minute=1000)
+        try:
+            # Responses are successful but slow: the slow-call rate trips the breaker
+            for i in range(4):
+                assert await resolver.resolve(f"10.0.0.{i}") == "Zurich, Switzerland"
+            assert resolver.breaker.state == "open"
+            started = time.perf_counter()
+            assert await resolver.resolve("10.0.1.1") == "Unknown"
+            assert time.perf_counter() - started < 0.05
+            assert handler.calls == 4
+            # Short-circuited answers are not cached
+            handler.mode = "ok"
+            await asyncio.sleep(0.35)
+            assert await resolver.resolve("10.0.1.1") == "Zurich, Switzerland"
+            assert resolver.stats()["breaker"]["state"] == "closed"
+        finally:
+            await resolver.close()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        server.shutdown()
+
+
+def test_bulkheads_isolate_integrations():
+    brevo, brevo_handler, brevo_url = start_stub("slow", delay=1.0)
+    ip_api, _, ip_api_url = start_stub("ok")
+
+    async def scenario():
+        # Hanging Brevo: at most 2 calls in flight, 8 waiting, the rest rejected at once
+        dispatcher = EmailDispatcher("key", api_url=brevo_url, max_retries=0, max_concurrency=2, timeout=0.5,
+                                     breaker=CircuitBreaker("brevo", min_calls=100))
+        resolver = GeoResolver(base_url=ip_api_url, rate_per_minute=1000)
+        await dispatcher.open()
+        try:
+            sends = [asyncio.ensure_future(dispatcher.send({"subject": "x"}, f"mail {i}")) for i in range(20)]
+            await asyncio.sleep(0.05)
+            assert dispatcher.bulkhead.active == 2
+
+            # ip-api has its own pool and keeps answering quickly
+            started = time.perf_counter()
+            results = await asyncio.gather(*[resolver.resolve(f"10.1.0.{i}") for i in range(10)])
+            assert set(results) == {"Zurich, Switzerland"}
+            assert time.perf_counter() - started < 0.5
+
+            assert not any(await asyncio.gather(*sends))
+            assert dispatcher.bulkhead.rejected_queue_full == 10
+            assert brevo_handler.calls <= 10
+        finally:
+            await dispatcher.close()
+            await resolver.close()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        brevo.shutdown()
+        ip_api.shutdown()
+
+
+if __name__ == "__main__":
+    test_brevo_errors_open_then_recover()
+    test_brevo_dropped_connections_open()
+    test_slow_ip_api_opens_on_latency()
+    test_bulkheads_isolate_integrations()
+    print("SUCCESS: circuit breaker fault-injection checks passed")
@@ -0,0 +1,93 @@
+"""
+EmailDispatcher checks against a local fake of the Brevo send endpoint.
+"""
+import asyncio
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from email_dispatcher import EmailDispatcher  # noqa: E402
+
+
+class FakeBrevo(BaseHTTPRequestHandler):
+    fail_first = 0
+    received = []
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.lock:
+            attempt = len(self.received)
+            self.received.append((self.headers.get("api-key"), body))
+        status = 503 if attempt < self.fail_first else 201
+        payload = b'{"messageId": "fake"}'
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_fake(fail_first=0):
+    handler = type("Handler", (FakeBrevo,), {"fail_first": fail_first, "received": [], "lock": threading.Lock()})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, handler, f"http://127.0.0.1:{server.server_port}/v3/smtp/email"
+
+
+def payload(i):
+    return {"sender": {"email": "no-reply@example.com"}, "to": [{"email": f"user{i}@example.com"}], "subject": f"Hello {i}", "htmlContent": "<p>hi</p>"}
+
+
+def test_queue_drains_with_retries():
+    server, handler, url = start_fake(fail_first=2)
+
+    async def scenario():
+        dispatcher = EmailDispatcher("test-key", api_url=url, workers=3, backoff_base=0.01)
+        await dispatcher.start()
+        for i in range(20):
+            assert dispatcher.enqueue(payload(i), f"email {i}")
+        await dispatcher.stop()
+        return dispatcher.stats()
+
+    try:
+        stats = asyncio.run(scenario())
+    finally:
+        server.shutdown()
+
+    assert stats["sent"] == 20, stats
+    assert stats["failed"] == 0 and stats["retries"] == 2, stats
+    assert all(key == "test-key" for key, _ in handler.received)
+    print(stats)
+
+
+def test_gives_up_and_drops_when_full():
+    server, handler, url = start_fake(fail_first=10**6)
+
+    async def scenario():
+        dispatcher = EmailDispatcher("test-key", api_url=url, workers=1, queue_size=2, max_retries=1, backoff_base=0.01)
+        await dispatcher.start()
+        results = [dispatcher.enqueue(payload(i), f"email {i}") for i in range(5)]
+        await dispatcher.stop()
+        return results, dispatcher.stats()
+
+    try:
+        results, stats = asyncio.run(scenario())
+    finally:
+        server.shutdown()
+
+    assert results == [True, True, False, False, False], results
+    assert stats["dropped"] == 3 and stats["failed"] == 2 and stats["sent"] == 0, stats
+
+
+if __name__ == "__main__":
+    test_queue_drains_with_retries()
+    test_gives_up_and_drops_when_full()
+    print("SUCCESS: email dispatcher checks passed")
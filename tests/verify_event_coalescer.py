@@ -0,0 +1,144 @@
+"""
+Anonymous event coalescing: repeats of one (ip, event_type) become a single
+counted record, i.e. one geolocation lookup, one admin notification and one
+counter increment per window.
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "bench")
+
+from event_coalescer import EventCoalescer, counter_increments  # noqa: E402
+import server  # noqa: E402
+
+
+def test_repeats_become_one_record():
+    handled = []
+
+    async def handle(record):
+        handled.append(record)
+
+    async def scenario():
+        coalescer = EventCoalescer(handle, window_seconds=60)
+        for _ in range(10):
+            await coalescer.add("1.2.3.4", "demo_view", detail="fr")
+        await coalescer.add("1.2.3.4", "demo_view", detail="en")
+        await coalescer.add("1.2.3.4", "create_account_link")
+        await coalescer.add("5.6.7.8", "demo_view", detail="fr")
+        assert handled == []
+        await coalescer.flush()
+        return coalescer.stats()
+
+    stats = asyncio.run(scenario())
+    records = {(r["ip"], r["event_type"]): r for r in handled}
+    assert len(handled) == 3
+    assert records[("1.2.3.4", "demo_view")]["count"] == 11
+    assert records[("1.2.3.4", "demo_view")]["details"] == {"fr": 10, "en": 1}
+    assert records[("5.6.7.8", "demo_view")]["count"] == 1
+    assert stats["received"] == 13 and stats["coalesced"] == 10 and stats["records_flushed"] == 3
+
+    doc_id, increments = counter_increments(records[("1.2.3.4", "demo_view")])
+    assert doc_id.endswith(":demo_view")
+    assert increments == {"count": 11, "visitors": 1, "details.fr": 10, "details.en": 1}
+
+
+def test_window_max_keys_and_shutdown_flush():
+    handled = []
+
+    async def handle(record):
+        if record["ip"] == "bad":
+            raise RuntimeError("lookup failed")
+        handled.append(record["ip"])
+
+    async def scenario():
+        coalescer = EventCoalescer(handle, window_seconds=0.05, max_keys=3)
+        coalescer.start()
+        await coalescer.add("a", "demo_view")
+        await coalescer.add("a", "demo_view")
+        # Between the first window flush (0.05s) and the next one (0.1s)
+        await asyncio.sleep(0.07)
+        # The window flushed "a" once; a new window starts a new record
+        assert handled == ["a"]
+        await coalescer.add("bad", "demo_view")
+        await coalescer.add("b", "demo_view")
+        assert await coalescer.add("c", "demo_view")
+        # max_keys reached: flushed in the background at once, a failing record doesn't stop the others
+        assert len(coalescer._flushes) == 1
+        await asyncio.gather(*coalescer._flushes)
+        assert sorted(handled) == ["a", "b", "c"]
+        await coalescer.add("d", "demo_view")
+        await coalescer.stop()
+        return coalescer.stats()
+
+    stats = asyncio.run(scenario())
+    assert handled[-1] == "d"
+    assert stats["handle_errors"] == 1 and stats["pending"] == 0
+
+
+def test_flush_limits_concurrent_handles():
+    running, peak = 0, 0
+
+    async def handle(record):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    async def scenario():
+        coalescer = EventCoalescer(handle, window_seconds=60, max_keys=50, max_concurrency=4)
+        for i in range(50):
+            await coalescer.add(f"10.0.0.{i}", "demo_view")
+        await coalescer.drain()
+        return coalescer.stats()
+
+    stats = asyncio.run(scenario())
+    assert peak == 4 and stats["records_flushed"] == 50
+
+
+def test_track_demo_clicks_share_one_lookup_and_notification():
+    lookups, notifications, counters = [], [], []
+
+    async def resolve(ip):
+        lookups.append(ip)
+        return "Geneva, Switzerland"
+
+    async def notify(event_type, subject, html_content, ip=None, location=None):
+        notifications.append(subject)
+
+    async def add(item):
+        counters.append(item)
+        return True
+
+    originals = (server.geo_resolver.resolve, server.notify_admin, server.anonymous_event_counters.add)
+    server.geo_resolver.resolve, server.notify_admin, server.anonymous_event_counters.add = resolve, notify, add
+    try:
+        async def scenario():
+            request = SimpleNamespace(client=SimpleNamespace(host="9.9.9.9"))
+            for _ in range(5):
+                await server.track_demo(server.DemoTrackRequest(language="FR"), request)
+            await server.track_event(server.TrackEventRequest(event_type="create_account_link"), request)
+            await server.anonymous_events.flush()
+
+        asyncio.run(scenario())
+    finally:
+        server.geo_resolver.resolve, server.notify_admin, server.anonymous_event_counters.add = originals
+
+    assert lookups == ["9.9.9.9", "9.9.9.9"]
+    assert sorted(notifications) == ["Create account link used by 9.9.9.9", "Demo view by 9.9.9.9 (5 times)"]
+    increments = {doc_id.split(":", 1)[1]: inc for doc_id, inc in counters}
+    assert increments["demo_view"] == {"count": 5, "visitors": 1, "details.fr": 5}
+    assert increments["create_account_link"] == {"count": 1, "visitors": 1}
+
+
+if __name__ == "__main__":
+    test_repeats_become_one_record()
+    test_window_max_keys_and_shutdown_flush()
+    test_flush_limits_concurrent_handles()
+    test_track_demo_clicks_share_one_lookup_and_notification()
+    print("SUCCESS: anonymous event coalescing checks passed")
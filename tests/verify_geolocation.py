@@ -0,0 +1,114 @@
+"""
+GeoResolver checks against a local stub of the ip-api.com JSON endpoint.
+"""
+import asyncio
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from geolocation import GeoResolver, TokenBucket  # noqa: E402
+
+
+class StubIpApi(BaseHTTPRequestHandler):
+    calls = 0
+    delay = 0.0
+
+    def do_GET(self):
+        type(self).calls += 1
+        time.sleep(self.delay)
+        ip = self.path.split("/json/")[1].split("?")[0]
+        body = json.dumps({"status": "success", "city": f"City-{ip}", "country": "Switzerland"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub(delay=0.0):
+    handler = type("Handler", (StubIpApi,), {"calls": 0, "delay": delay})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, handler, f"http://127.0.0.1:{server.server_port}"
+
+
+def test_cache_and_coalescing():
+    server, handler, url = start_stub(delay=0.2)
+
+    async def scenario():
+        resolver = GeoResolver(base_url=url)
+        try:
+            # 20 concurrent lookups of the same IP -> one outbound call
+            results = await asyncio.gather(*[resolver.resolve("8.8.8.8") for _ in range(20)])
+            assert set(results) == {"City-8.8.8.8, Switzerland"}, results
+            assert handler.calls == 1, handler.calls
+            # Subsequent lookup is served from cache
+            assert await resolver.resolve("8.8.8.8") == "City-8.8.8.8, Switzerland"
+            assert handler.calls == 1
+            assert resolver.stats()["coalesced"] == 19
+            assert await resolver.resolve("127.0.0.1") == "Localhost"
+        finally:
+            await resolver.close()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        server.shutdown()
+
+
+def test_prefix_key_and_rate_limit():
+    server, handler, url = start_stub()
+
+    async def scenario():
+        resolver = GeoResolver(base_url=url, key_by_prefix=True, rate_per_minute=2, max_rate_wait=0)
+        try:
+            await resolver.resolve("10.1.2.3")
+            await resolver.resolve("10.1.2.200")  # same /24 -> cache hit
+            assert handler.calls == 1
+            await resolver.resolve("10.9.9.9")
+            # Bucket is empty: third distinct prefix is refused without a network call
+            assert await resolver.resolve("10.8.8.8") == "Unknown"
+            assert handler.calls == 2
+            assert resolver.stats()["rate_limited"] == 1
+        finally:
+            await resolver.close()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        server.shutdown()
+
+
+def test_token_bucket_wait_is_bounded_for_every_caller():
+    async def scenario():
+        # 1 token, then one every 0.1 s: callers reserve successive slots
+        bucket = TokenBucket(1, 0.1)
+        started = time.monotonic()
+
+        async def take():
+            granted = await bucket.acquire(max_wait=0.35)
+            return granted, time.monotonic() - started
+
+        return await asyncio.gather(*[take() for _ in range(8)])
+
+    results = asyncio.run(scenario())
+    granted = [elapsed for ok, elapsed in results if ok]
+    # Slots at 0, 0.1, 0.2, 0.3 s; the rest would wait past max_wait and are refused at once
+    assert len(granted) == 4, results
+    assert max(granted) < 0.35 + 0.05, results
+    assert all(elapsed < 0.05 for ok, elapsed in results if not ok), results
+
+
+if __name__ == "__main__":
+    test_cache_and_coalescing()
+    test_prefix_key_and_rate_limit()
+    test_token_bucket_wait_is_bounded_for_every_caller()
+    print("SUCCESS: geolocation resolver checks passed")
@@ -0,0 +1,158 @@
+"""
+HyperLogLog active-user counts against exact distinct counts on synthetic
+activity, sketch merging and persistence. Run directly to also print the
+accuracy and memory numbers:
+
+    python tests/verify_hyperloglog.py
+"""
+import asyncio
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from pymongo.errors import DuplicateKeyError  # noqa: E402
+
+from active_users import ActiveUserCounter, HyperLogLog  # noqa: E402
+
+USERS = 20000
+DAYS = 60
+START = date(2026, 1, 1)
+
+
+def synthetic_activity():
+    """{day: set of active user ids}: a few heavy users, many occasional ones, growth over time"""
+    rng = random.Random(42)
+    activity = {}
+    for n in range(DAYS):
+        day = (START + timedelta(days=n)).isoformat()
+        population = int(USERS * (0.5 + 0.5 * n / DAYS))
+        activity[day] = {
+            f"user-{i}" for i in range(population)
+            if rng.random() < (0.6 if i % 50 == 0 else 0.08)
+        }
+    return activity
+
+
+def sketches_of(activity):
+    sketches = {}
+    for day, users in activity.items():
+        sketch = sketches[day] = HyperLogLog()
+        for user_id in users:
+            sketch.add(user_id)
+    return sketches
+
+
+def windows():
+    days = [(START + timedelta(days=n)).isoformat() for n in range(DAYS)]
+    for i in range(29, DAYS):
+        yield "dau", days[i:i + 1]
+        yield "wau", days[i - 6:i + 1]
+        yield "mau", days[i - 29:i + 1]
+
+
+def accuracy():
+    activity = synthetic_activity()
+    sketches = sketches_of(activity)
+    errors = {"dau": [], "wau": [], "mau": []}
+    merge_seconds = []
+    for kind, days in windows():
+        exact = len(set().union(*(activity[d] for d in days)))
+        started = time.perf_counter()
+        estimate = HyperLogLog.union(sketches[d] for d in days).count()
+        merge_seconds.append(time.perf_counter() - started)
+        errors[kind].append(abs(estimate - exact) / exact)
+    return activity, sketches, errors, merge_seconds
+
+
+def test_estimates_are_within_error_bounds():
+    _, sketches, errors, _ = accuracy()
+    standard_error = 1.04 / (1 << 14) ** 0.5
+    for kind, errs in errors.items():
+        # Every window within 4 standard errors, the average within 1.5
+        assert max(errs) < 4 * standard_error, (kind, max(errs))
+        assert sum(errs) / len(errs) < 1.5 * standard_error, (kind, sum(errs) / len(errs))
+    assert all(len(s.to_bytes()) == 1 << 14 for s in sketches.values())
+
+
+def test_merge_is_union_and_bytes_round_trip():
+    a, b, both = HyperLogLog(12), HyperLogLog(12), HyperLogLog(12)
+    for i in range(5000):
+        (a if i % 2 else b).add(f"u{i}")
+        both.add(f"u{i}")
+    assert (HyperLogLog.union([a, b]).registers == both.registers).all()
+    restored = HyperLogLog.from_bytes(12, a.to_bytes())
+    assert restored.count() == a.count()
+    assert HyperLogLog(12).count() == 0
+
+
+class MemoryCollection:
+    """find_one / insert_one / replace_one / find($in) over a dict"""
+
+    def __init__(self):
+        self.docs = {}
+
+    async def find_one(self, query):
+        doc = self.docs.get(query["_id"])
+        return dict(doc) if doc else None
+
+    async def insert_one(self, doc):
+        if doc["_id"] in self.docs:
+            raise DuplicateKeyError("duplicate")
+        self.docs[doc["_id"]] = dict(doc)
+
+    async def replace_one(self, query, doc):
+        current = self.docs.get(query["_id"])
+        if current is None or current.get("version") != query["version"]:
+            return type("Result", (), {"matched_count": 0})()
+        self.docs[query["_id"]] = {"_id": query["_id"], **doc}
+        return type("Result", (), {"matched_count": 1})()
+
+    def find(self, query):
+        docs = [dict(self.docs[i]) for i in query["_id"]["$in"] if i in self.docs]
+
+        async def cursor():
+            for doc in docs:
+                yield doc
+        return cursor()
+
+
+def test_two_workers_flush_into_one_daily_sketch():
+    collection = MemoryCollection()
+    today = datetime.now(timezone.utc)
+
+    async def scenario():
+        first, second = ActiveUserCounter(lambda: collection), ActiveUserCounter(lambda: collection)
+        for i in range(3000):
+            first.add(f"u{i}", today)
+        for i in range(2000, 5000):
+            second.add(f"u{i}", today)
+        second.add("late", today - timedelta(days=1))
+        await first.flush()
+        await second.flush()
+        day = today.strftime("%Y-%m-%d")
+        return collection.docs[day], await first.report(day, day)
+
+    doc, report = asyncio.run(scenario())
+    assert doc["version"] == 2
+    assert abs(report["unique_users"] - 5000) < 5000 * 0.04
+    assert report["days"][-1]["mau"] >= report["days"][-1]["dau"]
+
+
+if __name__ == "__main__":
+    test_estimates_are_within_error_bounds()
+    test_merge_is_union_and_bytes_round_trip()
+    test_two_workers_flush_into_one_daily_sketch()
+    activity, sketches, errors, merge_seconds = accuracy()
+    users_per_day = sum(len(u) for u in activity.values()) / DAYS
+    set_bytes = sum(sys.getsizeof(u) + sum(sys.getsizeof(x) for x in u) for u in activity.values()) / DAYS
+    print(f"{DAYS} days, {users_per_day:.0f} active users/day on average")
+    for kind, errs in errors.items():
+        print(f"{kind}: mean error {sum(errs) / len(errs):.2%}, max {max(errs):.2%} over {len(errs)} windows")
+    print(f"memory per day: sketch {len(next(iter(sketches.values())).to_bytes())} bytes, "
+          f"exact set of ids ~{set_bytes / 1024:.0f} KiB")
+    print(f"window merge + count: median {sorted(merge_seconds)[len(merge_seconds) // 2] * 1e6:.0f} us")
+    print("SUCCESS: HyperLogLog active-user checks passed")
@@ -0,0 +1,108 @@
+"""
+Login wall-clock against a latency-injecting Mongo stand-in.
+
+Every collection call sleeps MONGO_LATENCY_MS, so the login time is roughly
+(awaited round trips x latency) + bcrypt. The previous write path awaited
+find_one + update_one + insert_one; the current one awaits find_one +
+find_one_and_update and hands the login_events insert to a background task
+(which queues it on the write-behind buffer).
+"""
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "bench")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+from fastapi import BackgroundTasks  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+import server  # noqa: E402
+from password_hashing import hash_password  # noqa: E402
+
+LATENCY = float(os.environ.get("MONGO_LATENCY_MS", "50")) / 1000
+
+
+class LatencyCollection:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+
+    async def _call(self, op, result=None):
+        self.db.calls.append(f"{self.name}.{op}")
+        await asyncio.sleep(LATENCY)
+        return result
+
+    async def find_one(self, query, projection=None):
+        return await self._call("find_one", dict(self.db.user))
+
+    async def find_one_and_update(self, query, update, projection=None, return_document=None):
+        return await self._call("find_one_and_update", {"user_id": "u1", "role": "user", "login_count": 3})
+
+    async def update_one(self, *args, **kwargs):
+        return await self._call("update_one")
+
+    async def insert_one(self, *args, **kwargs):
+        return await self._call("insert_one")
+
+
+class LatencyDB:
+    def __init__(self, user):
+        self.user = user
+        self.calls = []
+
+    def __getattr__(self, name):
+        return LatencyCollection(self, name)
+
+
+def test_login_round_trips():
+    password = "TestPassword123!"
+    fake_db = LatencyDB({"password": hash_password(password, 4), "is_verified": True})
+    server.db = fake_db
+    os.environ["BCRYPT_ROUNDS"] = "4"
+
+    async def scenario():
+        await server.password_hasher.calibrate()
+        request = Request({"type": "http", "client": ("203.0.113.7", 5000), "headers": [(b"user-agent", b"bench")]})
+        login = server.UserLogin(email="bench@example.com", password=password)
+
+        # Warm the process pool so we time steady state
+        await server.login(login, request, BackgroundTasks())
+        fake_db.calls.clear()
+
+        # Previous write path, replayed against the same stand-in for comparison
+        started = time.perf_counter()
+        user_doc = await fake_db.access.find_one({"email": login.email})
+        await server.verify_password(password, user_doc["password"])
+        await fake_db.access.update_one({"email": login.email}, {})
+        await fake_db.login_events.insert_one({})
+        previous = time.perf_counter() - started
+        fake_db.calls.clear()
+
+        background = BackgroundTasks()
+        started = time.perf_counter()
+        response = await server.login(login, request, background)
+        elapsed = time.perf_counter() - started
+        return response, background, elapsed, previous
+
+    try:
+        response, background, elapsed, previous = asyncio.run(scenario())
+    finally:
+        server.password_hasher.shutdown()
+
+    assert response.token
+    assert fake_db.calls == ["access.find_one", "access.find_one_and_update"], fake_db.calls
+    deferred = [task.func for task in background.tasks]
+    assert server.login_events_buffer.add in deferred, deferred
+
+    print(f"latency/round trip: {LATENCY * 1000:.0f} ms")
+    print(f"previous path:      {previous * 1000:.0f} ms (3 awaited round trips)")
+    print(f"login wall-clock:   {elapsed * 1000:.0f} ms (2 awaited round trips)")
+    assert elapsed < previous
+
+
+if __name__ == "__main__":
+    test_login_round_trips()
@@ -0,0 +1,100 @@
+"""
+Batched page tracking: one aggregated user update per request, visit
+documents handed to the write-behind buffer, batch cap and client
+timestamp validation.
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "bench")
+
+from fastapi import HTTPException  # noqa: E402
+import server  # noqa: E402
+
+
+class RecordingAccess:
+    def __init__(self):
+        self.updates = []
+
+    async def find_one_and_update(self, query, update, projection=None):
+        self.updates.append(update)
+        return {"user_id": "u1"}
+
+
+class RecordingDB:
+    def __init__(self):
+        self.access = RecordingAccess()
+
+
+def iso(dt):
+    return dt.isoformat().replace("+00:00", "Z")
+
+
+def test_batch_is_one_aggregated_update():
+    fake_db = RecordingDB()
+    server.db = fake_db
+    buffered = []
+
+    async def add(doc):
+        buffered.append(doc)
+        return True
+
+    original_add, server.page_visits_buffer.add = server.page_visits_buffer.add, add
+    try:
+        check_batch(fake_db, buffered)
+    finally:
+        server.page_visits_buffer.add = original_add
+
+
+def check_batch(fake_db, buffered):
+    now = datetime.now(timezone.utc)
+    visits = [
+        server.PageVisitRequest(page_path="/income", session_id="s", client_timestamp=iso(now - timedelta(seconds=30))),
+        server.PageVisitRequest(page_path="/result", session_id="s", client_timestamp=iso(now - timedelta(seconds=50))),
+        server.PageVisitRequest(page_path="/costs", session_id="s", client_timestamp=iso(now - timedelta(seconds=10))),
+        # Client clock a day ahead: recorded at the receive time instead
+        server.PageVisitRequest(page_path="/unknown", session_id="s", client_timestamp=iso(now + timedelta(days=1))),
+    ]
+
+    response = asyncio.run(server.track_page_visits(server.PageVisitBatchRequest(visits=visits), email="a@example.com"))
+    assert response == {"success": True, "tracked": 4}
+
+    (update,) = fake_db.access.updates
+    assert update["$inc"] == {"total_pages_viewed": 4}
+    assert update["$max"] == {"deepest_page_depth": 10}  # /result
+    # Visits are ordered by validated timestamp; the skewed one counts as received now
+    assert update["$set"]["last_page_visited"] == "/unknown"
+    assert [d["page_path"] for d in buffered] == ["/result", "/income", "/costs", "/unknown"]
+    assert datetime.fromisoformat(buffered[-1]["timestamp"]) <= datetime.now(timezone.utc)
+
+    # The single-event endpoint is a wrapper over the same path
+    asyncio.run(server.track_page_visit(server.PageVisitRequest(page_path="/costs"), email="a@example.com"))
+    assert fake_db.access.updates[-1]["$inc"] == {"total_pages_viewed": 1}
+    assert fake_db.access.updates[-1]["$max"] == {"deepest_page_depth": 5}
+
+
+def test_batch_validation():
+    server.db = RecordingDB()
+
+    def rejected(visits):
+        try:
+            asyncio.run(server.track_page_visits(server.PageVisitBatchRequest(visits=visits), email="a@example.com"))
+        except HTTPException as e:
+            return e.status_code
+        return None
+
+    assert rejected([]) == 400
+    assert rejected([server.PageVisitRequest(page_path="/")] * (server.TRACK_BATCH_MAX + 1)) == 400
+    assert rejected([server.PageVisitRequest(page_path="/", client_timestamp="yesterday")]) == 400
+    assert server.db.access.updates == []
+
+
+if __name__ == "__main__":
+    test_batch_is_one_aggregated_update()
+    test_batch_validation()
+    print("SUCCESS: batched page tracking checks passed")
@@ -0,0 +1,110 @@
+"""
+WriteBehindBuffer checks against an in-memory collection stand-in.
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from pymongo.errors import BulkWriteError  # noqa: E402
+
+from write_behind import WriteBehindBuffer  # noqa: E402
+
+
+class MemoryCollection:
+    def __init__(self, delay=0.0, reject=None):
+        self.docs = []
+        self.batches = []
+        self.delay = delay
+        self.reject = reject
+
+    async def insert_many(self, docs, ordered=True):
+        assert ordered is False
+        await asyncio.sleep(self.delay)
+        self.batches.append(len(docs))
+        good = [d for d in docs if not (self.reject and self.reject(d))]
+        self.docs.extend(good)
+        if len(good) < len(docs):
+            raise BulkWriteError({"nInserted": len(good), "writeErrors": [{}] * (len(docs) - len(good))})
+
+
+def test_size_and_age_thresholds():
+    collection = MemoryCollection()
+
+    async def scenario():
+        buffer = WriteBehindBuffer("events", lambda: collection, max_batch=10, max_age=0.1)
+        buffer.start()
+        for i in range(20):
+            await buffer.add({"n": i})
+        await asyncio.sleep(0.02)
+        # Full batches go out at once...
+        assert collection.batches == [10, 10], collection.batches
+        for i in range(20, 25):
+            await buffer.add({"n": i})
+        await asyncio.sleep(0.02)
+        assert collection.batches == [10, 10]
+        # ...a partial one when its oldest document reaches max_age
+        await asyncio.sleep(0.15)
+        assert collection.batches == [10, 10, 5], collection.batches
+        await buffer.stop()
+        return buffer.stats()
+
+    stats = asyncio.run(scenario())
+    assert [d["n"] for d in collection.docs] == list(range(25))
+    assert stats["written"] == 25 and stats["batches"] == 3 and stats["max_batch_size"] == 10
+
+
+def test_overflow_drop_and_shutdown_flush():
+    collection = MemoryCollection()
+
+    async def scenario():
+        # Never started: nothing is flushed until stop()
+        buffer = WriteBehindBuffer("events", lambda: collection, max_batch=5, max_age=60, max_buffer=20)
+        results = [await buffer.add({"n": i}) for i in range(30)]
+        assert results.count(False) == 10
+        assert collection.docs == []
+        await buffer.stop()
+        return buffer.stats()
+
+    stats = asyncio.run(scenario())
+    assert len(collection.docs) == 20
+    assert stats["dropped"] == 10 and stats["written"] == 20 and stats["buffered"] == 0
+
+
+def test_overflow_block_applies_backpressure():
+    collection = MemoryCollection(delay=0.01)
+
+    async def scenario():
+        buffer = WriteBehindBuffer("events", lambda: collection, max_batch=5, max_age=60, max_buffer=10, overflow="block")
+        buffer.start()
+        await asyncio.gather(*[buffer.add({"n": i}) for i in range(100)])
+        assert len(buffer._buffer) <= 10
+        await buffer.stop()
+        return buffer.stats()
+
+    stats = asyncio.run(scenario())
+    assert len(collection.docs) == 100
+    assert stats["dropped"] == 0 and stats["blocked"] > 0
+
+
+def test_partial_batch_failure_is_counted():
+    collection = MemoryCollection(reject=lambda d: d["n"] % 4 == 0)
+
+    async def scenario():
+        buffer = WriteBehindBuffer("events", lambda: collection, max_batch=8)
+        for i in range(16):
+            await buffer.add({"n": i})
+        await buffer.stop()
+        return buffer.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["written"] == 12 and stats["failed"] == 4
+
+
+if __name__ == "__main__":
+    test_size_and_age_thresholds()
+    test_overflow_drop_and_shutdown_flush()
+    test_overflow_block_applies_backpressure()
+    test_partial_batch_failure_is_counted()
+    print("SUCCESS: write-behind buffer checks passed")